@@ -0,0 +1,163 @@
+##################################################
+##  BENCHMARK: AGOL METADATA LOOKUPS WITH AND   ##
+##     WITHOUT THE SHARED METADATA CACHE        ##
+##################################################
+
+# Runs the AGOL stages of the workflow (ENC layer uploads, field definition
+# updates and the boulder update) against fake AGOL items (fake_agol.py)
+# and counts the metadata round trips they make to the "portal": item
+# fetches (gis.content.get), layer lists and layer property fetches. Scenarios:
+#   no sharing   - each stage looks everything up itself (as before)
+#   shared cache - one in-run AgolMetadataCache for every stage
+#   warm disk    - a later run reading the facts cached on disk by the last one
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_agol_metadata.py
+
+import sys
+import io
+import time
+import tempfile
+import contextlib
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from enc_processor import config
+from enc_processor.processor import upload_features
+from enc_processor.field_updater import update_field_definitions
+from enc_processor.agol_metadata import AgolMetadataCache
+from boulder_relocation_processor import boulder_relocation_updater
+from fake_agol import FakeFeatureLayer, FakeItem
+
+# Seconds per metadata round trip, like a slow day on the portal
+LATENCY = 0.05
+
+class LayerView:
+    """
+    Stands in for a new arcgis FeatureLayer object for a fake layer: like
+    the real one, it fetches the layer's properties (one round trip) the
+    first time they are read and keeps them.
+    """
+    def __init__(self, layer, portal):
+        self._layer = layer
+        self._portal = portal
+        self._properties = None
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._portal.round_trip("property_fetches")
+            self._properties = self._layer.properties
+        return self._properties
+
+    def __getattr__(self, name):
+        return getattr(self._layer, name)
+
+class FakePortal:
+    """
+    Fake portal serving the turbine, substation and boulder items. Every
+    content.get returns a new item whose layer list is built with a round
+    trip, as arcgis does. Round trips wait LATENCY seconds and are counted.
+    """
+    def __init__(self):
+        self.counts = {"item_gets": 0, "layer_lists": 0, "property_fetches": 0}
+        self.layers = {}
+        for item_id, name in (("turbines", "Wind_Turbines"), ("substations", "Offshore_Substations")):
+            fields = [{"name": "FIDN", "type": "esriFieldTypeInteger", "alias": "FIDN"},
+                      {"name": "OBJNAM", "type": "esriFieldTypeString", "alias": "OBJNAM"}]
+            self.layers[item_id] = FakeFeatureLayer(fields=fields, wkid=3857, name=name)
+        boulder_fields = [{"name": name, "type": "esriFieldTypeString"} for name in boulder_relocation_updater.BOULDER_KEY_FIELDS + ["Information"]]
+        self.layers["boulders"] = FakeFeatureLayer(fields=boulder_fields, wkid=4326, name="Boulders")
+        for item_id, layer in self.layers.items():
+            layer.url = f"https://fake/{item_id}/FeatureServer/0"
+        self.content = self
+
+    def round_trip(self, kind):
+        self.counts[kind] += 1
+        time.sleep(LATENCY)
+
+    def get(self, item_id):
+        self.round_trip("item_gets")
+        return PortalItem(self, item_id)
+
+    def open_layer(self, url):
+        """
+        Layer factory for AgolMetadataCache: a FeatureLayer built from a URL
+        makes no request until its properties are read.
+        """
+        return LayerView(next(layer for layer in self.layers.values() if layer.url == url), self)
+
+class PortalItem(FakeItem):
+    def __init__(self, portal, item_id):
+        super().__init__(item_id, None)
+        self.portal = portal
+        self._layers = None
+
+    @property
+    def layers(self):
+        if self._layers is None:
+            self.portal.round_trip("layer_lists")
+            self._layers = [LayerView(self.portal.layers[self.id], self.portal)]
+        return self._layers
+
+    @layers.setter
+    def layers(self, value):
+        pass
+
+def run_agol_stages(gis, make_cache, csv_dir):
+    """
+    Runs the ENC uploads, field definition updates and boulder update,
+    each with the cache make_cache() returns (None: no cache passed).
+    """
+    gdf = gpd.GeoDataFrame({"FIDN": [1, 2], "OBJNAM": ["A", "B"]}, geometry=[Point(-71, 41), Point(-71.1, 41.1)], crs="EPSG:4326")
+    for item_id, name in (("turbines", "Wind_Turbines"), ("substations", "Offshore_Substations")):
+        info = dict(config.extraction_features[name], agol_item_id=item_id, agol_layer_index=0, sync_key="FIDN")
+        upload_features(gis, name, info, [gdf], upload_options={"backoff_seconds": 0}, metadata_cache=make_cache())
+
+    mapper = {}
+    for item_id in ("turbines", "substations"):
+        csv_path = Path(csv_dir) / f"{item_id}.csv"
+        pd.DataFrame({"name": ["FIDN", "OBJNAM"], "alias": ["Feature ID", "Object name"], "description": ["", ""]}).to_csv(csv_path, index=False)
+        mapper[item_id] = csv_path
+    update_field_definitions(gis, mapper, force=True, metadata_cache=make_cache())
+
+    boulders = [{"attributes": {"Boulder_ID": "B1", "Information": "", "Project": "P"}, "geometry": {"x": -71, "y": 41, "spatialReference": {"wkid": 4326}}}]
+    boulder_relocation_updater._upload_boulders(gis, "boulders", boulders, "hash", None, force=True,
+                                                upload_options={"backoff_seconds": 0}, metadata_cache=make_cache())
+
+def measure(label, make_cache, portal, csv_dir):
+    """
+    Runs the AGOL stages against the portal and returns the round trips made.
+    """
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_agol_stages(portal, make_cache, csv_dir)
+    return dict(scenario=label, seconds=time.perf_counter() - start, **portal.counts, round_trips=sum(portal.counts.values()))
+
+def run_benchmark():
+    """
+    Runs the scenarios and prints a summary.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_path = Path(tmp_dir) / "agol_metadata.json"
+        rows = [measure("no sharing", lambda: None, FakePortal(), tmp_dir)]
+
+        portal = FakePortal()
+        shared = AgolMetadataCache(portal, path=cache_path, layer_factory=portal.open_layer)
+        rows.append(measure("shared cache", lambda: shared, portal, tmp_dir))
+
+        # A later run: a new in-run cache, with the facts read back from disk
+        portal = FakePortal()
+        warm = AgolMetadataCache(portal, path=cache_path, layer_factory=portal.open_layer)
+        rows.append(measure("warm disk", lambda: warm, portal, tmp_dir))
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
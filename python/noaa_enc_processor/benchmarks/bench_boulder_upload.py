@@ -0,0 +1,137 @@
+##################################################
+##  BENCHMARK: BOULDER LAYER REPLACE VS KEYED   ##
+##        UPSERT AGAINST A FAKE LAYER           ##
+##################################################
+
+# Runs boulder_relocation_updater.update_boulder_layer against a fake AGOL
+# boulder layer (fake_agol.py) in both upload modes and reports the AGOL
+# requests, bytes sent and time taken in each scenario:
+#   first load   - empty layer, every boulder is added
+#   forced rerun - nothing changed, checked against the layer anyway
+#   new survey   - one project gains boulders, a few are moved and removed
+# Each request to the fake layer waits LATENCY seconds, like a round trip to
+# AGOL. After every scenario the layer is checked against the boulders sent.
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_boulder_upload.py
+
+import sys
+import io
+import json
+import time
+import random
+import zipfile
+import contextlib
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from boulder_relocation_processor import boulder_config, boulder_relocation_updater
+from fake_agol import FakeFeatureLayer, FakeItem, FakeGIS
+from bench_stages import FakeSession
+
+BOULDERS_PER_PROJECT = 2000
+LATENCY = 0.02
+
+def build_archives(boulders):
+    """
+    Zips {project URL: {boulder ID: (lon, lat)}} as the GeoJSON.zip each
+    project serves.
+    """
+    archives = {}
+    for url, project_boulders in boulders.items():
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"name": boulder_id, "description": f"Relocated boulder {boulder_id}"},
+                "geometry": {"type": "Point", "coordinates": list(position)}
+            }
+            for boulder_id, position in project_boulders.items()
+        ]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("boulders.geojson", json.dumps({"type": "FeatureCollection", "features": features}))
+        archives[url] = buffer.getvalue()
+    return archives
+
+def survey_boulders(seed=0):
+    """
+    Returns the initial boulders and the boulders after a new survey
+    (500 new boulders in one project, 20 moved and 10 removed elsewhere).
+    """
+    rng = random.Random(seed)
+    initial = {
+        url: {f"B{index:06d}": (rng.uniform(-72, -70), rng.uniform(40, 41.5)) for index in range(BOULDERS_PER_PROJECT)}
+        for url in boulder_config.boulder_projects
+    }
+    surveyed = {url: dict(project_boulders) for url, project_boulders in initial.items()}
+    urls = list(surveyed)
+    for index in range(BOULDERS_PER_PROJECT, BOULDERS_PER_PROJECT + 500):
+        surveyed[urls[0]][f"B{index:06d}"] = (rng.uniform(-72, -70), rng.uniform(40, 41.5))
+    for boulder_id in list(surveyed[urls[1]])[:20]:
+        lon, lat = surveyed[urls[1]][boulder_id]
+        surveyed[urls[1]][boulder_id] = (lon + 0.001, lat)
+    for boulder_id in list(surveyed[urls[2]])[:10]:
+        del surveyed[urls[2]][boulder_id]
+    return initial, surveyed
+
+def layer_matches(layer, boulders):
+    """
+    Checks the fake layer holds exactly the boulders (by key and position).
+    """
+    expected = {
+        (boulder_id, project_name): position
+        for url, project_name in boulder_config.boulder_projects.items()
+        for boulder_id, position in boulders[url].items()
+    }
+    actual = {
+        (row["attributes"]["Boulder_ID"], row["attributes"]["Project"]): (row["geometry"]["x"], row["geometry"]["y"])
+        for row in layer.rows.values()
+    }
+    return actual == expected
+
+def run_scenario(label, mode, gis, layer, boulders):
+    """
+    Runs the updater once and returns what it sent.
+    """
+    before_requests, before_bytes = layer.request_count, layer.payload_bytes
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        boulder_relocation_updater.update_boulder_layer(gis, "boulders", boulder_config.boulder_projects, force=True,
+                                                        session=FakeSession(build_archives(boulders)), upload_mode=mode,
+                                                        upload_options={"backoff_seconds": 0})
+    return {
+        "mode": mode,
+        "scenario": label,
+        "seconds": time.perf_counter() - start,
+        "requests": layer.request_count - before_requests,
+        "kib_sent": (layer.payload_bytes - before_bytes) / 1024,
+        "layer_rows": len(layer.rows),
+        "matches": layer_matches(layer, boulders)
+    }
+
+def run_benchmark():
+    """
+    Runs the scenarios in both modes and prints a summary.
+    """
+    initial, surveyed = survey_boulders()
+    fields = [
+        {"name": "Boulder_ID", "type": "esriFieldTypeString"},
+        {"name": "Information", "type": "esriFieldTypeString"},
+        {"name": "Project", "type": "esriFieldTypeString"}
+    ]
+    rows = []
+    for mode in ("replace", "upsert"):
+        layer = FakeFeatureLayer(fields=fields, wkid=4326, name="Boulders", latency=LATENCY)
+        gis = FakeGIS({"boulders": FakeItem("boulders", [layer], title="Boulder Relocations")})
+        rows.append(run_scenario("first load", mode, gis, layer, initial))
+        rows.append(run_scenario("forced rerun", mode, gis, layer, initial))
+        rows.append(run_scenario("new survey", mode, gis, layer, surveyed))
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
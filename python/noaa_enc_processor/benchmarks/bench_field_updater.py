@@ -0,0 +1,118 @@
+##################################################
+##  BENCHMARK: DIFF-AWARE FIELD DEFINITION      ##
+##        UPDATES AGAINST A FAKE GIS            ##
+##################################################
+
+# Runs field_updater.update_field_definitions against fake AGOL items
+# (fake_agol.py) built from the configured field definition CSVs, and
+# reports the AGOL calls made in each scenario:
+#   first run      - every alias/description differs from the layer
+#   repeat run     - nothing changed, definitions hash the same as last run
+#   forced run     - nothing changed, checked against the layers anyway
+#   one CSV change - a single description edited in one CSV
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_field_updater.py
+
+import sys
+import io
+import time
+import tempfile
+import contextlib
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from enc_processor import config
+from enc_processor.field_updater import update_field_definitions
+from fake_agol import FakeFeatureLayer, FakeItem, FakeGIS
+
+class CountingLayerManager:
+    """
+    Wraps a fake layer manager to count update_definition (admin) calls
+    and the fields they carry.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.admin_calls = 0
+        self.fields_sent = 0
+
+    def update_definition(self, update_dict):
+        self.admin_calls += 1
+        self.fields_sent += len(update_dict.get("fields", []))
+        return self.manager.update_definition(update_dict)
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+def build_fake_gis(csv_paths, items_per_csv=1):
+    """
+    Builds a fake GIS with items_per_csv items per field definition CSV,
+    each with one layer holding the CSV's fields (default aliases, no descriptions).
+    """
+    items, mapper, managers = {}, {}, []
+    for csv_index, csv_path in enumerate(csv_paths):
+        field_names = [name for name in pd.read_csv(csv_path)["name"] if name != "OBJECTID"]
+        fields = [{"name": name, "type": "esriFieldTypeString", "alias": name} for name in field_names]
+        for copy_index in range(items_per_csv):
+            item_id = f"item{csv_index}_{copy_index}"
+            layer = FakeFeatureLayer(fields=fields, name=f"Layer {item_id}")
+            layer.manager = CountingLayerManager(layer.manager)
+            managers.append(layer.manager)
+            items[item_id] = FakeItem(item_id, [layer])
+            mapper[item_id] = csv_path
+    return FakeGIS(items), mapper, managers
+
+def run_scenario(label, gis, mapper, managers, state_path, force=False):
+    """
+    Runs the updater once and returns the calls it made.
+    """
+    before_gets = gis.content.get_count
+    before_calls = sum(manager.admin_calls for manager in managers)
+    before_fields = sum(manager.fields_sent for manager in managers)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        statuses = update_field_definitions(gis, mapper, state_path=state_path, force=force)
+    return {
+        "scenario": label,
+        "layers": len(statuses),
+        "seconds": time.perf_counter() - start,
+        "item_gets": gis.content.get_count - before_gets,
+        "admin_calls": sum(manager.admin_calls for manager in managers) - before_calls,
+        "fields_sent": sum(manager.fields_sent for manager in managers) - before_fields,
+        "statuses": ", ".join(f"{status}={list(statuses.values()).count(status)}" for status in sorted(set(statuses.values())))
+    }
+
+def run_benchmark(items_per_csv=5):
+    """
+    Runs the scenarios and prints a summary.
+    """
+    csv_paths = [path for path in (config.turbine_csv_path, config.substation_csv_path) if Path(path).exists()]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        tmp_dir = Path(tmp_dir)
+        # Copy the CSVs so one can be edited
+        local_csvs = []
+        for csv_path in csv_paths:
+            local_csv = tmp_dir / Path(csv_path).name
+            local_csv.write_bytes(Path(csv_path).read_bytes())
+            local_csvs.append(local_csv)
+        gis, mapper, managers = build_fake_gis(local_csvs, items_per_csv)
+        state_path = tmp_dir / "field_definitions.json"
+
+        rows = [
+            run_scenario("first run", gis, mapper, managers, state_path),
+            run_scenario("repeat run", gis, mapper, managers, state_path),
+            run_scenario("forced run", gis, mapper, managers, state_path, force=True)
+        ]
+        edited = pd.read_csv(local_csvs[0])
+        edited.loc[edited.index[1], "description"] = "Edited description"
+        edited.to_csv(local_csvs[0], index=False)
+        rows.append(run_scenario("one CSV change", gis, mapper, managers, state_path))
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,115 @@
+##################################################
+##  BENCHMARK: R-STYLE FILE-BY-FILE LIGHT LIST  ##
+##     READS VS PARALLEL FILTERED INGESTION     ##
+##################################################
+
+# Compares the light list processing in R/scrape_uscg_msi.R, done in Python
+# the same way (each GeoJSON read in full, one at a time, then filtered
+# and formatted row by row), with light_list.build_structure_layer (filters
+# pushed down to OGR, files read in parallel, vectorized formatting) on
+# the committed data-raw/lightList*.geojson files. Both results are checked
+# against the committed data/uscg_msi_struct.gdb.
+# Reports wall-clock time and peak Python memory (tracemalloc) per path.
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_light_list.py
+
+import sys
+import re
+import gc
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from enc_processor import config
+from enc_processor import light_list
+
+def r_style_structures(paths):
+    """
+    The R script's steps: read every file in full, keep WTG|PROD names,
+    bind, keep LT/LB, then build OWF and STRUCTURE_ID row by row.
+    """
+    frames = []
+    for path in paths:
+        gdf = gpd.read_file(path)
+        matches = gdf["NAME"].str.contains("WTG|PROD", na=False)
+        if matches.any():
+            frames.append(gdf.loc[matches, light_list.LIGHT_LIST_COLUMNS + ["geometry"]])
+    gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
+    gdf = gdf[gdf["DESCRIPTION_TYPE"].isin(["LT", "LB"])].reset_index(drop=True)
+    gdf["OWF"] = [re.sub("WTG.*|PROD.*", "", name).strip() for name in gdf["NAME"]]
+    gdf["STRUCTURE_ID"] = [re.findall("[a-zA-Z0-9]+", name)[-1] for name in gdf["NAME"]]
+    gdf.loc[gdf["OWF"] == "Vineyard Wind", "OWF"] = "Vineyard Wind 1"
+    gdf["CREATE_DATE"] = gdf["CREATE_DATE"].astype("float64")
+    gdf["MODIFIED_DATE"] = gdf["MODIFIED_DATE"].astype("float64")
+    return gdf[light_list.OUTPUT_COLUMNS + ["geometry"]]
+
+def measure(builder):
+    """
+    Runs a builder twice, once timed and once under tracemalloc.
+    Returns (seconds, peak MiB, result).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = builder()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    builder()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, result
+
+def matches_committed_gdb(gdf, gdb_path):
+    """
+    Checks a result against the committed GDB (attributes and geometry).
+    """
+    committed = gpd.read_file(gdb_path)
+    try:
+        pd.testing.assert_frame_equal(pd.DataFrame(gdf.drop(columns="geometry")).reset_index(drop=True),
+                                      pd.DataFrame(committed.drop(columns="geometry")))
+    except AssertionError:
+        return False
+    return bool(gdf.geometry.reset_index(drop=True).geom_equals_exact(committed.geometry, 1e-9).all())
+
+def run_benchmark(worker_counts=(1, 4)):
+    """
+    Times the R-style path and the new ingestion at each worker count and
+    prints a summary.
+    """
+    light_list_dir = config.base_dir / "data-raw"
+    gdb_path = config.base_dir / "data" / "uscg_msi_struct.gdb"
+    paths = light_list.list_light_list_files(light_list_dir)
+    if not paths:
+        print(f"No light list files found in {light_list_dir}.")
+        return pd.DataFrame()
+    size_mib = sum(path.stat().st_size for path in paths) / 2**20
+    print(f"{len(paths)} light list files, {size_mib:.1f} MiB\n")
+
+    runs = [("r_style", lambda: r_style_structures(paths))]
+    runs += [(f"parallel_x{workers}", lambda workers=workers: light_list.build_structure_layer(paths, max_workers=workers)) for workers in worker_counts]
+
+    rows = []
+    baseline_s = None
+    for label, builder in runs:
+        seconds, peak_mib, gdf = measure(builder)
+        baseline_s = baseline_s or seconds
+        rows.append({
+            "path": label,
+            "structures": len(gdf),
+            "seconds": seconds,
+            "speedup": baseline_s / seconds if seconds else float("nan"),
+            "peak_mib": peak_mib,
+            "matches_gdb": matches_committed_gdb(gdf, gdb_path) if gdb_path.exists() else None
+        })
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,129 @@
+##################################################
+##  BENCHMARK: GEOJSON ROUND TRIP VS DIRECT     ##
+##         ESRI JSON PAYLOAD ENCODING           ##
+##################################################
+
+# Compares the old upload payload path (to_json -> json.loads ->
+# FeatureSet.from_geojson -> spatialReference loop -> as_dict) with
+# esri_encoder.gdf_to_esri_features on layers read from the committed
+# data-raw/ENC charts, repeated scale times to mimic larger runs.
+# Reports wall-clock time and peak Python memory (tracemalloc) per path.
+# Without the arcgis package only the GeoJSON serialize/parse part of the
+# old path is measured, which understates its cost.
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_payload_encoding.py
+
+import sys
+import io
+import gc
+import json
+import time
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from enc_processor import config
+from enc_processor.enc_preprocessor import read_enc_layer
+from enc_processor.esri_encoder import gdf_to_esri_features
+
+try:
+    from arcgis.features import FeatureSet
+except ImportError:
+    FeatureSet = None
+
+# ENC layers to benchmark: points, lines and polygons
+BENCHMARK_LAYERS = ["LNDMRK", "OFSPLF", "CBLSUB", "RESARE"]
+
+def load_layers(data_dir=config.target_folder_path, layers=BENCHMARK_LAYERS, wkid=3857):
+    """
+    Reads each layer from every chart in data_dir and returns
+    {layer_name: GeoDataFrame} reprojected to wkid.
+    """
+    frames = {}
+    for layer_name in layers:
+        gdf_list = []
+        for zip_path in sorted(Path(data_dir).glob("*.zip")):
+            with contextlib.redirect_stdout(io.StringIO()):
+                gdf = read_enc_layer(str(zip_path), layer_name)
+            if not gdf.empty:
+                gdf_list.append(gdf)
+        if gdf_list:
+            full_gdf = gpd.GeoDataFrame(pd.concat(gdf_list, ignore_index=True), crs=gdf_list[0].crs)
+            full_gdf = full_gdf.to_crs(epsg=wkid)
+            frames[layer_name] = full_gdf[full_gdf.geometry.notnull()]
+    return frames
+
+def geojson_round_trip(gdf, wkid):
+    """
+    The previous payload path in processor.py.
+    """
+    geojson_payload = json.loads(gdf.to_json())
+    if FeatureSet is None:
+        return geojson_payload["features"]
+    fset = FeatureSet.from_geojson(geojson_payload)
+    target_sr = {"wkid": int(wkid)}
+    for feat in fset.features:
+        if feat.geometry:
+            feat.geometry["spatialReference"] = target_sr
+    return [feat.as_dict for feat in fset.features]
+
+def measure(encoder, gdf, wkid):
+    """
+    Runs an encoder twice, once timed and once under tracemalloc (which slows
+    allocation down, so it is kept out of the timing).
+    Returns (seconds, peak MiB, feature count).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    features = encoder(gdf, wkid)
+    elapsed = time.perf_counter() - start
+    feature_count = len(features)
+    del features
+
+    gc.collect()
+    tracemalloc.start()
+    encoder(gdf, wkid)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, feature_count
+
+def run_benchmark(scales=(1, 10), wkid=3857):
+    """
+    Times both payload paths for every benchmark layer at each scale
+    (the layer repeated scale times) and prints a summary.
+    """
+    frames = load_layers(wkid=wkid)
+    if not frames:
+        print(f"No ENC features found in {config.target_folder_path}.")
+        return pd.DataFrame()
+    if FeatureSet is None:
+        print("arcgis is not installed: measuring only to_json/json.loads for the old path.\n")
+
+    rows = []
+    for layer_name, gdf in frames.items():
+        for scale in scales:
+            scaled = gpd.GeoDataFrame(pd.concat([gdf] * scale, ignore_index=True), crs=gdf.crs)
+            old_s, old_mib, old_count = measure(geojson_round_trip, scaled, wkid)
+            new_s, new_mib, new_count = measure(gdf_to_esri_features, scaled, wkid)
+            rows.append({
+                "layer": layer_name,
+                "scale": scale,
+                "features": new_count,
+                "geojson_s": old_s,
+                "direct_s": new_s,
+                "speedup": old_s / new_s if new_s else float("nan"),
+                "geojson_peak_mib": old_mib,
+                "direct_peak_mib": new_mib,
+                "counts_match": old_count == new_count
+            })
+
+    results = pd.DataFrame(rows)
+    print(results.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+    return results
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,345 @@
+#############################################
+##   STAGE-LEVEL BENCHMARK SUITE WITH A    ##
+##        STORED PERFORMANCE BASELINE      ##
+#############################################
+
+# Runs each workflow stage on its own against the committed data-raw/ENC
+# charts, at x1 and at synthetic x10/x100 scales (the extracted features
+# repeated, with offset FIDNs so they stay distinct), using the fake AGOL
+# objects in fake_agol.py instead of ArcGIS Online. Each stage's wall-clock
+# time and peak Python memory (tracemalloc) are compared with a stored
+# baseline, and the script exits with status 1 if any stage regressed.
+# With --memory-only, slower stages are only reported: peak memory is the
+# same on any machine, wall-clock time is not (CI runs this way).
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_stages.py
+#   python python/noaa_enc_processor/benchmarks/bench_stages.py --scales 1 10 --save-baseline
+# Timings depend on the machine, so save the baseline on the machine (or
+# runner type) the comparison runs on.
+
+import sys
+import io
+import gc
+import json
+import time
+import random
+import zipfile
+import argparse
+import platform
+import contextlib
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from enc_processor import config
+from enc_processor.enc_preprocessor import enc_vsi_path, read_enc_layers
+from enc_processor.code_mapper import map_column_codes
+from enc_processor.feature_rules import apply_post_processing
+from enc_processor.esri_encoder import gdf_to_esri_features
+from enc_processor.agol_sync import delta_sync_features
+from enc_processor.dtype_compactor import compact_dtypes, concat_frames
+from boulder_relocation_processor import boulder_config, boulder_relocation_updater
+from fake_agol import FakeGIS, FakeItem, FakeFeatureLayer
+
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+# Reading repeats the ENC reads scale times, so it is capped to keep the suite short
+READ_MAX_SCALE = 10
+
+# Synthetic boulders per project at x1 (the Empire Wind CSV is added as it is)
+BOULDERS_PER_PROJECT = 250
+
+TARGET_WKID = 3857
+
+def quiet(function, *args, **kwargs):
+    """
+    Calls a workflow function with its progress output silenced.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args, **kwargs)
+
+def measure(function):
+    """
+    Runs function twice: once timed and once under tracemalloc (which slows
+    allocation down, so it is kept out of the timing).
+    Returns (seconds, peak MiB, result of the timed run).
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, result
+
+def scale_frame(gdf, scale):
+    """
+    Repeats a GeoDataFrame scale times, offsetting FIDN in every copy so
+    the copies are distinct features.
+    """
+    if scale == 1:
+        return gdf.copy()
+    copies = []
+    for copy_number in range(scale):
+        copy = gdf.copy()
+        if "FIDN" in copy.columns:
+            # Widen the (downcast) FIDNs first so the offset fits
+            copy["FIDN"] = copy["FIDN"].astype("int64") + copy_number * 10**10
+        copies.append(copy)
+    return gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=gdf.crs)
+
+def read_charts(feature_config, passes=1):
+    """
+    Reads the configured layers from every committed chart, passes times.
+    Returns {feature name: combined GeoDataFrame} from the last pass.
+    """
+    for _ in range(passes):
+        results = {name: [] for name in feature_config}
+        for zip_path in sorted(Path(config.target_folder_path).glob("*.zip")):
+            enc_path = enc_vsi_path(zip_path)
+            if enc_path is None:
+                continue
+            for name, gdf in read_enc_layers(enc_path, feature_config).items():
+                if not gdf.empty:
+                    gdf["source_file"] = zip_path.name
+                    results[name].append(gdf)
+    return {name: gpd.GeoDataFrame(concat_frames(frames), crs=frames[0].crs) for name, frames in results.items() if frames}
+
+def map_layers(frames):
+    """
+    Compacts and maps coded values in every layer, as prepare_features does.
+    """
+    return {
+        name: map_column_codes(compact_dtypes(gdf.copy()), config.extraction_features[name]["mapping_csv"])
+        for name, gdf in frames.items()
+    }
+
+def post_process_layers(frames):
+    """
+    Runs the configured turbine/substation post-processing rules and
+    compacts the result, as prepare_features does.
+    """
+    return {
+        name: compact_dtypes(apply_post_processing(gdf, config.extraction_features[name].get("post_processing"), name=name))
+        for name, gdf in frames.items()
+    }
+
+def reproject_layers(frames):
+    """
+    Reprojects every layer to the AGOL layers' spatial reference.
+    """
+    return {name: gdf.to_crs(epsg=TARGET_WKID) for name, gdf in frames.items()}
+
+def encode_layers(frames):
+    """
+    Encodes every layer as Esri JSON features.
+    """
+    return {name: gdf_to_esri_features(gdf, TARGET_WKID) for name, gdf in frames.items()}
+
+def sync_layers(payloads):
+    """
+    Delta syncs every layer's features to an empty fake AGOL layer (so all
+    features are sent as adds) and returns the number of features added.
+    """
+    added = 0
+    for features in payloads.values():
+        fields = [{"name": name, "type": "esriFieldTypeString"} for name in features[0]["attributes"]] if features else []
+        layer = FakeFeatureLayer(fields=fields, wkid=TARGET_WKID)
+        summary = delta_sync_features(layer, features, key_fields=["FIDN"], upload_options={"backoff_seconds": 0})
+        added += summary["adds"]
+    return added
+
+def boulder_archives(scale, seed=0):
+    """
+    Builds a synthetic GeoJSON.zip for each configured boulder project,
+    with BOULDERS_PER_PROJECT * scale boulders each.
+    """
+    rng = random.Random(seed)
+    archives = {}
+    for url, project_name in boulder_config.boulder_projects.items():
+        features = [
+            {
+                "type": "Feature",
+                "properties": {"name": f"B{index:06d}", "description": f"Relocated boulder {index}"},
+                "geometry": {"type": "Point", "coordinates": [rng.uniform(-72, -70), rng.uniform(40, 41.5)]}
+            }
+            for index in range(BOULDERS_PER_PROJECT * scale)
+        ]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("boulders.geojson", json.dumps({"type": "FeatureCollection", "features": features}))
+        archives[url] = buffer.getvalue()
+    return archives
+
+class FakeResponse:
+    """
+    Stands in for the streamed requests.Response of a boulder download.
+    """
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size=1024 * 1024):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start:start + chunk_size]
+
+class FakeSession:
+    """
+    Stands in for the pooled requests.Session, serving the synthetic archives.
+    """
+    def __init__(self, archives):
+        self.archives = archives
+
+    def get(self, url, **kwargs):
+        return FakeResponse(self.archives[url])
+
+def run_boulder_ingest(archives):
+    """
+    Runs update_boulder_layer against the synthetic downloads and a fake
+    AGOL boulder layer. Returns the number of boulders in the layer.
+    """
+    fields = [
+        {"name": "Boulder_ID", "type": "esriFieldTypeString"},
+        {"name": "Information", "type": "esriFieldTypeString"},
+        {"name": "Project", "type": "esriFieldTypeString"}
+    ]
+    layer = FakeFeatureLayer(fields=fields, wkid=4326, name="Boulders")
+    gis = FakeGIS({"boulders": FakeItem("boulders", [layer], title="Boulder Relocations")})
+
+    boulder_relocation_updater.update_boulder_layer(gis, "boulders", boulder_config.boulder_projects, csv_path=boulder_config.csv_file_path,
+                                                    session=FakeSession(archives))
+    return len(layer.rows)
+
+def count_rows(result):
+    """
+    Counts the features in a stage result.
+    """
+    if isinstance(result, int):
+        return result
+    return sum(len(value) for value in result.values())
+
+def run_suite(scales=(1, 10, 100), feature_config=config.extraction_features):
+    """
+    Runs every stage at every scale and returns
+    {"<stage>@x<scale>": {"seconds", "peak_mib", "rows"}}.
+    Each stage gets the previous stage's output as input, so only the stage
+    itself is measured.
+    """
+    print("Reading the committed charts once to build the stage inputs...")
+    base_frames = quiet(read_charts, feature_config)
+    if not base_frames:
+        raise SystemExit(f"No ENC features found in {config.target_folder_path}.")
+
+    results = {}
+    def record(stage, scale, function):
+        seconds, peak_mib, result = measure(function)
+        results[f"{stage}@x{scale}"] = {"seconds": round(seconds, 4), "peak_mib": round(peak_mib, 2), "rows": count_rows(result)}
+        print(f"{stage:>20} x{scale:<4} {seconds:8.3f} s {peak_mib:9.2f} MiB {count_rows(result):>9} rows")
+        return result
+
+    for scale in scales:
+        if scale <= READ_MAX_SCALE:
+            record("read_enc_layer", scale, lambda: quiet(read_charts, feature_config, passes=scale))
+
+        raw = {name: scale_frame(gdf, scale) for name, gdf in base_frames.items()}
+        mapped = record("map_column_codes", scale, lambda: quiet(map_layers, raw))
+        processed = record("post_processing", scale, lambda: quiet(post_process_layers, mapped))
+        projected = record("reprojection", scale, lambda: reproject_layers(processed))
+        payloads = record("payload_encoding", scale, lambda: encode_layers(projected))
+        record("agol_delta_sync", scale, lambda: quiet(sync_layers, payloads))
+
+        archives = boulder_archives(scale)
+        record("boulder_ingest", scale, lambda: quiet(run_boulder_ingest, archives))
+        del raw, mapped, processed, projected, payloads, archives
+
+    return results
+
+def compare_to_baseline(results, baseline, time_tolerance=0.5, memory_tolerance=0.25, min_seconds=0.05, gate_time=True):
+    """
+    Compares results with the baseline. A stage regressed if it is more than
+    time_tolerance (50%) slower or uses more than memory_tolerance (25%)
+    more peak memory. Stages faster than min_seconds are not timed against
+    the baseline, their timings are mostly noise. Without gate_time, slower
+    stages are printed but don't count as regressions.
+    Returns a list of regression messages.
+    """
+    regressions = []
+    slower = []
+    rows = []
+    for stage, current in results.items():
+        previous = baseline.get(stage)
+        if not previous:
+            rows.append({"stage": stage, "seconds": current["seconds"], "baseline_s": None, "peak_mib": current["peak_mib"], "baseline_mib": None, "status": "new"})
+            continue
+        status = "ok"
+        if current["seconds"] >= min_seconds and current["seconds"] > previous["seconds"] * (1 + time_tolerance):
+            status = "SLOWER" if gate_time else "slower (not gated)"
+            (regressions if gate_time else slower).append(f"{stage}: {current['seconds']:.3f} s vs {previous['seconds']:.3f} s baseline")
+        if current["peak_mib"] > previous["peak_mib"] * (1 + memory_tolerance) and current["peak_mib"] - previous["peak_mib"] > 1:
+            status = "MORE MEMORY" if status == "ok" else f"{status}, MORE MEMORY"
+            regressions.append(f"{stage}: {current['peak_mib']:.1f} MiB vs {previous['peak_mib']:.1f} MiB baseline")
+        rows.append({"stage": stage, "seconds": current["seconds"], "baseline_s": previous["seconds"], "peak_mib": current["peak_mib"], "baseline_mib": previous["peak_mib"], "status": status})
+
+    print("\n--- Comparison with baseline ---")
+    print(pd.DataFrame(rows).to_string(index=False))
+    if slower:
+        print("\nSlower than the baseline (timings not gated on this machine):")
+        for message in slower:
+            print(f"     - {message}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each workflow stage against a stored baseline.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Data scales to run (default: 1 10 100)")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="Baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed slowdown (0.5 = 50%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak memory increase (0.25 = 25%%)")
+    parser.add_argument("--memory-only", action="store_true",
+                        help="Only fail on peak memory regressions, report slower stages (for machines other than the baseline's)")
+    args = parser.parse_args()
+
+    results = run_suite(scales=args.scales)
+
+    if args.save_baseline:
+        baseline = {"python": platform.python_version(), "machine": platform.machine(), "stages": results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"\nSaved baseline to {args.baseline}")
+        return 0
+
+    if not args.baseline.exists():
+        print(f"\nNo baseline at {args.baseline}. Run with --save-baseline to create one.")
+        return 0
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(results, baseline.get("stages", {}), args.time_tolerance, args.memory_tolerance,
+                                      gate_time=not args.memory_only)
+    if regressions:
+        print("\nPerformance regressions:")
+        for regression in regressions:
+            print(f"     - {regression}")
+        return 1
+    print("\nNo performance regressions.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+##################################################
+##  BENCHMARK: PEAK MEMORY OF A STAGED LAYER    ##
+##   UPLOADED WHOLE OR CHUNK BY CHUNK          ##
+##################################################
+
+# Stages the turbine and substation layers of the committed data-raw/ENC
+# charts at x1 and at synthetic x10/x100 scales (repeated with offset FIDNs,
+# as in bench_stages.py, and moved apart) and uploads them to fake AGOL layers that only
+# count what they are sent, so the peak Python memory (tracemalloc) is the
+# workflow's own. Scenarios:
+#   whole layer      - the staged layer read back, processed and encoded at once
+#   chunked delta    - iter_prepared_staged_layer chunks delta synced as they arrive
+#   chunked truncate - the same chunks appended as they arrive after a truncate
+# Only the dedup key/geometry columns and the AGOL layer state are held for
+# the whole layer when chunked, so its peak should grow far slower than the
+# whole layer's.
+# Run from the repository root:
+#   python python/noaa_enc_processor/benchmarks/bench_streaming_upload.py
+#   python python/noaa_enc_processor/benchmarks/bench_streaming_upload.py --scales 1 10 --chunk-size 2000
+
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+import geopandas as gpd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from enc_processor import config
+from enc_processor.processor import prepare_features, iter_prepared_staged_layer, upload_features
+from enc_processor.staging_store import staging_available, clear_staging, stage_layer, iter_staged_layer
+from enc_processor.agol_metadata import AgolMetadataCache
+from fake_agol import FakeGIS, FakeItem, FakeFeatureLayer
+from bench_stages import quiet, measure, scale_frame, read_charts, TARGET_WKID
+
+# Rows per staged part, standing in for one chart's features
+PART_ROWS = 2000
+
+# How far east each synthetic copy of the charts is moved (about 8 km off New England)
+COPY_OFFSET_DEGREES = 0.1
+
+class SinkLayer(FakeFeatureLayer):
+    """
+    Fake layer that starts empty and counts the features it is sent without
+    keeping them, so only the uploader's memory is measured.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.sent = 0
+
+    def _apply_edits(self, adds, updates, deletes):
+        self.request_count += 1
+        self.sent += len(adds or []) + len(updates or [])
+        result = {"addResults": [], "updateResults": [], "deleteResults": []}
+        for _ in adds or []:
+            result["addResults"].append({"objectId": self.next_object_id, "success": True})
+            self.next_object_id += 1
+        for feature in updates or []:
+            result["updateResults"].append({"objectId": feature["attributes"].get("OBJECTID"), "success": True})
+        return result
+
+def stage_scaled(staging_dir, frames, scale):
+    """
+    Stages every layer repeated scale times, in parts of PART_ROWS rows.
+    Each copy is moved COPY_OFFSET_DEGREES further east, so the copies look
+    like more charts to duplicate merging instead of features stacked on
+    the same spot.
+    """
+    clear_staging(staging_dir)
+    for name, gdf in frames.items():
+        scaled = scale_frame(gdf, scale)
+        rows = len(gdf)
+        copies = [scaled.geometry.iloc[copy_number * rows:(copy_number + 1) * rows].translate(xoff=copy_number * COPY_OFFSET_DEGREES)
+                  for copy_number in range(scale)]
+        scaled = scaled.set_geometry(pd.concat(copies))
+        for part_number, start in enumerate(range(0, len(scaled), PART_ROWS)):
+            stage_layer(staging_dir, name, f"{part_number:05d}", scaled.iloc[start:start + PART_ROWS])
+
+def upload_staged(staging_dir, fields, scenario, chunk_size):
+    """
+    Uploads every staged layer to a new sink layer the way scenario says.
+    Returns the number of features sent.
+    """
+    sent = 0
+    for name, info in config.extraction_features.items():
+        layer = SinkLayer(fields=fields[name], wkid=TARGET_WKID, name=name)
+        gis = FakeGIS({name: FakeItem(name, [layer])})
+        info = dict(info, agol_item_id=name, agol_layer_index=0, sync_key="FIDN")
+        if scenario == "whole layer":
+            chunks = list(iter_staged_layer(staging_dir, name, chunk_size=chunk_size))
+            full_gdf = gpd.GeoDataFrame(pd.concat(chunks, ignore_index=True), crs=chunks[0].crs)
+            del chunks
+            gdf_chunks = [prepare_features(full_gdf, name, info)]
+            del full_gdf
+        else:
+            gdf_chunks = iter_prepared_staged_layer(staging_dir, name, info, chunk_size=chunk_size)
+        upload_mode = "truncate" if scenario == "chunked truncate" else "delta"
+        upload_features(gis, name, info, gdf_chunks, upload_mode=upload_mode, upload_options={"backoff_seconds": 0},
+                        metadata_cache=AgolMetadataCache(gis, layer_factory=lambda url: layer))
+        sent += layer.sent
+    return sent
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the peak memory of uploading a staged layer whole or chunk by chunk.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="Data scales to run (default: 1 10 100)")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per processed chunk (default: 5000)")
+    args = parser.parse_args()
+
+    if not staging_available():
+        raise SystemExit("The staging store needs pyarrow.")
+    print("Reading the committed charts once to build the staged layers...")
+    frames = quiet(read_charts, config.extraction_features)
+    if not frames:
+        raise SystemExit(f"No ENC features found in {config.target_folder_path}.")
+    # Every column the processed layers can have, as string fields of the fake layers
+    fields = {}
+    for name, gdf in frames.items():
+        prepared = quiet(prepare_features, gdf.copy(), name, config.extraction_features[name])
+        fields[name] = [{"name": col, "type": "esriFieldTypeString"} for col in prepared.columns if col != prepared.geometry.name]
+
+    rows = []
+    with tempfile.TemporaryDirectory() as staging_dir:
+        for scale in args.scales:
+            stage_scaled(staging_dir, frames, scale)
+            for scenario in ("whole layer", "chunked delta", "chunked truncate"):
+                seconds, peak_mib, sent = measure(lambda: quiet(upload_staged, staging_dir, fields, scenario, args.chunk_size))
+                rows.append({"scenario": scenario, "scale": f"x{scale}", "features_sent": sent, "seconds": round(seconds, 3), "peak_mib": round(peak_mib, 2)})
+                print(f"{scenario:>17} x{scale:<4} {seconds:8.3f} s {peak_mib:9.2f} MiB {sent:>9} features")
+
+    print("\n--- Peak memory by scale ---")
+    print(pd.DataFrame(rows).pivot(index="scenario", columns="scale", values="peak_mib").to_string())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
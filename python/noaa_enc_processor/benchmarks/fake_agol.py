@@ -0,0 +1,202 @@
+#############################################
+##   LOCAL STAND-IN FOR AGOL GIS/LAYERS    ##
+#############################################
+
+# Minimal in-memory replacements for the arcgis GIS, Item and FeatureLayer
+# objects used by the workflow, so processing, delta sync and uploads can be
+# run and measured locally without an ArcGIS Online account.
+
+import copy
+import json
+import time
+import random
+import threading
+
+class FakePropertyMap(dict):
+    """
+    Stands in for arcgis PropertyMap: a dictionary whose keys can also be
+    read as attributes (layer.properties.fields).
+    """
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+class FakeFeature:
+    """
+    Stands in for arcgis.features.Feature.
+    """
+    def __init__(self, attributes, geometry=None):
+        self.attributes = attributes
+        self.geometry = geometry
+
+    @property
+    def as_dict(self):
+        return {"attributes": self.attributes, "geometry": self.geometry}
+
+class FakeFeatureSet:
+    """
+    Stands in for the arcgis.features.FeatureSet returned by FeatureLayer.query.
+    """
+    def __init__(self, features):
+        self.features = features
+
+class FakeLayerManager:
+    """
+    Stands in for FeatureLayer.manager (truncate and definition updates).
+    """
+    def __init__(self, layer):
+        self.layer = layer
+
+    def truncate(self):
+        self.layer.request_count += 1
+        self.layer.rows.clear()
+        return {"success": True}
+
+    def update_definition(self, update_dict):
+        self.layer.request_count += 1
+        fields_by_name = {field["name"]: field for field in self.layer.properties["fields"]}
+        for field in update_dict.get("fields", []):
+            if field["name"] in fields_by_name:
+                fields_by_name[field["name"]].update(field)
+        return {"success": True}
+
+    def add_to_definition(self, definition):
+        self.layer.request_count += 1
+        self.layer.properties["fields"].extend(copy.deepcopy(definition.get("fields", [])))
+        return {"success": True}
+
+class FakeFeatureLayer:
+    """
+    Stands in for arcgis.features.FeatureLayer. Features are kept in memory by
+    object ID. Geometries are stored as sent, so queries return them in the
+    spatial reference they were uploaded in. request_count and payload_bytes
+    record how much was sent to the "service".
+    latency (seconds per request), failure_rate (chance a request raises a
+    transient error) and max_request_features (requests with more features
+    raise, like an oversized payload) inject the slowness and failures seen
+    on AGOL.
+    """
+    def __init__(self, fields=None, wkid=3857, name="Fake Layer", latency=0.0, failure_rate=0.0,
+                 max_request_features=None, seed=None):
+        fields = fields or []
+        self.properties = FakePropertyMap({
+            "name": name,
+            "objectIdField": "OBJECTID",
+            "spatialReference": {"wkid": wkid},
+            "fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID", "alias": "OBJECTID"}] + copy.deepcopy(fields)
+        })
+        self.manager = FakeLayerManager(self)
+        self.rows = {}
+        self.next_object_id = 1
+        self.request_count = 0
+        self.payload_bytes = 0
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.max_request_features = max_request_features
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def _field_names(self):
+        return {field["name"] for field in self.properties["fields"]}
+
+    def _clean_attributes(self, attributes):
+        # AGOL drops attributes that are not fields in the layer
+        field_names = self._field_names()
+        return {k: v for k, v in attributes.items() if k in field_names}
+
+    def query(self, where="1=1", out_fields="*", return_geometry=True, return_count_only=False, out_sr=None, **kwargs):
+        self.request_count += 1
+        if return_count_only:
+            return len(self.rows)
+        features = []
+        for object_id, row in sorted(self.rows.items()):
+            attributes = dict(row["attributes"], OBJECTID=object_id)
+            if out_fields != "*":
+                wanted = set(out_fields.split(","))
+                attributes = {k: v for k, v in attributes.items() if k in wanted}
+            features.append(FakeFeature(attributes, copy.deepcopy(row["geometry"]) if return_geometry else None))
+        return FakeFeatureSet(features)
+
+    def edit_features(self, adds=None, updates=None, deletes=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            return self._apply_edits(adds, updates, deletes)
+
+    def _apply_edits(self, adds, updates, deletes):
+        self.request_count += 1
+        payload = {"adds": adds, "updates": updates, "deletes": deletes}
+        self.payload_bytes += len(json.dumps(payload, default=lambda o: getattr(o, "as_dict", str(o))))
+
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise Exception("Fake transient error: 504 Gateway Timeout")
+        feature_count = len(adds or []) + len(updates or [])
+        if self.max_request_features and feature_count > self.max_request_features:
+            raise Exception("Fake error: request payload too large")
+
+        result = {"addResults": [], "updateResults": [], "deleteResults": []}
+        for feature in adds or []:
+            feature = getattr(feature, "as_dict", feature)
+            object_id = self.next_object_id
+            self.next_object_id += 1
+            self.rows[object_id] = {
+                "attributes": self._clean_attributes(feature["attributes"]),
+                "geometry": copy.deepcopy(feature.get("geometry"))
+            }
+            result["addResults"].append({"objectId": object_id, "success": True})
+        for feature in updates or []:
+            feature = getattr(feature, "as_dict", feature)
+            object_id = feature["attributes"].get("OBJECTID")
+            if object_id not in self.rows:
+                result["updateResults"].append({"objectId": object_id, "success": False, "error": {"code": 1019, "description": "Object is missing."}})
+                continue
+            self.rows[object_id] = {
+                "attributes": self._clean_attributes({k: v for k, v in feature["attributes"].items() if k != "OBJECTID"}),
+                "geometry": copy.deepcopy(feature.get("geometry"))
+            }
+            result["updateResults"].append({"objectId": object_id, "success": True})
+        if isinstance(deletes, str):
+            deletes = [int(object_id) for object_id in deletes.split(",") if object_id]
+        for object_id in deletes or []:
+            success = self.rows.pop(object_id, None) is not None
+            delete_result = {"objectId": object_id, "success": success}
+            if not success:
+                delete_result["error"] = {"code": 1019, "description": "Object is missing."}
+            result["deleteResults"].append(delete_result)
+        return result
+
+    def delete_features(self, where="1=1", **kwargs):
+        self.request_count += 1
+        deleted = [{"objectId": object_id, "success": True} for object_id in self.rows]
+        self.rows.clear()
+        return {"deleteResults": deleted}
+
+class FakeItem:
+    """
+    Stands in for an arcgis.gis.Item holding feature layers.
+    """
+    def __init__(self, item_id, layers, title=None):
+        self.id = item_id
+        self.layers = layers
+        self.title = title or f"Fake item {item_id}"
+
+    def update(self, item_properties=None, **kwargs):
+        return True
+
+class FakeContentManager:
+    def __init__(self, items):
+        self.items = items
+        self.get_count = 0
+
+    def get(self, item_id):
+        self.get_count += 1
+        return self.items.get(item_id)
+
+class FakeGIS:
+    """
+    Stands in for arcgis.gis.GIS. Only content.get is supported.
+    """
+    def __init__(self, items=None):
+        self.content = FakeContentManager(items or {})
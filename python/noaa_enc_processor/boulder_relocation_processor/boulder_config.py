@@ -20,4 +20,14 @@ boulder_projects = {
 
 urls_to_process = list(boulder_projects.keys())
 
+# Downloaded archives, their ETag/Last-Modified validators and the content hash of the
+# last uploaded boulder set are kept here between runs (restored by the workflow cache)
+boulder_cache_dir = project_root / ".cache" / "boulders"
+boulder_download_workers = int(os.getenv("BOULDER_DOWNLOAD_WORKERS", 4))
+# Set BOULDER_FORCE_UPLOAD=1 to reload the AGOL layer even if the boulders haven't changed
+boulder_force_upload = os.getenv("BOULDER_FORCE_UPLOAD", "0") == "1"
+# How boulders are sent to AGOL: "upsert" (only new, moved or removed boulders,
+# keyed on Boulder_ID + Project) or "replace" (clear the layer and re-add every boulder)
+boulder_upload_mode = os.getenv("BOULDER_UPLOAD_MODE", "upsert")
+
 boulder_agol_id = os.getenv("BOULDER_ITEM_ID")
\ No newline at end of file
@@ -3,86 +3,276 @@
 ##   UPDATE EXISTING AGOL HOSTED FEATURE SERVICES   ##
 ######################################################
 
-import io
+import re
 import zipfile
+import hashlib
+import tempfile
 import requests
 import json
 import csv
-from arcgis.gis import GIS
+from datetime import date
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import geopandas as gpd
+from shapely.geometry import Point
+from enc_processor.snapshot_store import snapshots_available, write_snapshot
+from enc_processor.downloader import create_session, conditional_download, load_validators, save_validators
+from enc_processor.instrumentation import add_count, submit
+from enc_processor.agol_sync import delta_sync_features
+from enc_processor.edit_uploader import submit_edits, print_upload_summary
+from enc_processor.agol_metadata import AgolMetadataCache
 
-def update_boulder_layer(gis, item_id, project_map, csv_path=None):
+# Files (in the boulder cache folder) storing each download's ETag/Last-Modified
+# and the content hash of the boulders last uploaded to each AGOL item
+BOULDER_VALIDATORS_FILENAME = "boulder_validators.json"
+BOULDER_STATE_FILENAME = "boulder_state.json"
+
+# Stable key of a boulder in the AGOL layer, used by the upsert mode
+BOULDER_KEY_FIELDS = ["Boulder_ID", "Project"]
+
+def boulder_archive_name(project_name):
+    """
+    Local file name for a project's GeoJSON.zip (every project's URL ends in
+    the same file name, so the project name is used instead).
+    """
+    return re.sub(r"[^A-Za-z0-9]+", "_", project_name).strip("_") + ".zip"
+
+def download_boulder_archives(project_map, download_dir, max_workers=4, session=None):
+    """
+    Downloads every project's GeoJSON.zip into download_dir at the same time
+    over one pooled session, skipping archives that haven't changed since
+    the last run (ETag/Last-Modified). A failed download keeps the copy from
+    the last run, if there is one.
+    Returns {url: path to the archive, or None if there is no copy}.
+    """
+    download_dir = Path(download_dir)
+    download_dir.mkdir(parents=True, exist_ok=True)
+    validators_path = download_dir / BOULDER_VALIDATORS_FILENAME
+    validators = load_validators(validators_path)
+
+    own_session = session is None
+    if own_session:
+        session = create_session(pool_size=max_workers)
+
+    archive_paths = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {}
+            for url, project_name in project_map.items():
+                print(f"Downloading: {url} for Project: {project_name}")
+                futures[url] = submit(executor, conditional_download, session, url, download_dir / boulder_archive_name(project_name), validators.get(url))
+            for url, future in futures.items():
+                output_path = download_dir / boulder_archive_name(project_map[url])
+                try:
+                    status, validator, bytes_written = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    print(f"Failed to download {url}: {e}")
+                    if output_path.exists():
+                        print(f"Using the copy from the last run for {project_map[url]}.")
+                        archive_paths[url] = output_path
+                    else:
+                        archive_paths[url] = None
+                    continue
+                add_count("bytes_downloaded", bytes_written)
+                if status == "unchanged":
+                    print(f"{project_map[url]} boulders have not changed since the last download.")
+                else:
+                    validators[url] = validator
+                archive_paths[url] = output_path
+    finally:
+        if own_session:
+            session.close()
+
+    try:
+        save_validators(validators, validators_path)
+    except OSError as e:
+        print(f"Warning: Could not save boulder download validators to {validators_path}: {e}")
+    return archive_paths
+
+def read_boulder_archive(zip_path, project_name, digest=None):
+    """
+    Converts the GeoJSON boulders in a project's archive to Esri features,
+    reading the archive from disk. The GeoJSON contents are added to
+    digest (a hashlib object), if given.
+    """
+    features = []
+    with zipfile.ZipFile(zip_path) as z:
+        for filename in sorted(z.namelist()):
+            if filename.endswith('.geojson'):
+                data = z.read(filename)
+                if digest is not None:
+                    digest.update(filename.encode("utf-8"))
+                    digest.update(data)
+                gj_data = json.loads(data)
+
+                # Convert GeoJSON Feature to Esri Feature format
+                for feat in gj_data['features']:
+                    props = feat['properties']
+                    # Map GeoJSON column name to AGOL column name
+                    formatted_props = {
+                        "Boulder_ID": props.get('name'),
+                        "Information": props.get('description'),
+                        "Project": project_name
+                    }
+
+                    esri_feat = {
+                        "attributes": formatted_props,
+                        "geometry": {
+                            "x": feat['geometry']['coordinates'][0],
+                            "y": feat['geometry']['coordinates'][1],
+                            "spatialReference": {"wkid": 4326}
+                        }
+                    }
+                    features.append(esri_feat)
+    return features
+
+def read_boulder_csv(csv_path, digest=None):
+    """
+    Converts the rows of the Empire Wind boulder CSV to Esri features.
+    The CSV contents are added to digest (a hashlib object), if given.
+    """
+    features = []
+    if digest is not None:
+        with open(csv_path, 'rb') as f:
+            digest.update(f.read())
+    with open(csv_path, mode='r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            try:
+                # Creating the feature structure to match the AGOL schema
+                csv_feat = {
+                    "attributes": {
+                        "Boulder_ID": row.get('Boulder_ID'),
+                        "Information": row.get('Information'),
+                        "Project": row.get('Project')
+                    },
+                    "geometry": {
+                        "x": float(row.get('Lon')),
+                        "y": float(row.get('Lat')),
+                        "spatialReference": {"wkid": 4326}
+                    }
+                }
+                features.append(csv_feat)
+            except (ValueError, TypeError) as e:
+                print(f"Skipping CSV row {row.get('Boulder_ID')} due to invalid coordinates.")
+    return features
+
+def load_boulder_features(project_map, archive_paths, csv_path=None):
+    """
+    Reads the boulders from every downloaded archive and the CSV.
+    Returns (Esri features, content hash of the combined boulder set).
+    The hash covers each project's name and GeoJSON contents and the CSV,
+    so it only changes when the boulders do (not when an archive is
+    re-zipped or re-downloaded).
+    """
+    digest = hashlib.sha256()
     all_esri_features = []
 
-    # Download and process GeoJSON files
+    # Process the GeoJSON files
     for url, project_name in project_map.items():
-        print(f"Downloading: {url} for Project: {project_name}")
-        
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"Failed to download {url}")
+        zip_path = archive_paths.get(url)
+        digest.update(f"\n{url}\t{project_name}\t".encode("utf-8"))
+        if zip_path is None:
+            digest.update(b"missing")
             continue
-            
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            for filename in z.namelist():
-                if filename.endswith('.geojson'):
-                    with z.open(filename) as f:
-                        gj_data = json.load(f)
-                        
-                        # Convert GeoJSON Feature to Esri Feature format
-                        for feat in gj_data['features']:
-                            
-                            props = feat['properties']
-                            # Map GeoJSON column name to AGOL column name
-                            formatted_props = {
-                                "Boulder_ID": props.get('name'),
-                                "Information": props.get('description'),
-                                "Project": project_name
-                            }
-            
-                            esri_feat = {
-                                "attributes": formatted_props,
-                                "geometry": {
-                                    "x": feat['geometry']['coordinates'][0],
-                                    "y": feat['geometry']['coordinates'][1],
-                                    "spatialReference": {"wkid": 4326}
-                                }
-                            }
-                            all_esri_features.append(esri_feat) 
+        try:
+            all_esri_features.extend(read_boulder_archive(zip_path, project_name, digest))
+        except (zipfile.BadZipFile, OSError, ValueError, KeyError) as e:
+            print(f"Failed to read boulders for {project_name} from {zip_path}: {e}")
+            digest.update(b"unreadable")
 
     # Process csv file of Empire Wind boulder locations
+    digest.update(b"\ncsv\t")
     if csv_path and csv_path.exists():
         print(f"Processing CSV file: {csv_path}")
-        with open(csv_path, mode='r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                try:
-                    # Creating the feature structure to match the AGOL schema
-                    csv_feat = {
-                        "attributes": {
-                            "Boulder_ID": row.get('Boulder_ID'),
-                            "Information": row.get('Information'),
-                            "Project": row.get('Project')
-                        },
-                        "geometry": {
-                            "x": float(row.get('Lon')),
-                            "y": float(row.get('Lat')),
-                            "spatialReference": {"wkid": 4326}
-                        }
-                    }
-                    all_esri_features.append(csv_feat)
-                except (ValueError, TypeError) as e:
-                    print(f"Skipping CSV row {row.get('Boulder_ID')} due to invalid coordinates.")
+        all_esri_features.extend(read_boulder_csv(csv_path, digest))
     else:
         print(f"Note: No CSV file found or processed at {csv_path}")
 
+    return all_esri_features, digest.hexdigest()
+
+def snapshot_boulders(features, snapshot_dir, run_date=None):
+    """
+    Stores the boulder features sent to AGOL in the snapshot history
+    (enc_processor/snapshot_store.py), keyed on Boulder_ID and Project.
+    """
+    if not snapshots_available():
+        print("Snapshot history needs pyarrow. Skipping boulder snapshot.")
+        return
+    try:
+        gdf = gpd.GeoDataFrame(
+            [feat['attributes'] for feat in features],
+            geometry=[Point(feat['geometry']['x'], feat['geometry']['y']) for feat in features],
+            crs="EPSG:4326"
+        )
+        write_snapshot(snapshot_dir, "Boulders", run_date or date.today(), gdf, key_fields=["Project", "Boulder_ID"])
+        print(f"Saved snapshot of {len(gdf)} boulders.")
+    except Exception as e:
+        print(f"Failed to save boulder snapshot: {e}")
+
+def update_boulder_layer(gis, item_id, project_map, csv_path=None, snapshot_dir=None, run_date=None,
+                         cache_dir=None, max_workers=4, session=None, force=False, upload_mode="upsert", upload_options=None,
+                         metadata_cache=None):
+    """
+    Downloads the boulder relocation GeoJSONs, adds the Empire Wind CSV boulders and updates the
+    AGOL boulder layer, skipping it if the boulders haven't changed since the last run in cache_dir
+    (unless force is set). Returns "uploaded", "unchanged", "skipped" or "failed".
+    """
+    temp_dir = None
+    if cache_dir is None:
+        temp_dir = tempfile.TemporaryDirectory()
+        download_dir = Path(temp_dir.name)
+    else:
+        download_dir = Path(cache_dir)
+
+    try:
+        archive_paths = download_boulder_archives(project_map, download_dir, max_workers=max_workers, session=session)
+        all_esri_features, content_hash = load_boulder_features(project_map, archive_paths, csv_path)
+        uploaded = _upload_boulders(gis, item_id, all_esri_features, content_hash, download_dir if cache_dir else None,
+                                    snapshot_dir=snapshot_dir, run_date=run_date, force=force,
+                                    upload_mode=upload_mode, upload_options=upload_options, metadata_cache=metadata_cache)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+    return uploaded
+
+def _load_boulder_state(state_dir):
+    return load_validators(Path(state_dir) / BOULDER_STATE_FILENAME) if state_dir else {}
+
+def _save_boulder_state(state_dir, state):
+    try:
+        save_validators(state, Path(state_dir) / BOULDER_STATE_FILENAME)
+    except OSError as e:
+        print(f"Warning: Could not save the boulder content hash: {e}")
+
+def _upload_boulders(gis, item_id, all_esri_features, content_hash, state_dir, snapshot_dir=None, run_date=None, force=False,
+                     upload_mode="upsert", upload_options=None, metadata_cache=None):
+    """
+    Updates the AGOL boulder layer with the features unless they hash the
+    same as the last successful upload to this item. upload_mode "upsert"
+    sends only the new, moved/edited and removed boulders (keyed on
+    Boulder_ID + Project); "replace" clears the layer and re-adds every
+    boulder. Returns "uploaded", "unchanged", "skipped" or "failed" (see
+    update_boulder_layer).
+    """
     # Upload to AGOL
     if not all_esri_features:
         print("No features found.")
-        return
+        return "skipped"
+
+    # Skip the whole update when the boulder set hasn't changed
+    state = _load_boulder_state(state_dir)
+    if not force and state.get(item_id) == content_hash:
+        print(f"Boulders unchanged since the last upload ({len(all_esri_features)} features). Skipping AGOL update.")
+        return "unchanged"
 
     # Schema initalization 
-    target_item = gis.content.get(item_id)
-    flayer = target_item.layers[0]
+    metadata_cache = metadata_cache or AgolMetadataCache(gis)
+    flayer = metadata_cache.layer(item_id, 0)
+    if flayer is None:
+        print(f"Boulder item {item_id} or its layer was not found. Skipping AGOL update.")
+        return "skipped"
+    schema = metadata_cache.schema(item_id, 0)
 
     # 1. Define the columns to keep
     target_fields = [
@@ -91,12 +281,15 @@ def update_boulder_layer(gis, item_id, project_map, csv_path=None):
         {"name": "Project", "type": "esriFieldTypeString", "alias": "Project", "nullable": True} 
     ]
 
-    # 2. Check if the layer is currently empty of fields
-    if not flayer.properties.fields:
+    # 2. Check if the layer is currently empty of fields (confirmed live, not from the disk cache)
+    if not schema["fields"] and not metadata_cache.properties(item_id, 0).get("fields"):
         print("Initializing layer schema...")
         flayer.manager.add_to_definition({
             "fields": target_fields
         })
+        metadata_cache.invalidate(item_id, 0)
+        flayer = metadata_cache.layer(item_id, 0)
+        schema = None
 
     # 3. Filter features to ONLY include these attributes
     allowed_keys = [f['name'] for f in target_fields]
@@ -108,6 +301,48 @@ def update_boulder_layer(gis, item_id, project_map, csv_path=None):
         feat['attributes'] = filtered_attributes
         cleaned_features.append(feat)
 
+    # Keep a dated copy of what is sent, for the boulder history
+    if snapshot_dir:
+        snapshot_boulders(cleaned_features, snapshot_dir, run_date)
+
+    sync_summary = None
+    if upload_mode == "upsert":
+        try:
+            print(f"Upserting {len(cleaned_features)} boulders to item {item_id} using key {BOULDER_KEY_FIELDS}...")
+            sync_summary = delta_sync_features(flayer, cleaned_features, key_fields=BOULDER_KEY_FIELDS, upload_options=upload_options,
+                                               layer_properties=schema or metadata_cache.schema(item_id, 0))
+        except Exception as e:
+            print(f"Boulder upsert failed: {e}")
+        if sync_summary is None:
+            print("Falling back to clearing and reloading the boulder layer.")
+
+    if sync_summary is not None:
+        failed = sync_summary["failed"]
+        upload_summary = sync_summary.get("upload")
+        if upload_summary:
+            add_count("features_uploaded", upload_summary["adds"]["succeeded"] + upload_summary["updates"]["succeeded"])
+            add_count("features_deleted", upload_summary["deletes"]["succeeded"])
+        add_count("features_unchanged", sync_summary["unchanged"])
+    else:
+        failed = _replace_boulders(flayer, cleaned_features, item_id, upload_options)
+
+    # Only remember the boulder set once it is fully uploaded, so a partial upload is retried
+    if failed:
+        print(f"Boulder update incomplete: {failed} boulder edit(s) failed. The next run will retry them.")
+        return "failed"
+    if state_dir:
+        state[item_id] = content_hash
+        _save_boulder_state(state_dir, state)
+
+    print("Sync complete.")
+    print("Update complete.")
+    return "uploaded"
+
+def _replace_boulders(flayer, cleaned_features, item_id, upload_options=None):
+    """
+    Clears the boulder layer and re-adds every boulder in concurrent,
+    retried batches. Returns the number of boulders that failed to upload.
+    """
     # Conditional Delete: Only if records exist
     try:
         current_count = flayer.query(where="1=1", return_count_only=True)
@@ -120,18 +355,8 @@ def update_boulder_layer(gis, item_id, project_map, csv_path=None):
         # If the layer is so new it has no table yet, query might fail
         print("Layer schema not yet initialized. Skipping delete step.")
 
-    # UPLOAD: Push in batches of 1000 to avoid timeout/size errors
-    print(f"Pushing {len(cleaned_features)} features to: {target_item.title}...")
-    
-    for i in range(0, len(cleaned_features), 1000):
-        chunk = cleaned_features[i:i + 1000]
-        result = flayer.edit_features(adds=chunk)
-        
-        # Check for errors in the batch
-        if 'addResults' in result:
-            fails = [r for r in result['addResults'] if not r['success']]
-            if fails:
-                print(f"Batch {(i//1000)+1} had {len(fails)} failures. Error: {fails[0].get('error')}")
-
-    print("Sync complete.")
-    print("Update complete.")
\ No newline at end of file
+    print(f"Pushing {len(cleaned_features)} features to item {item_id}...")
+    summary = submit_edits(flayer, adds=cleaned_features, key_fields=BOULDER_KEY_FIELDS, **(upload_options or {}))
+    print_upload_summary("Boulders", summary)
+    add_count("features_uploaded", summary["adds"]["succeeded"])
+    return len(summary["failures"])
@@ -0,0 +1,222 @@
+#############################################
+##   SHARED AGOL ITEM/LAYER METADATA CACHE  ##
+#############################################
+
+# The processor, field updater and boulder updater all look up the same AGOL
+# items, layers and layer properties. AgolMetadataCache makes each lookup
+# once per run, and keeps the facts about each layer that rarely change (its
+# URL, spatial reference, object ID field and field schema) in a JSON file
+# for ttl_hours, so later runs can open the layer from its URL and read its
+# spatial reference and schema without asking the portal.
+# Anything that changes a layer's schema must call invalidate() afterwards.
+
+import os
+import json
+import time
+import tempfile
+import threading
+from pathlib import Path
+from .instrumentation import add_count
+
+def layer_wkid(properties, default=3857):
+    """
+    Returns a layer's WKID from its properties (its own spatial reference,
+    else its extent's), or default.
+    """
+    return (properties.get('spatialReference', {}).get('wkid') or
+            properties.get('extent', {}).get('spatialReference', {}).get('wkid') or default)
+
+def _arcgis_layer_factory(gis):
+    """
+    Returns a function opening a FeatureLayer from its URL (no portal
+    request until it is used), or None without the arcgis package.
+    """
+    try:
+        from arcgis.features import FeatureLayer
+    except ImportError:
+        return None
+    return lambda url: FeatureLayer(url, gis=gis)
+
+class AgolMetadataCache:
+    """
+    Memoizes AGOL item, layer and property lookups for one run, with an
+    optional on-disk cache (path) of each layer's stable facts that expires
+    after ttl_hours. Safe to share between threads.
+    """
+    def __init__(self, gis, path=None, ttl_hours=24 * 8, layer_factory=None):
+        self.gis = gis
+        self.path = Path(path) if path else None
+        self.ttl_seconds = ttl_hours * 3600
+        self.layer_factory = layer_factory if layer_factory is not None else _arcgis_layer_factory(gis)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._key_locks = {}
+        self._items = {}
+        self._layers = {}
+        self._properties = {}
+        self._facts = self._load() if self.path and self.ttl_seconds > 0 else {}
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read the AGOL metadata cache {self.path}: {e}")
+            return {}
+
+    def save(self):
+        """
+        Writes the stable layer facts to disk through a temp file. Saves
+        from different threads take turns, so the last one leaves the latest
+        facts on disk.
+        """
+        if not self.path or self.ttl_seconds <= 0:
+            return
+        with self._save_lock:
+            with self._lock:
+                facts = json.dumps(self._facts, indent=2, sort_keys=True, default=dict)
+            tmp_path = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(facts)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Warning: Could not save the AGOL metadata cache {self.path}: {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def _key_lock(self, key):
+        # One lock per lookup, so two threads wanting the same item fetch it once
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _fresh_facts(self, key):
+        facts = self._facts.get(key)
+        if facts and time.time() - facts.get("saved", 0) < self.ttl_seconds:
+            return facts
+        return None
+
+    def _remember(self, key, **values):
+        with self._lock:
+            facts = self._facts.get(key)
+            if not facts or time.time() - facts.get("saved", 0) >= self.ttl_seconds:
+                facts = self._facts[key] = {"saved": time.time()}
+            facts.update(values)
+        self.save()
+
+    def item(self, item_id):
+        """
+        Returns the AGOL item (None if it doesn't exist), fetched once per run.
+        """
+        if item_id in self._items:
+            add_count("metadata_cache_hits")
+            return self._items[item_id]
+        with self._key_lock(item_id):
+            if item_id not in self._items:
+                add_count("metadata_fetches")
+                self._items[item_id] = self.gis.content.get(item_id)
+            else:
+                add_count("metadata_cache_hits")
+        return self._items[item_id]
+
+    def layer(self, item_id, index=0):
+        """
+        Returns layer index of the item (None if the item or layer doesn't
+        exist). A layer whose URL is cached is opened straight from the URL,
+        without fetching the item.
+        """
+        key = f"{item_id}/{index}"
+        if key in self._layers:
+            add_count("metadata_cache_hits")
+            return self._layers[key]
+        with self._key_lock(key):
+            if key in self._layers:
+                add_count("metadata_cache_hits")
+                return self._layers[key]
+            facts = self._fresh_facts(key)
+            if facts and facts.get("url") and self.layer_factory:
+                add_count("metadata_cache_hits")
+                layer = self.layer_factory(facts["url"])
+            else:
+                item = self.item(item_id)
+                if item is None or index >= len(item.layers):
+                    return None
+                layer = item.layers[index]
+                if getattr(layer, "url", None):
+                    self._remember(key, url=layer.url)
+            self._layers[key] = layer
+        return layer
+
+    def properties(self, item_id, index=0):
+        """
+        Returns the layer's live properties, fetched once per run, and
+        refreshes its cached facts from them. None if there is no such layer.
+        """
+        key = f"{item_id}/{index}"
+        if key in self._properties:
+            add_count("metadata_cache_hits")
+            return self._properties[key]
+        layer = self.layer(item_id, index)
+        if layer is None:
+            return None
+        with self._key_lock(f"{key}/properties"):
+            if key not in self._properties:
+                add_count("metadata_fetches")
+                properties = layer.properties
+                self._properties[key] = properties
+                self._remember(
+                    key,
+                    wkid=layer_wkid(properties),
+                    objectIdField=properties.get("objectIdField") or "OBJECTID",
+                    fields=json.loads(json.dumps(list(properties.get("fields") or []), default=dict))
+                )
+        return self._properties[key]
+
+    def _fact(self, item_id, index, name):
+        facts = self._fresh_facts(f"{item_id}/{index}")
+        if facts and name in facts:
+            add_count("metadata_cache_hits")
+            return facts[name]
+        if self.properties(item_id, index) is None:
+            return None
+        return self._facts[f"{item_id}/{index}"][name]
+
+    def spatial_reference(self, item_id, index=0):
+        """
+        Returns the layer's WKID, from the disk cache if it is fresh.
+        """
+        return self._fact(item_id, index, "wkid")
+
+    def schema(self, item_id, index=0):
+        """
+        Returns {"fields", "objectIdField"} for the layer (enough for
+        agol_sync.delta_sync_features), from the disk cache if it is fresh.
+        """
+        fields = self._fact(item_id, index, "fields")
+        if fields is None:
+            return None
+        return {"fields": fields, "objectIdField": self._fact(item_id, index, "objectIdField")}
+
+    def invalidate(self, item_id, index=None):
+        """
+        Forgets the item's (or one of its layers') layer objects, properties
+        and cached schema, in memory and on disk, so they are read from AGOL
+        again. Call after changing a layer's schema. Layer URLs and spatial
+        references don't change with the schema and are kept.
+        """
+        with self._lock:
+            for key in set(self._layers) | set(self._properties) | set(self._facts):
+                if key == f"{item_id}/{index}" or (index is None and key.startswith(f"{item_id}/")):
+                    self._layers.pop(key, None)
+                    self._properties.pop(key, None)
+                    if key in self._facts:
+                        self._facts[key].pop("fields", None)
+                        self._facts[key].pop("objectIdField", None)
+            # Without a layer factory the layers are reopened through the item
+            if not self.layer_factory:
+                self._items.pop(item_id, None)
+        self.save()
@@ -0,0 +1,254 @@
+#####################################################
+##   FUNCTIONS TO DELTA SYNC FEATURES TO AN AGOL   ##
+##        HOSTED FEATURE LAYER BY A STABLE KEY     ##
+#####################################################
+
+import json
+import hashlib
+from collections import defaultdict
+from .edit_uploader import submit_edits, merge_upload_summaries, print_upload_summary
+from .instrumentation import timed_request
+
+# System fields that are maintained by AGOL and never compared
+SYSTEM_FIELD_TYPES = {"esriFieldTypeOID", "esriFieldTypeGlobalID"}
+SYSTEM_FIELD_NAMES = {"shape__area", "shape__length", "creationdate", "creator", "editdate", "editor"}
+
+def _get(obj, name, default=None):
+    """
+    Reads a key from either a dictionary or an arcgis object (Feature, PropertyMap).
+    """
+    if isinstance(obj, dict):
+        return obj.get(name, default)
+    return getattr(obj, name, default)
+
+def _normalize_value(value, precision):
+    """
+    Normalizes a value so that the local and AGOL copies hash the same,
+    e.g. 5.0 and 5 are treated as equal and floats are rounded.
+    """
+    if isinstance(value, float):
+        if value != value: # NaN
+            return None
+        if value.is_integer():
+            return int(value)
+        return round(value, precision)
+    if isinstance(value, (list, tuple)):
+        return [_normalize_value(v, precision) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize_value(v, precision) for k, v in value.items() if k != "spatialReference"}
+    return value
+
+def feature_hash(attributes, geometry, compare_fields, precision):
+    """
+    Hashes a feature's compared attributes and its geometry.
+    """
+    payload = [
+        [_normalize_value(attributes.get(field), 9) for field in compare_fields],
+        _normalize_value(geometry, precision) if geometry else None
+    ]
+    return hashlib.sha1(json.dumps(payload, default=str).encode("utf-8")).hexdigest()
+
+def feature_key(attributes, key_fields):
+    """
+    Returns the (normalized) key of a feature, e.g. its FIDN.
+    """
+    return tuple(_normalize_value(attributes.get(field), 9) for field in key_fields)
+
+def get_compare_fields(layer_properties, local_fields):
+    """
+    Returns the layer's editable fields that are also present in the local
+    features, so fields AGOL ignores on upload are not compared.
+    """
+    compare_fields = []
+    for field in _get(layer_properties, "fields", []) or []:
+        field_name = _get(field, "name")
+        if _get(field, "type") in SYSTEM_FIELD_TYPES or field_name.lower() in SYSTEM_FIELD_NAMES:
+            continue
+        if field_name in local_fields:
+            compare_fields.append(field_name)
+    return compare_fields
+
+def fetch_layer_state(target_layer, key_fields, compare_fields, oid_field, out_sr=None, precision=3):
+    """
+    Fetches the key, object ID and feature hash of every feature in the layer.
+    Returns a dictionary of {key: [(hash, object ID), ...]}.
+    """
+    query_args = {
+        "where": "1=1",
+        "out_fields": ",".join(dict.fromkeys([oid_field] + list(key_fields) + compare_fields)),
+        "return_geometry": True
+    }
+    if out_sr:
+        query_args["out_sr"] = out_sr
+    with timed_request("agol_query"):
+        existing = target_layer.query(**query_args)
+
+    state = defaultdict(list)
+    for feature in _get(existing, "features", []):
+        attributes = _get(feature, "attributes", {}) or {}
+        geometry = _get(feature, "geometry")
+        key = feature_key(attributes, key_fields)
+        state[key].append((feature_hash(attributes, geometry, compare_fields, precision), attributes.get(oid_field)))
+    return state
+
+def diff_chunk(features, layer_state, key_fields, compare_fields, oid_field, precision=3):
+    """
+    Diffs a chunk of the new features against the layer state by key.
+    Features with an identical hash are left alone, changed features become
+    updates (carrying the AGOL object ID) and new keys become adds.
+    Duplicated keys are matched one to one. The AGOL records matched are
+    removed from layer_state, so once every chunk is diffed it holds the
+    records to delete.
+    Returns (adds, updates, unchanged count).
+    """
+    local_by_key = defaultdict(list)
+    for feature in features:
+        local_by_key[feature_key(feature["attributes"], key_fields)].append(feature)
+
+    adds, updates = [], []
+    unchanged = 0
+    for key, local_features in local_by_key.items():
+        remote = layer_state.get(key)
+        # A key AGOL doesn't have is always an add, without hashing the features
+        if not remote:
+            adds.extend(local_features)
+            continue
+
+        # Match identical features first, these need no edit
+        remote_hashes = defaultdict(list)
+        for remote_hash, object_id in remote:
+            remote_hashes[remote_hash].append(object_id)
+        changed = []
+        for feature in local_features:
+            local_hash = feature_hash(feature["attributes"], feature.get("geometry"), compare_fields, precision)
+            if remote_hashes.get(local_hash):
+                remote_hashes[local_hash].pop()
+                unchanged += 1
+            else:
+                changed.append(feature)
+        leftover = [(remote_hash, object_id) for remote_hash, object_ids in remote_hashes.items() for object_id in object_ids]
+
+        # Pair the remaining features with the remaining AGOL records as updates
+        for feature, (_, object_id) in zip(changed, leftover):
+            updates.append({"attributes": {**feature["attributes"], oid_field: object_id}, "geometry": feature.get("geometry")})
+        adds.extend(changed[len(leftover):])
+        if len(leftover) > len(changed):
+            layer_state[key] = leftover[len(changed):]
+        else:
+            del layer_state[key]
+
+    return adds, updates, unchanged
+
+def diff_features(features, layer_state, key_fields, compare_fields, oid_field, precision=3):
+    """
+    Diffs the new features against the layer state by key (see diff_chunk),
+    with keys that are gone becoming deletes. layer_state is left as it is.
+    Returns (adds, updates, deletes, unchanged count).
+    """
+    layer_state = {key: list(remote) for key, remote in layer_state.items()}
+    adds, updates, unchanged = diff_chunk(features, layer_state, key_fields, compare_fields, oid_field, precision)
+    deletes = [object_id for remote in layer_state.values() for _, object_id in remote]
+    return adds, updates, deletes, unchanged
+
+class DeltaSync:
+    """
+    Delta syncs features to an AGOL layer one chunk of Esri JSON features at
+    a time (see start_delta_sync): sync_chunk diffs a chunk against the
+    layer state fetched at the start and sends its adds and updates, and
+    finish deletes the AGOL records no chunk matched. Only the layer state
+    (keys, object IDs and hashes) is kept between chunks.
+    """
+    def __init__(self, target_layer, layer_state, key_fields, compare_fields, oid_field, precision, upload_options=None):
+        self.target_layer = target_layer
+        self.layer_state = layer_state
+        self.key_fields = list(key_fields)
+        self.compare_fields = compare_fields
+        self.oid_field = oid_field
+        self.precision = precision
+        self.upload_options = upload_options or {}
+        self.summary = {"adds": 0, "updates": 0, "deletes": 0, "unchanged": 0, "failed": 0}
+
+    def _submit(self, **edits):
+        upload_summary = submit_edits(self.target_layer, key_fields=self.key_fields, **edits, **self.upload_options)
+        self.summary["upload"] = merge_upload_summaries(self.summary.get("upload"), upload_summary)
+        self.summary["failed"] += len(upload_summary["failures"])
+
+    def sync_chunk(self, features):
+        """
+        Diffs one chunk of the new features and sends its adds and updates.
+        """
+        adds, updates, unchanged = diff_chunk(features, self.layer_state, self.key_fields, self.compare_fields, self.oid_field, self.precision)
+        self.summary["adds"] += len(adds)
+        self.summary["updates"] += len(updates)
+        self.summary["unchanged"] += unchanged
+        if adds or updates:
+            self._submit(adds=adds, updates=updates)
+
+    def finish(self):
+        """
+        Deletes the AGOL records that no chunk matched (only call it once
+        every chunk is synced) and returns the summary dictionary.
+        """
+        deletes = [object_id for remote in self.layer_state.values() for _, object_id in remote]
+        self.layer_state = {}
+        self.summary["deletes"] = len(deletes)
+        if deletes:
+            self._submit(deletes=deletes)
+        summary = self.summary
+        print(f"Delta: {summary['adds']} adds, {summary['updates']} updates, {summary['deletes']} deletes, {summary['unchanged']} unchanged.")
+        if "upload" in summary:
+            print_upload_summary("Delta sync", summary["upload"])
+        else:
+            print("AGOL layer is already up to date. No edits sent.")
+        return summary
+
+def start_delta_sync(target_layer, sample_features, key_fields=("FIDN",), precision=None, upload_options=None, layer_properties=None):
+    """
+    Fetches the key, object ID and feature hash of every feature in the layer
+    and returns a DeltaSync for sending the new features chunk by chunk.
+    sample_features (e.g. the first chunk) tell which fields are compared
+    and the spatial reference AGOL is queried in. Nothing is edited yet, so
+    the caller can still fall back to truncate and reload.
+    precision, upload_options and layer_properties are as for delta_sync_features.
+    Returns None if the layer can't be delta synced (e.g. it has no key field).
+    """
+    layer_properties = layer_properties or target_layer.properties
+    layer_fields = {_get(field, "name") for field in _get(layer_properties, "fields", []) or []}
+    missing_keys = [field for field in key_fields if field not in layer_fields]
+    if missing_keys:
+        print(f"Layer is missing key field(s) {missing_keys}. Delta sync not possible.")
+        return None
+
+    oid_field = _get(layer_properties, "objectIdField") or "OBJECTID"
+    local_fields = set()
+    for feature in sample_features:
+        local_fields.update(feature["attributes"].keys())
+    compare_fields = get_compare_fields(layer_properties, local_fields)
+
+    # Query AGOL in the same spatial reference as the new features
+    out_sr = None
+    for feature in sample_features:
+        geometry = feature.get("geometry") or {}
+        if geometry.get("spatialReference"):
+            out_sr = geometry["spatialReference"].get("wkid")
+            break
+    if precision is None:
+        precision = 7 if out_sr == 4326 else 3
+
+    print(f"Fetching current features and hashes from AGOL using key {list(key_fields)}...")
+    layer_state = fetch_layer_state(target_layer, key_fields, compare_fields, oid_field, out_sr=out_sr, precision=precision)
+    return DeltaSync(target_layer, layer_state, key_fields, compare_fields, oid_field, precision, upload_options)
+
+def delta_sync_features(target_layer, features, key_fields=("FIDN",), precision=None, upload_options=None, layer_properties=None):
+    """
+    Syncs a list of Esri JSON features to an AGOL feature layer by sending only the
+    adds, updates and deletes needed to make the layer match, keyed on key_fields.
+    Returns a summary dictionary, or None if the layer can't be delta synced
+    (e.g. it has no key field) so the caller can fall back to truncate and reload.
+    """
+    delta_sync = start_delta_sync(target_layer, features, key_fields, precision=precision, upload_options=upload_options,
+                                  layer_properties=layer_properties)
+    if delta_sync is None:
+        return None
+    delta_sync.sync_chunk(features)
+    return delta_sync.finish()
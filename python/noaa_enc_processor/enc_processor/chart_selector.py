@@ -0,0 +1,219 @@
+#####################################################
+##   CATALOG-DRIVEN ENC CHART SELECTION FOR THE    ##
+##         CONFIGURED WIND LEASE AREAS             ##
+#####################################################
+
+import os
+import xml.etree.ElementTree as ET
+from pathlib import Path
+import numpy as np
+import shapely
+import geopandas as gpd
+from .downloader import create_session, conditional_download, load_validators, save_validators, VALIDATORS_FILENAME
+
+NOAA_ENC_CATALOG_URL = "https://charts.noaa.gov/ENCs/ENCProdCat.xml"
+
+# ENC usage bands, encoded as the third character of the cell name (US4MA1CC = 4)
+USAGE_BANDS = {1: "Overview", 2: "General", 3: "Coastal", 4: "Approach", 5: "Harbor", 6: "Berthing"}
+
+def usage_band(cell_name):
+    """
+    Returns the usage band of an ENC cell from its name, or None.
+    """
+    band = cell_name[2:3]
+    return int(band) if band.isdigit() else None
+
+def _local_name(tag):
+    """
+    Strips any XML namespace from a tag name.
+    """
+    return tag.rsplit("}", 1)[-1].lower()
+
+def _child_text(element, name):
+    """
+    Returns the text of the first direct child called name, or None.
+    """
+    for child in element:
+        if _local_name(child.tag) == name:
+            return (child.text or "").strip()
+    return None
+
+def _coverage_polygon(cell):
+    """
+    Builds a cell's coverage from the lat/long vertices of its coverage
+    panels (<cov><panel><vertex>), merged into one (multi)polygon.
+    """
+    panels = []
+    for element in cell.iter():
+        if _local_name(element.tag) != "panel":
+            continue
+        vertices = []
+        for vertex in element:
+            if _local_name(vertex.tag) != "vertex":
+                continue
+            lat, lon = _child_text(vertex, "lat"), _child_text(vertex, "long")
+            if lat and lon:
+                vertices.append((float(lon), float(lat)))
+        if len(vertices) >= 3:
+            panels.append(shapely.make_valid(shapely.Polygon(vertices)))
+    if not panels:
+        return None
+    return shapely.union_all(panels)
+
+def read_enc_catalog(catalog_path, active_only=True):
+    """
+    Reads the NOAA ENC product catalog XML (ENCProdCat.xml) into a
+    GeoDataFrame with one row per cell: name, usage_band, cscale, status,
+    edtn, updn and its coverage polygon (EPSG:4326). The file is parsed
+    incrementally, so the whole XML tree is never held in memory.
+    Cells that are not "Active" (e.g. cancelled) are dropped if active_only.
+    """
+    records = []
+    for _, element in ET.iterparse(catalog_path, events=("end",)):
+        if _local_name(element.tag) != "cell":
+            continue
+        name = _child_text(element, "name")
+        status = _child_text(element, "status")
+        if name and (not active_only or (status or "").lower() == "active"):
+            cscale = _child_text(element, "cscale")
+            records.append({
+                "name": name,
+                "usage_band": usage_band(name),
+                "cscale": int(cscale) if cscale and cscale.isdigit() else None,
+                "status": status,
+                "edtn": _child_text(element, "edtn"),
+                "updn": _child_text(element, "updn"),
+                "geometry": _coverage_polygon(element)
+            })
+        element.clear()
+
+    catalog = gpd.GeoDataFrame(records, columns=["name", "usage_band", "cscale", "status", "edtn", "updn", "geometry"], geometry="geometry", crs="EPSG:4326")
+    return catalog[catalog.geometry.notnull()].reset_index(drop=True)
+
+def refresh_enc_catalog(catalog_path, url=NOAA_ENC_CATALOG_URL, timeout=120):
+    """
+    Updates the saved catalog from NOAA if it has changed (conditional
+    download). If NOAA can't be reached the saved copy is used as it is.
+    Returns True if a catalog file is available.
+    """
+    catalog_path = Path(catalog_path)
+    os.makedirs(catalog_path.parent, exist_ok=True)
+    validators_path = catalog_path.parent / VALIDATORS_FILENAME
+    validators = load_validators(validators_path)
+
+    session = create_session(pool_size=1)
+    try:
+        status, validator, bytes_written = conditional_download(session, url, catalog_path, validators.get(catalog_path.name), timeout=timeout)
+        if status == "downloaded":
+            validators[catalog_path.name] = validator
+            save_validators(validators, validators_path)
+            print(f"Downloaded the ENC product catalog ({bytes_written} bytes).")
+        else:
+            print("ENC product catalog has not changed.")
+    except Exception as e:
+        print(f"Could not refresh the ENC product catalog ({e}). Using the saved copy.")
+    finally:
+        session.close()
+    return catalog_path.exists()
+
+def load_lease_areas(lease_areas_path):
+    """
+    Reads the wind lease areas of interest (any format geopandas can read)
+    as valid EPSG:4326 geometries.
+    """
+    lease_areas = gpd.read_file(lease_areas_path)
+    if lease_areas.crs is not None:
+        lease_areas = lease_areas.to_crs(epsg=4326)
+    lease_areas = lease_areas[lease_areas.geometry.notnull() & ~lease_areas.geometry.is_empty]
+    lease_areas["geometry"] = shapely.make_valid(lease_areas.geometry.values)
+    return lease_areas
+
+def select_charts(catalog, lease_areas, usage_bands=(4, 5, 3, 2, 1, 6), min_coverage_fraction=1e-6):
+    """
+    Picks a small set of cells whose coverage intersects the lease areas.
+    An STRtree over the cell coverage polygons finds the candidate cells.
+    The cells are then chosen greedily (set cover): bands are tried in
+    usage_bands order (most preferred first), and within a band the cell
+    covering the most of the still-uncovered lease area is added until the
+    band has nothing more to add. Later bands only fill gaps the preferred
+    bands don't cover.
+    min_coverage_fraction is the share of the lease area a cell must add to
+    be selected, so slivers along cell edges don't pull in extra cells.
+    Returns the selected catalog rows, in the order they were picked.
+    """
+    lease_geometries = np.asarray(lease_areas.geometry.values, dtype=object)
+    if catalog.empty or len(lease_geometries) == 0:
+        return catalog.iloc[0:0]
+
+    # Candidate cells: any cell intersecting any lease area
+    tree = shapely.STRtree(catalog.geometry.values)
+    _, cell_index = tree.query(lease_geometries, predicate="intersects")
+    candidates = catalog.iloc[np.unique(cell_index)]
+
+    remaining = shapely.union_all(lease_geometries)
+    min_gain = remaining.area * min_coverage_fraction
+    selected = []
+    for band in usage_bands:
+        band_cells = candidates[candidates["usage_band"] == band]
+        positions = list(range(len(band_cells)))
+        band_geometries = band_cells.geometry.values
+        while positions and remaining.area > min_gain:
+            gains = shapely.area(shapely.intersection(band_geometries[positions], remaining))
+            best = int(np.argmax(gains))
+            if gains[best] <= min_gain:
+                break
+            position = positions.pop(best)
+            selected.append(band_cells.index[position])
+            remaining = remaining.difference(band_geometries[position])
+
+    total_area = shapely.union_all(lease_geometries).area
+    if total_area and remaining.area > min_gain:
+        print(f"Warning: {remaining.area / total_area:.1%} of the lease areas is not covered by any cell in usage bands {list(usage_bands)}.")
+
+    return catalog.loc[selected]
+
+def charts_for_lease_areas(catalog_path, lease_areas_path, fallback_charts, usage_bands=(4, 5, 3, 2, 1, 6), catalog_url=None,
+                           fallback_catalog_path=None):
+    """
+    Returns the chart ZIP file names to download: the cells selected from
+    the saved catalog for the lease areas (refreshing the catalog first if
+    catalog_url is set). Without a saved catalog, fallback_catalog_path (a
+    committed excerpt) is used. Falls back to fallback_charts (the
+    hand-maintained list) if no catalog or lease areas are found or
+    selection fails.
+    """
+    if not Path(lease_areas_path).exists():
+        print(f"No lease areas of interest found at {lease_areas_path}. Using the configured chart list.")
+        return list(fallback_charts)
+
+    try:
+        if catalog_url:
+            refresh_enc_catalog(catalog_path, url=catalog_url)
+        if not Path(catalog_path).exists() and fallback_catalog_path and Path(fallback_catalog_path).exists():
+            print(f"No saved ENC catalog found at {catalog_path}. Using the catalog excerpt {fallback_catalog_path}.")
+            catalog_path = fallback_catalog_path
+        if not Path(catalog_path).exists():
+            print(f"No saved ENC catalog found at {catalog_path}. Using the configured chart list.")
+            return list(fallback_charts)
+
+        catalog = read_enc_catalog(catalog_path)
+        lease_areas = load_lease_areas(lease_areas_path)
+        selected = select_charts(catalog, lease_areas, usage_bands=usage_bands)
+    except Exception as e:
+        print(f"Chart selection failed: {e}. Using the configured chart list.")
+        return list(fallback_charts)
+
+    if selected.empty:
+        print("No catalog cells intersect the lease areas. Using the configured chart list.")
+        return list(fallback_charts)
+
+    print(f"Selected {len(selected)} of {len(catalog)} active cells for {len(lease_areas)} lease areas:")
+    for _, cell in selected.iterrows():
+        print(f"     - {cell['name']} ({USAGE_BANDS.get(cell['usage_band'], 'Unknown')} band, 1:{cell['cscale']})")
+
+    chart_files = [f"{name}.zip" for name in sorted(selected["name"])]
+    added = sorted(set(chart_files) - set(fallback_charts))
+    dropped = sorted(set(fallback_charts) - set(chart_files))
+    if added or dropped:
+        print(f"Compared with the configured chart list: added {added}, dropped {dropped}.")
+    return chart_files
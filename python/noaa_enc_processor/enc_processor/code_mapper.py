@@ -4,113 +4,191 @@
 
 import pandas as pd
 import numpy as np
+import hashlib
+import json
 import os
+from pathlib import Path
 
-def map_column_codes(gdf, csv_path):
+# Compiled data dictionaries already loaded in this run, keyed by CSV content hash
+_compiled_dictionaries = {}
+
+def file_sha256(path):
+    """
+    Returns the SHA-256 hex digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compile_code_dictionary(csv_path):
+    """
+    Reads the data dictionary CSV and compiles it into a dictionary of
+    {column name: {code: value}}, with codes as clean strings.
+    """
+    # Read in the data dictionary csv, make sure code col is read as type string
+    mapping_df = pd.read_csv(csv_path, dtype={'code': str})
+
+    # Fix incorrect reading of csv 'code' column
+    # Pandas can read numeric-looking strings as float then cast to
+    # string, resulting in '19.0' instead of '19'. Clean this to
+    # ensures codes are clean strings (e.g., '19') before any maps are built.
+    mapping_df['code'] = mapping_df['code'].astype(str).str.replace(r'\.0$', '', regex=True)
+
+    return {
+        col_name: dict(zip(col_map_df['code'], col_map_df['value']))
+        for col_name, col_map_df in mapping_df.groupby('column_name', sort=False)
+    }
+
+def load_code_dictionary(csv_path, cache_dir=None):
+    """
+    Returns the compiled data dictionary for csv_path. The compiled dictionary
+    is kept in memory for the rest of the run and, if cache_dir is set, saved
+    to disk keyed by the CSV's content hash so later runs skip parsing the CSV.
+    """
+    csv_hash = file_sha256(csv_path)
+    if csv_hash in _compiled_dictionaries:
+        return _compiled_dictionaries[csv_hash]
+
+    cache_file = None
+    if cache_dir:
+        cache_file = Path(cache_dir) / f"code_dictionary_{csv_hash[:16]}.json"
+        if cache_file.exists():
+            try:
+                with open(cache_file, 'r', encoding='utf-8') as f:
+                    compiled = json.load(f)
+                _compiled_dictionaries[csv_hash] = compiled
+                return compiled
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not read cached data dictionary {cache_file.name}: {e}")
+
+    compiled = compile_code_dictionary(csv_path)
+    _compiled_dictionaries[csv_hash] = compiled
+
+    if cache_file:
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = cache_file.with_suffix('.tmp')
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(compiled, f)
+            os.replace(tmp_file, cache_file)
+        except OSError as e:
+            print(f"Warning: Could not cache data dictionary to {cache_file}: {e}")
+
+    return compiled
+
+def decode_multi_valued(series, string_map):
+    """
+    Splits, maps, and re-joins comma-separated string values (see column COLOUR
+    for an example) using whole-column operations. Only the distinct values are
+    decoded, so the cost grows with the number of distinct values, not rows.
+    Values not in string_map and nulls are kept as they are. Whole-number
+    cells (e.g. an object column of ints and None, as a streamed chunk with
+    missing values can hold) are looked up by their integer code.
+    """
+    uniques = []
+    numeric_lookup = {}
+    for value in pd.unique(series.dropna()):
+        if isinstance(value, str):
+            uniques.append(value)
+        elif isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool) and float(value).is_integer():
+            code = str(int(value))
+            if code in string_map:
+                numeric_lookup[value] = string_map[code]
+    if not uniques:
+        if numeric_lookup:
+            return series.map(numeric_lookup).where(series.isin(numeric_lookup.keys()), series)
+        return series
+
+    # Split each distinct value into one row per code, strip whitespace from each part
+    values = pd.Series(uniques)
+    parts = values.str.split(',').explode().str.strip()
+
+    # Map each code, keeping the original if not in dict. Convert to string.
+    decoded = parts.map(string_map).where(parts.isin(string_map.keys()), parts).astype(str)
+
+    # Join them back together
+    joined = decoded.groupby(level=0).agg(', '.join)
+    lookup = dict(zip(values, joined))
+    lookup.update(numeric_lookup)
+
+    return series.map(lookup).where(series.isin(lookup.keys()), series)
+
+def decode_categories(series, string_map):
+    """
+    Decodes a categorical column by decoding its categories (see
+    decode_multi_valued) instead of its rows. Categories that decode to the
+    same value are merged. Returns a categorical column.
+    """
+    if len(series.cat.categories) == 0:
+        return series
+    categories = pd.Series(series.cat.categories, dtype=object)
+    decoded_values, decoded_categories = pd.factorize(decode_multi_valued(categories, string_map))
+    codes = series.cat.codes.to_numpy()
+    new_codes = np.where(codes >= 0, decoded_values[codes], -1)
+    return pd.Series(pd.Categorical.from_codes(new_codes, categories=decoded_categories), index=series.index, name=series.name)
+
+def map_column_codes(gdf, csv_path, cache_dir=None):
     """
     Replaces coded values in a GeoDataFrame with string values from a mapping CSV.
     Handles both single values and comma-separated string values.
+    Columns are replaced in place on gdf (no full copy is made), and the same
+    GeoDataFrame is returned.
     """
     print(f"Applying code-to-value mapping from {os.path.basename(csv_path)}...")
     try:
-        # Read in the data dictionary csv, make sure code col is read as type string
-        mapping_df = pd.read_csv(csv_path, dtype={'code': str}, engine='python')
+        code_dictionary = load_code_dictionary(csv_path, cache_dir=cache_dir)
     except FileNotFoundError:
         print("Error: Mapping file not found. Aborting mapping.")
         return gdf
 
-    # Fix incorrect reading of csv 'code' column
-    # Pandas can read numeric-looking strings as float then cast to
-    # string, resulting in '19.0' instead of '19'. Clean this to 
-    # ensures codes are clean strings (e.g., '19') before any maps are built.
-    mapping_df['code'] = mapping_df['code'].astype(str).str.replace(r'\.0$', '', regex=True)
-
-    mapping_dict = {}
-    # Loop through each unique column name found in the mapping CSV
-    for col_name in mapping_df['column_name'].unique():
+    # Loop through each column name found in the mapping CSV
+    for col_name, string_code_map in code_dictionary.items():
         # Check if the column exists in the GDF
         if col_name not in gdf.columns:
             print(f"Column {col_name} from CSV not in GDF. Skipping.")
             continue
 
         target_dtype = gdf[col_name].dtype
-        col_map_df = mapping_df[mapping_df['column_name'] == col_name].copy()
-        
-        # Keep a version of the codes as strings for object/string mapping
-        # This is crucial for the comma-separated values
-        string_code_map = pd.Series(
-            col_map_df.value.values, index=col_map_df.code
-        ).to_dict()
-        
+
+        # Categorical columns (see dtype_compactor.py): decode each category once
+        if isinstance(target_dtype, pd.CategoricalDtype):
+            print(f"Applying category-based mapping to {col_name}...")
+            gdf[col_name] = decode_categories(gdf[col_name], string_code_map)
+            continue
+
+        # If the target column is a string/object type, use the split-and-map logic
+        if target_dtype == 'object':
+            print(f"Applying string-based mapping to {col_name}...")
+            # Use the string map, which guarantees string keys ('11', '14', etc.)
+            gdf[col_name] = decode_multi_valued(gdf[col_name], string_code_map)
+            continue
+
         # Robust type handling for non-string columns
+        codes = pd.Series(list(string_code_map.keys()))
+        values = pd.Series(list(string_code_map.values()))
         if np.issubdtype(target_dtype, np.number):
-            col_map_df['code'] = pd.to_numeric(col_map_df['code'], errors='coerce')
-            col_map_df.dropna(subset=['code'], inplace=True)
+            codes = pd.to_numeric(codes, errors='coerce')
+            values = values[codes.notna()]
+            codes = codes.dropna()
             try:
-                col_map_df['code'] = col_map_df['code'].astype(target_dtype)
+                codes = codes.astype(target_dtype)
             except (ValueError, TypeError):
                 print(f"Warning: Type conversion failed for {col_name} numeric. Skipping.")
                 continue
-        elif target_dtype != 'object':
-             # Handle other types if necessary, e.g., boolean
+        else:
+            # Handle other types if necessary, e.g., boolean
             try:
-                col_map_df['code'] = col_map_df['code'].astype(target_dtype)
+                codes = codes.astype(target_dtype)
             except (ValueError, TypeError):
                 print(f"Warning: Type conversion failed for {col_name} non-object. Skipping.")
                 continue
 
-        # Create the specific mapping for this column
-        # If target is object, index will be strings (e.g., '11', '14')
+        # Otherwise, use the standard (faster) replace method
         # If target is int, index will be int (e.g., 11, 14)
-        col_map = pd.Series(
-            col_map_df.value.values, index=col_map_df.code
-        ).to_dict()
-        
-        # Store both the potentially type-converted map and the pure string map
-        mapping_dict[col_name] = {
-            'map': col_map,
-            'string_map': string_code_map, # Used for comma-separated strings
-            'dtype': target_dtype
-        }
-        
-        print(f"Success: Prepared mapping for column {col_name}.")
-
-    gdf_copy = gdf.copy()
-
-    # Define a helper function for string mapping
-    def map_string_values(cell_value, string_mapping_dict):
-        """
-        Helper to split, map, and re-join comma-separated string values.
-        See column COLOUR for example of comma-separated string values in data.
-        """
-        if pd.isna(cell_value) or not isinstance(cell_value, str):
-            return cell_value
-        
-        # Split the string, strip whitespace from each part
-        split_values = [v.strip() for v in cell_value.split(',')]
-        
-        # Map each value, keeping original if not in dict. Convert to string.
-        mapped_values = [str(string_mapping_dict.get(v, v)) for v in split_values]
-        
-        # Join them back together
-        return ', '.join(mapped_values)
-
-    # Iterate through the prepared mappings and apply them
-    for col_name, maps in mapping_dict.items():
-        if col_name not in gdf_copy.columns:
-            continue
-            
-        # If the target column is a string/object type, use the split-and-map logic
-        if maps['dtype'] == 'object':
-            print(f"Applying string-based mapping to {col_name}...")
-            # Use the string_map, which guarantees string keys ('11', '14', etc.)
-            gdf_copy[col_name] = gdf_copy[col_name].apply(
-                lambda x: map_string_values(x, maps['string_map'])
-            )
-        else:
-            # Otherwise, use the standard (faster) replace method
-            print(f"Applying standard mapping to {col_name}...")
-            gdf_copy[col_name] = gdf_copy[col_name].replace(maps['map'])
-    
+        print(f"Applying standard mapping to {col_name}...")
+        gdf[col_name] = gdf[col_name].replace(dict(zip(codes, values)))
+
     print("Mapping complete.")
-    return gdf_copy
\ No newline at end of file
+    return gdf
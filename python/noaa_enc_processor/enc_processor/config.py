@@ -16,6 +16,106 @@ charts_to_download = ["US4NY1BY.zip", "US4RI1CB.zip", "US4MA1CC.zip", "US4MA1CD.
 base_dir = Path(__file__).resolve().parent.parent.parent.parent
 target_folder_path = base_dir / "data-raw" / "ENC"
 
+# Number of charts downloaded at the same time
+download_workers = int(os.getenv("ENC_DOWNLOAD_WORKERS", 4))
+
+# How ENC features are sent to AGOL: "delta" (only changes, keyed on sync_key)
+# or "truncate" (clear the layer and reload every feature)
+upload_mode = os.getenv("ENC_UPLOAD_MODE", "delta")
+
+# Settings for the chunked, concurrent AGOL uploads (see edit_uploader.submit_edits)
+upload_options = {
+    "chunk_size": int(os.getenv("AGOL_UPLOAD_CHUNK_SIZE", 1000)), # Max features per edit_features request
+    "max_workers": int(os.getenv("AGOL_UPLOAD_WORKERS", 4)), # Requests sent at the same time
+    "max_retries": int(os.getenv("AGOL_UPLOAD_RETRIES", 3)), # Retries per request, with exponential backoff
+    "max_payload_bytes": 5_000_000 # Max serialized features per request
+}
+
+# Folder for files reused between runs (compiled data dictionary, etc.)
+cache_dir = base_dir / ".cache"
+
+# Wind lease areas of interest (polygons in any format geopandas can read). The
+# committed file outlines each wind farm's charted turbines and substations (1 km
+# around them); add lease area outlines to also select the cells covering those
+lease_areas_path = Path(os.getenv("LEASE_AREAS_PATH", base_dir / "data" / "lease_areas_of_interest.geojson"))
+
+# How the charts to download are chosen: "catalog" selects the cells covering the
+# lease areas of interest from the NOAA ENC product catalog (falling back to
+# charts_to_download if the catalog or lease areas are missing), "list" always
+# uses charts_to_download. Defaults to "catalog" once the lease areas file exists
+chart_selection = os.getenv("ENC_CHART_SELECTION", "catalog" if lease_areas_path.exists() else "list")
+
+# Saved copy of the NOAA ENC product catalog, refreshed from enc_catalog_url when
+# it has changed. Set ENC_CATALOG_URL="" to work offline from the saved copy
+enc_catalog_path = Path(os.getenv("ENC_CATALOG_PATH", cache_dir / "ENCProdCat.xml"))
+enc_catalog_url = os.getenv("ENC_CATALOG_URL", "https://charts.noaa.gov/ENCs/ENCProdCat.xml")
+# Committed excerpt of the catalog (the cells in charts_to_download), used when
+# there is no saved copy and NOAA can't be reached
+enc_catalog_excerpt_path = base_dir / "data" / "ENCProdCat_excerpt.xml"
+
+# ENC usage bands in order of preference, 4 = Approach, 5 = Harbor, 3 = Coastal, etc.
+chart_usage_bands = [4, 5, 3, 2, 1, 6]
+
+# Number of worker processes used to extract features from the ENC charts
+# Set ENC_EXTRACTION_WORKERS=1 to process the charts one at a time
+extraction_workers = int(os.getenv("ENC_EXTRACTION_WORKERS", min(4, os.cpu_count() or 1)))
+
+# Set ENC_STREAMING=1 to spill each chart's extracted layers to a GeoParquet
+# staging store on disk and process them in chunks of staging_chunk_size rows,
+# keeping memory use flat however many charts are processed
+streaming_extraction = os.getenv("ENC_STREAMING", "0") == "1"
+staging_dir = cache_dir / "staging"
+staging_chunk_size = int(os.getenv("ENC_STAGING_CHUNK_SIZE", 50000))
+
+# Sharded runs for large chart sets (shard_store.py): "main.py --shard i/N" extracts
+# and maps shard i of N's charts into shard_dir, and "main.py --reduce" merges every
+# shard's partial files and updates AGOL. Shards run on other machines must have their
+# shard-* folders copied into shard_dir first. "main.py --local-shards N" runs N shards
+# as local processes, then the reduce step
+shard_dir = Path(os.getenv("ENC_SHARD_DIR", cache_dir / "shards"))
+# Names one sharded run (main.py --run-id): every shard writes it into its manifest and
+# the reduce step only merges shards of that run, so shards left over from an earlier
+# run are never reduced. Required for --shard and --reduce; --local-shards makes one up
+shard_run_id = os.getenv("ENC_SHARD_RUN_ID", "")
+
+# USCG light list ingestion (light_list.py): wind turbine and substation lights
+# from the light lists of these Coast Guard districts, written to uscg_msi_struct.gdb
+light_list_dir = base_dir / "data-raw"
+light_list_output_path = base_dir / "data" / "uscg_msi_struct.gdb"
+light_list_districts = ["D01", "D05"]
+light_list_workers = int(os.getenv("LIGHT_LIST_WORKERS", 4))
+
+# History of each run's final turbine, substation and boulder features, partitioned
+# by run date (committed with the ENC data by the update workflow).
+# Set ENC_SNAPSHOTS=0 to stop recording snapshots
+snapshots_enabled = os.getenv("ENC_SNAPSHOTS", "1") == "1"
+snapshot_dir = Path(os.getenv("ENC_SNAPSHOT_DIR", base_dir / "data" / "snapshots"))
+
+# Run options for processing the ENC layers and updating AGOL (see processor.PROCESSING_DEFAULTS)
+processing_options = {
+    "max_workers": extraction_workers,
+    "cache_dir": cache_dir,
+    "upload_mode": upload_mode,
+    "upload_options": upload_options,
+    "streaming": streaming_extraction,
+    "staging_dir": staging_dir,
+    "chunk_size": staging_chunk_size,
+    "snapshot_dir": snapshot_dir if snapshots_enabled else None
+}
+
+# JSON run report with a timing span per stage, chart and layer and the run's counts
+# (bytes downloaded, features read/uploaded, AGOL requests and latency)
+run_report_path = Path(os.getenv("ENC_RUN_REPORT_PATH", cache_dir / "run_report.json"))
+# Set ENC_PROFILE=cprofile, tracemalloc or cprofile,tracemalloc to also profile the run
+# (cProfile stats are saved next to the run report)
+profile_modes = os.getenv("ENC_PROFILE", "")
+
+# Workflow stages run at the same time (main.WORKFLOW_STAGES). Set WORKFLOW_STAGES
+# (or pass --stages) to a comma separated list to run only those stages, e.g.
+# WORKFLOW_STAGES=update_boulder_layer,update_light_list_structures
+workflow_workers = int(os.getenv("WORKFLOW_WORKERS", 4))
+workflow_stages = os.getenv("WORKFLOW_STAGES", "")
+
 # Get AGOL item ID credentials securely using os.getenv()
 turbine_agol_id = os.getenv("TURBINE_ITEM_ID")
 #buoy_agol_id = os.getenv("BUOY_ITEM_ID")
@@ -31,36 +131,76 @@ extraction_features = {
         "layer_name": "LNDMRK", # Name of ENC landmark layer
         "filter_col": "CATLMK",
         "filter_val": "19",  # Turbines are 19 catlmk
+        # Attribute columns to read from the ENC, None reads all columns. Every LNDMRK
+        # attribute is a field of the AGOL layer (S57_ENC_Object_Definitions_LNDMRK.csv)
+        "columns": None,
         "output_name": "NOAA_ENC_WTG",
         "agol_item_id": turbine_agol_id,
         "agol_layer_index": 0,
-        "mapping_csv": data_dict_csv_path},
+        "sync_key": "FIDN", # Stable key used to delta sync the AGOL layer
+        # Merge duplicates from overlapping cells: same key, or from different cells within distance_m metres
+        "dedup": {"key": "FIDN", "distance_m": 25},
+        "mapping_csv": data_dict_csv_path,
+        # Post-processing rules, run in order after code mapping (see feature_rules.py)
+        "post_processing": [
+            # Fill blank OBJNAMs by FIDN ("Project Name WTG ID")
+            {"rule": "fill_by_key", "column": "OBJNAM", "key": "FIDN", "values": {
+                69282477: "Sunrise Wind WTG AR16",
+                36834519: "Block Island Wind Farm WTG WTG-5",
+                36834553: "Block Island Wind Farm WTG WTG-3",
+                36834504: "Block Island Wind Farm WTG WTG-4",
+                36834554: "Block Island Wind Farm WTG WTG-1",
+                36834514: "Block Island Wind Farm WTG WTG-2"}},
+            # Split OBJNAM into project name and wind turbine ID
+            {"rule": "split", "column": "OBJNAM", "pattern": " WTG ", "into": ["PROJECT", "WIND_TURBINE_ID"]},
+            # Light support = Under construction/operational, blank or anything else = proposed
+            {"rule": "derive", "column": "FUNCTN", "output": "CONSTRUCTION_STATUS",
+             "values": {"light support": "Under Construction/Operational"}, "default": "Proposed"}
+        ]},
 
     # "Submarine_Cables":{
     #     "layer_name": "CBLSUB", # Name of ENC submarine cable layer  
     #     "filter_col": "CATCBL",
     #     "filter_val": 1, # Power cables are 1 catcbl
+    #     "columns": None,
     #     "output_name": "NOAA_ENC_PowerCables",
     #      "agol_item_id": cable_agol_id,
     #      "agol_layer_index": 0,
+    #      "sync_key": "FIDN",
+    #      # No dedup: cables are split at cell edges, so a FIDN in two cells is two pieces of one cable
     #      "mapping_csv": data_dict_csv_path},
     
     "Offshore_Substations":{
         "layer_name": "OFSPLF", # Name of ENC offshore substation layer  
         "filter_col": None, # No filter for substations
         "filter_val": None,
+        "columns": None, # Every OFSPLF attribute is a field of the AGOL layer (S57_ENC_Object_Definitions_OFSPLF.csv)
         "output_name": "NOAA_ENC_OSS",
         "agol_item_id": substation_agol_id,
         "agol_layer_index": 0,
-        "mapping_csv": data_dict_csv_path},
+        "sync_key": "FIDN",
+        "dedup": {"key": "FIDN", "distance_m": 25},
+        "mapping_csv": data_dict_csv_path,
+        "post_processing": [
+            # Filter out observation platforms
+            {"rule": "exclude", "column": "CATOFP", "values": ["observation/research platform"]},
+            # Fill blank OBJNAMs by FIDN ("Project Name OSS ID")
+            {"rule": "fill_by_key", "column": "OBJNAM", "key": "FIDN", "values": {
+                102474376: "Coastal Virginia Offshore Substation OSS T3G15"}},
+            # Split OBJNAM into project name and substation ID
+            {"rule": "split", "column": "OBJNAM", "pattern": r" PROD | Offshore Substation OSS ", "into": ["PROJECT", "OSS_ID"]}
+        ]},
 
     # "Buoys":{
     #     "layer_name": "BOYSPP", # Name of ENC buoy layer 
     #     "filter_col": None, # Could filter using "CATSPM", need to determine correct filter values
     #     "filter_val": None,
+    #     "columns": None,
     #     "output_name": "NOAA_ENC_Buoys",
     #     "agol_item_id": buoy_agol_id,
     #     "agol_layer_index": 0,
+    #     "sync_key": "FIDN",
+    #     "dedup": {"key": "FIDN", "distance_m": 25},
     #     "mapping_csv": data_dict_csv_path},
 }
 
@@ -76,4 +216,17 @@ item_id_csv_map = {
     #buoy_agol_id: buoy_csv_path,
     #cable_agol_id: cable_csv_path,
     substation_agol_id: substation_csv_path
-}
\ No newline at end of file
+}
+
+# Field definition updates: hashes of the definitions applied to each layer are kept here,
+# and layers whose CSV hasn't changed are skipped without calling AGOL.
+# Set FIELD_UPDATER_FORCE=1 to check every layer against AGOL (e.g. after hand edits)
+field_definition_state_path = cache_dir / "field_definitions.json"
+field_updater_workers = int(os.getenv("FIELD_UPDATER_WORKERS", 4))
+field_updater_force = os.getenv("FIELD_UPDATER_FORCE", "0") == "1"
+
+# Stable AGOL layer facts (URL, spatial reference, field schema) are cached here between
+# runs for agol_metadata_ttl_hours (long enough to carry over to the next weekly run).
+# Set AGOL_METADATA_TTL_HOURS=0 to always read them from AGOL
+agol_metadata_cache_path = cache_dir / "agol_metadata.json"
+agol_metadata_ttl_hours = float(os.getenv("AGOL_METADATA_TTL_HOURS", 24 * 8))
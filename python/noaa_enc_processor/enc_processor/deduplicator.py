@@ -0,0 +1,132 @@
+#####################################################
+##   MERGE DUPLICATE FEATURES FROM OVERLAPPING     ##
+##        ENC CELLS AND USAGE BANDS                ##
+#####################################################
+
+# Overlapping cells (e.g. US5RI1BE and the US4RI cells) can each chart the
+# same structure, either with the same FIDN or as separate records a few
+# metres apart. Features are clustered by key and by distance (STRtree
+# query, O(n log n)) and each cluster keeps the record(s) from the most
+# detailed cell.
+
+import numpy as np
+import pandas as pd
+import shapely
+from .chart_selector import usage_band
+
+def _find(parents, index):
+    """
+    Finds the root of index in the union-find parents array (with path halving).
+    """
+    while parents[index] != index:
+        parents[index] = parents[parents[index]]
+        index = parents[index]
+    return index
+
+def cluster_pairs(count, pairs):
+    """
+    Groups count items into clusters from (i, j) pairs of matching items.
+    Returns an array with a cluster label (its root item) for every item.
+    """
+    parents = list(range(count))
+    for i, j in pairs:
+        root_i, root_j = _find(parents, i), _find(parents, j)
+        if root_i != root_j:
+            parents[max(root_i, root_j)] = min(root_i, root_j)
+    return np.array([_find(parents, index) for index in range(count)], dtype=np.int64)
+
+def key_pairs(gdf, key_field):
+    """
+    Pairs every feature with the first feature sharing its key (e.g. FIDN).
+    """
+    positions = np.arange(len(gdf))
+    first = pd.Series(positions).groupby(gdf[key_field].to_numpy(), dropna=True).transform("first")
+    matched = first.notna().to_numpy() & (first.to_numpy() != positions)
+    return list(zip(first[matched].astype(np.int64).tolist(), positions[matched].tolist()))
+
+def distance_pairs(geometries, sources, distance_m):
+    """
+    Finds pairs of features from different cells within distance_m of each
+    other (in the units of the geometries) using an STRtree.
+    """
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate="dwithin", distance=distance_m)
+
+    # Each pair once, and only across cells: a single cell never charts a structure twice
+    keep = (left < right) & (sources[left] != sources[right])
+    return list(zip(left[keep].tolist(), right[keep].tolist()))
+
+def deduplicate_features(gdf, key_field=None, distance_m=None, name=""):
+    """
+    Merges duplicate features: features sharing key_field (e.g. FIDN) and, if
+    distance_m is set, features from different cells within distance_m metres
+    are clustered together. With distance_m set, features sharing a key but
+    further apart than distance_m are kept as separate features. Each cluster keeps the features from its most
+    detailed cell (highest usage band, then first in chart order) and drops
+    the rest.
+    Returns (deduplicated GeoDataFrame, report DataFrame), where the report
+    lists each dropped feature, the cell it came from and the kept feature
+    and cell it was merged into.
+    """
+    report_columns = ["dropped_key", "dropped_source", "kept_key", "kept_source", "distance_m"]
+    gdf = gdf.reset_index(drop=True)
+    if gdf.empty or "source_file" not in gdf.columns:
+        return gdf, pd.DataFrame(columns=report_columns)
+
+    if key_field and key_field not in gdf.columns:
+        print(f"[{name}] Warning: Key column '{key_field}' is missing. Deduplicating by distance only.")
+        key_field = None
+
+    # Measure distances in metres (UTM)
+    projected = gdf.geometry.to_crs(gdf.estimate_utm_crs()).values if gdf.crs else gdf.geometry.values
+    sources = gdf["source_file"].to_numpy()
+
+    pairs = []
+    if key_field:
+        matches = key_pairs(gdf, key_field)
+        if distance_m and matches:
+            # The same key far apart is two different structures (FIDNs are not
+            # always unique across cells), keep both
+            left, right = np.array(matches).T
+            apart = shapely.distance(projected[left], projected[right]) > distance_m
+            for i, j in zip(left[apart].tolist(), right[apart].tolist()):
+                print(f"[{name}] Warning: {key_field} {gdf[key_field].iloc[i]} is used by features {shapely.distance(projected[i], projected[j]):.0f} m apart "
+                      f"({sources[i]}, {sources[j]}). Keeping both.")
+            matches = list(zip(left[~apart].tolist(), right[~apart].tolist()))
+        pairs.extend(matches)
+    if distance_m:
+        pairs.extend(distance_pairs(projected, sources, distance_m))
+    if not pairs:
+        print(f"[{name}] No duplicate features found.")
+        return gdf, pd.DataFrame(columns=report_columns)
+
+    # Rank every feature: most detailed usage band first, then chart order
+    bands = gdf["source_file"].map(lambda source: usage_band(str(source)) or 0).to_numpy()
+    rank = np.empty(len(gdf), dtype=np.int64)
+    rank[np.lexsort((np.arange(len(gdf)), -bands))] = np.arange(len(gdf))
+
+    # Keep the features of each cluster's best ranked cell
+    clusters = cluster_pairs(len(gdf), pairs)
+    best = pd.Series(rank).groupby(clusters).transform("idxmin").to_numpy()
+    keep = sources == sources[best]
+    if key_field:
+        # A key kept twice within the same cluster and cell is still a duplicate
+        kept_keys = pd.Series(list(zip(clusters, gdf[key_field]))).where(keep & gdf[key_field].notna().to_numpy())
+        keep &= ~(kept_keys.duplicated() & kept_keys.notna()).to_numpy()
+
+    dropped = np.flatnonzero(~keep)
+    kept_for_dropped = best[dropped]
+    keys = gdf[key_field].to_numpy() if key_field else np.full(len(gdf), None)
+    report = pd.DataFrame({
+        "dropped_key": keys[dropped],
+        "dropped_source": sources[dropped],
+        "kept_key": keys[kept_for_dropped],
+        "kept_source": sources[kept_for_dropped],
+        "distance_m": shapely.distance(projected[dropped], projected[kept_for_dropped]).round(2)
+    }, columns=report_columns)
+
+    print(f"[{name}] Deduplication complete. {len(dropped)} features removed. {int(keep.sum())} features retained.")
+    if len(report):
+        print(f"[{name}] Duplicates merged into the feature from the most detailed cell:")
+        print(report.to_string(index=False))
+    return gdf[keep].reset_index(drop=True), report
@@ -3,30 +3,41 @@
 #############################################
 
 import os
+import json
+import queue
+import tempfile
 import requests
-from pathlib import Path 
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from .instrumentation import span, add_count, set_attribute, submit
+
+NOAA_ENC_BASE_URL = "https://charts.noaa.gov/ENCs/"
+
+# Name of the file (in the download folder) storing each chart's ETag/Last-Modified
+VALIDATORS_FILENAME = "chart_validators.json"
 
 def download_charts_to_disk(target_filenames, destination_folder):
     """
     Downloads a list of charts from NOAA, overwriting any existing files.
     """
-    base_url = "https://charts.noaa.gov/ENCs/"
+    base_url = NOAA_ENC_BASE_URL
     # Ensure destination_folder is a Path object for modern path handling
     destination_folder = Path(destination_folder)
     os.makedirs(destination_folder, exist_ok=True)
-    
+
     print(f"--- Starting Download Process --- Saving files to: {destination_folder}.")
-    
+
     for filename in target_filenames:
         file_url = f"{base_url}{filename}"
         output_filepath = destination_folder / filename
-        
+
         # Check if file exists
         if output_filepath.exists():
             print(f"{filename} exists. Overwriting with the latest version...")
         else:
             print(f"Downloading new file: {filename}...")
-            
+
         try:
             with requests.get(file_url, stream=True) as response:
                 response.raise_for_status() # Raise an exception for bad status codes
@@ -36,5 +47,210 @@ def download_charts_to_disk(target_filenames, destination_folder):
             print(f"Successfully saved {filename}.")
         except requests.exceptions.RequestException as e:
             print(f"Failed to download {filename}. Error: {e}.")
-            
-    print("--- Download complete! ---")
\ No newline at end of file
+
+    print("--- Download complete! ---")
+
+def create_session(pool_size=4):
+    """
+    Creates a requests Session whose connection pool can serve pool_size
+    concurrent downloads from the same host.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+def load_validators(validators_path):
+    """
+    Loads the stored {filename: {"etag": ..., "last_modified": ...}} validators.
+    Returns an empty dictionary if there are none yet or the file can't be read.
+    """
+    try:
+        with open(validators_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read download validators from {validators_path}: {e}")
+        return {}
+
+def save_validators(validators, validators_path):
+    """
+    Writes the validators to disk through a temp file (unique per writer, as
+    shards of a sharded run save at the same time) so a crash never leaves
+    a half-written validators file behind.
+    """
+    validators_path = Path(validators_path)
+    fd, tmp_path = tempfile.mkstemp(dir=validators_path.parent, prefix=f".{validators_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(validators, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, validators_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def conditional_download(session, url, output_filepath, validator=None, timeout=60, chunk_size=1024 * 1024):
+    """
+    Downloads url to output_filepath unless the server reports it unchanged.
+    Sends If-None-Match/If-Modified-Since from validator when the file is
+    already on disk, and writes to a temp file in the same folder that is only
+    renamed over output_filepath once the download has fully succeeded.
+    Returns a (status, new validator, bytes written) tuple, where status is
+    "downloaded" or "unchanged".
+    """
+    output_filepath = Path(output_filepath)
+    headers = {}
+    # Only ask for a conditional response if there is a local copy to keep
+    if validator and output_filepath.exists():
+        if validator.get("etag"):
+            headers["If-None-Match"] = validator["etag"]
+        if validator.get("last_modified"):
+            headers["If-Modified-Since"] = validator["last_modified"]
+
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if response.status_code == 304:
+            return "unchanged", validator, 0
+        response.raise_for_status() # Raise an exception for bad status codes
+
+        bytes_written = 0
+        fd, tmp_path = tempfile.mkstemp(dir=output_filepath.parent, prefix=f".{output_filepath.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):  # Download in chunks
+                    f.write(chunk)
+                    bytes_written += len(chunk)
+            os.replace(tmp_path, output_filepath)
+        except BaseException:
+            # Never leave a partial file behind or replace the good copy
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        new_validator = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified")
+        }
+        return "downloaded", new_validator, bytes_written
+
+def _download_chart(session, url, output_filepath, validator=None):
+    """
+    conditional_download timed as a "download_chart" span, with the bytes
+    downloaded counted for the run report.
+    """
+    with span("download_chart", chart=Path(output_filepath).name):
+        status, new_validator, bytes_written = conditional_download(session, url, output_filepath, validator)
+        set_attribute("status", status)
+        add_count("bytes_downloaded", bytes_written)
+        return status, new_validator, bytes_written
+
+class ChartFeed:
+    """
+    Hands chart file names from the download stage to the extraction stage
+    as each chart is ready on disk, so charts can be extracted while others
+    are still downloading. The download side calls put() per chart and
+    close() when it is done (or has failed).
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, filename):
+        self._queue.put(filename)
+
+    def close(self):
+        self._queue.put(None)
+
+    def charts(self, target_filenames, destination_folder):
+        """
+        Yields the target charts as they are put. Once the feed is closed,
+        target charts that were never put but are on disk from an earlier
+        run are yielded too, as a sequential run would have processed them.
+        """
+        targets = list(dict.fromkeys(target_filenames))
+        remaining = set(targets)
+        while remaining:
+            filename = self._queue.get()
+            if filename is None:
+                break
+            if filename in remaining:
+                remaining.discard(filename)
+                yield filename
+        for filename in targets:
+            if filename in remaining and (Path(destination_folder) / filename).exists():
+                yield filename
+
+def sync_charts_to_disk(target_filenames, destination_folder, max_workers=4, base_url=NOAA_ENC_BASE_URL, session=None, on_chart_ready=None):
+    """
+    Downloads a list of charts from NOAA, max_workers at a time, skipping charts that
+    haven't changed (304 Not Modified). A failed download never replaces the chart on disk.
+    on_chart_ready is called with each chart's file name as soon as it is on disk.
+    Returns a dictionary of {filename: "downloaded" | "unchanged" | "failed"}.
+    """
+    # Ensure destination_folder is a Path object for modern path handling
+    destination_folder = Path(destination_folder)
+    os.makedirs(destination_folder, exist_ok=True)
+    validators_path = destination_folder / VALIDATORS_FILENAME
+    validators = load_validators(validators_path)
+
+    print(f"--- Starting Download Process --- Syncing files to: {destination_folder}.")
+
+    own_session = session is None
+    if own_session:
+        session = create_session(pool_size=max_workers)
+
+    statuses = {}
+    updated = {}
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                submit(
+                    executor,
+                    _download_chart,
+                    session,
+                    f"{base_url}{filename}",
+                    destination_folder / filename,
+                    validators.get(filename)
+                ): filename
+                for filename in target_filenames
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                try:
+                    status, validator, bytes_written = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    print(f"Failed to download {filename}. Error: {e}.")
+                    statuses[filename] = "failed"
+                    if on_chart_ready and (destination_folder / filename).exists():
+                        on_chart_ready(filename)
+                    continue
+
+                statuses[filename] = status
+                if status == "unchanged":
+                    print(f"{filename} has not changed. Skipping download.")
+                else:
+                    updated[filename] = validator
+                    print(f"Successfully saved {filename} ({bytes_written} bytes).")
+                if on_chart_ready:
+                    on_chart_ready(filename)
+    finally:
+        if own_session:
+            session.close()
+
+    try:
+        # Re-read first: other shards of a sharded run may have saved theirs since
+        validators = load_validators(validators_path)
+        validators.update(updated)
+        save_validators(validators, validators_path)
+    except OSError as e:
+        print(f"Warning: Could not save download validators to {validators_path}: {e}")
+
+    downloaded = sum(1 for status in statuses.values() if status == "downloaded")
+    unchanged = sum(1 for status in statuses.values() if status == "unchanged")
+    failed = sum(1 for status in statuses.values() if status == "failed")
+    add_count("charts_downloaded", downloaded)
+    add_count("charts_unchanged", unchanged)
+    add_count("charts_failed", failed)
+    print(f"--- Download complete! {downloaded} downloaded, {unchanged} unchanged, {failed} failed ---")
+    return statuses
@@ -0,0 +1,134 @@
+#####################################################
+##   COMPACT DTYPES FOR EXTRACTED ENC FEATURES     ##
+#####################################################
+
+# Every S-57 attribute is read as a 64-bit number or a Python object column,
+# although most text attributes (COLOUR, CATLMK, FUNCTN, source_file, ...)
+# repeat a handful of values across thousands of features. compact_dtypes
+# stores those columns as categoricals (each distinct value held once, plus
+# a small integer code per row) and downcasts the S-57 record fields to the
+# smallest integer type that holds them. Code mapping (code_mapper.py) and
+# Esri JSON encoding (esri_encoder.py) then work once per distinct value.
+
+import pandas as pd
+from pandas.api.types import infer_dtype
+
+# Integer S-57 record fields to downcast. PRIM and AGEN are left out: the data
+# dictionary decodes them to text, matching codes against the column's dtype.
+INTEGER_FIELDS = ["RCID", "FIDN", "FIDS", "GRUP", "OBJL", "RVER", "SCAMIN", "SCAMAX"]
+
+# Each recast column has a fixed cost (a new block, a categorical's categories
+# and their index), so frames with fewer rows than this are left as they are
+COMPACT_MIN_ROWS = 50
+
+def downcast_integers(series):
+    """
+    Returns the column as the smallest integer dtype that holds its values
+    (a nullable Int dtype if it has nulls), or unchanged if it holds
+    anything but whole numbers.
+    """
+    if not pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return series
+    values = series.dropna()
+    if values.empty or not (values % 1 == 0).all():
+        return series
+    if series.isna().any():
+        series = series.astype("Int64")
+    return pd.to_numeric(series, downcast="integer")
+
+def compact_dtypes(gdf, category_max_ratio=0.5, min_rows=COMPACT_MIN_ROWS, integer_fields=INTEGER_FIELDS):
+    """
+    Converts the text columns of gdf with at most category_max_ratio distinct
+    values per row to categoricals and downcasts integer_fields, in place.
+    Columns holding anything but strings (e.g. lists), and frames with fewer
+    than min_rows rows, are left as they are. Returns gdf.
+    """
+    if len(gdf) < min_rows:
+        return gdf
+    geometry_name = gdf.geometry.name if hasattr(gdf, "geometry") else None
+    for col, dtype in gdf.dtypes.items():
+        if col == geometry_name:
+            continue
+        if col in integer_fields:
+            gdf[col] = downcast_integers(gdf[col])
+        elif dtype == object:
+            categorical = as_categorical(gdf[col], category_max_ratio)
+            if categorical is not None:
+                gdf[col] = categorical
+    return gdf
+
+def as_categorical(series, category_max_ratio=0.5):
+    """
+    Returns an object column as a categorical if it only holds strings
+    and/or nulls and has at most category_max_ratio distinct values per row,
+    else None. The values are hashed once, and only the distinct values
+    are type checked.
+    """
+    try:
+        codes, uniques = pd.factorize(series)
+    except TypeError:
+        # Unhashable values, e.g. lists
+        return None
+    if len(uniques) > max(1, len(series) * category_max_ratio):
+        return None
+    # An all-null column becomes an empty categorical (one byte per row)
+    if len(uniques) and infer_dtype(uniques, skipna=False) != "string":
+        return None
+    return pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=series.index, name=series.name)
+
+def concat_frames(frames):
+    """
+    pd.concat for compacted frames: a column that is categorical in every
+    frame holding it stays categorical (over the union of the categories)
+    instead of falling back to object. A column that is empty or all null
+    in some frames takes its dtype from the frames that have values in it.
+    Frames without rows are left out, as pd.concat would upcast the other
+    frames' integer columns to float for them.
+    Returns the combined DataFrame, with the columns in order of appearance.
+    """
+    frames = list(frames)
+    columns = list(dict.fromkeys(col for frame in frames for col in frame.columns))
+    frames = [frame for frame in frames if len(frame)] or frames[:1]
+    if len(frames) > 1:
+        # Leave out each frame's all-null columns (pd.concat fills them back
+        # in with nulls), unless the column has no values in any frame
+        non_null = [frame.count() for frame in frames]
+        has_values = {col for counts in non_null for col, count in counts.items() if count}
+        geometry_names = {frame.geometry.name for frame in frames if hasattr(frame, "geometry")}
+        trimmed = []
+        for frame, counts in zip(frames, non_null):
+            empty = [col for col, count in counts.items() if not count and col in has_values and col not in geometry_names]
+            trimmed.append(frame.drop(columns=empty) if empty else frame)
+        frames = trimmed
+
+        dtypes_by_column = {}
+        for frame in frames:
+            for col, dtype in frame.dtypes.items():
+                dtypes_by_column.setdefault(col, []).append(dtype)
+        categories = {
+            col: pd.Index(list(dict.fromkeys(value for dtype in dtypes for value in dtype.categories)), dtype=object)
+            for col, dtypes in dtypes_by_column.items()
+            if all(isinstance(dtype, pd.CategoricalDtype) for dtype in dtypes) and len({tuple(dtype.categories) for dtype in dtypes}) > 1
+        }
+        if categories:
+            recoded = []
+            for frame in frames:
+                # Shallow copy: only the recoded columns are new
+                frame = frame.copy(deep=False)
+                for col in categories.keys() & set(frame.columns):
+                    frame[col] = frame[col].cat.set_categories(categories[col])
+                recoded.append(frame)
+            frames = recoded
+    combined = pd.concat(frames, ignore_index=True)
+    return combined if list(combined.columns) == columns else combined.reindex(columns=columns)
+
+def drop_null_columns(gdf, keep_fields):
+    """
+    Drops the columns that hold no values and aren't one of keep_fields
+    (e.g. the target AGOL layer's fields). Returns the trimmed GeoDataFrame.
+    """
+    keep_fields = {field.lower() for field in keep_fields}
+    geometry_name = gdf.geometry.name if hasattr(gdf, "geometry") else None
+    empty = [col for col in gdf.columns
+             if col != geometry_name and col.lower() not in keep_fields and gdf[col].isna().all()]
+    return gdf.drop(columns=empty) if empty else gdf
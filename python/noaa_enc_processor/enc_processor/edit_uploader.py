@@ -0,0 +1,313 @@
+#####################################################
+##  CHUNKED, CONCURRENT, RETRYING EDIT UPLOADER    ##
+##        FOR AGOL HOSTED FEATURE LAYERS           ##
+#####################################################
+
+import re
+import json
+import time
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from .instrumentation import submit, timed_request
+
+# Key in the edit_features response holding each operation's results
+RESULT_KEYS = {"adds": "addResults", "updates": "updateResults", "deletes": "deleteResults"}
+
+# Errors a later attempt can get past: timeouts, dropped connections, rate
+# limits and gateway/service errors (see classify_error)
+TRANSIENT_ERROR_PATTERN = re.compile(
+    r"\b(429|500|502|503|504)\b|timed? ?out|temporar|connection (reset|aborted|refused|error)|too many requests|service unavailable|bad gateway",
+    re.IGNORECASE
+)
+# Errors from a request bigger than the service accepts
+TOO_LARGE_ERROR_PATTERN = re.compile(r"\b413\b|too large|exceeds the maximum|payload size", re.IGNORECASE)
+
+def payload_size(feature):
+    """
+    Estimates the size in bytes of a feature once serialized for the request.
+    """
+    return len(json.dumps(getattr(feature, "as_dict", feature), default=str))
+
+def make_chunks(items, chunk_size, max_payload_bytes=None):
+    """
+    Splits items into chunks of at most chunk_size items, and, if
+    max_payload_bytes is set, at most max_payload_bytes of serialized
+    features, so large geometries (e.g. cables) get smaller batches.
+    """
+    chunks = []
+    current = []
+    current_bytes = 0
+    for item in items:
+        item_bytes = payload_size(item) if max_payload_bytes else 0
+        if current and (len(current) >= chunk_size or (max_payload_bytes and current_bytes + item_bytes > max_payload_bytes)):
+            chunks.append(current)
+            current = []
+            current_bytes = 0
+        current.append(item)
+        current_bytes += item_bytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+def feature_label(operation, item, key_fields):
+    """
+    Describes a submitted feature in failure reports: its key fields (or
+    object ID) for adds/updates, the object ID for deletes.
+    """
+    if operation == "deletes":
+        return {"objectId": item}
+    attributes = getattr(item, "as_dict", item).get("attributes", {})
+    fields = key_fields or [field for field in ("OBJECTID", "FIDN") if field in attributes]
+    return {field: attributes.get(field) for field in fields}
+
+def _send(target_layer, operation, items):
+    """
+    Sends one edit_features request for a single operation, counted as an
+    AGOL edit request in the run report.
+    """
+    with timed_request("agol_edit"):
+        if operation == "deletes":
+            return target_layer.edit_features(deletes=",".join(str(object_id) for object_id in items))
+        return target_layer.edit_features(**{operation: items})
+
+def classify_error(error):
+    """
+    Sorts an edit_features error into "too_large" (the request was bigger
+    than the service accepts, so a smaller batch can succeed), "transient"
+    (a timeout, dropped connection, rate limit or gateway/service error that
+    a later attempt can get past) or "permanent" (e.g. an invalid token or a
+    schema mismatch, which fails the same way every time).
+    """
+    message = str(error)
+    if TOO_LARGE_ERROR_PATTERN.search(message):
+        return "too_large"
+    if isinstance(error, (TimeoutError, ConnectionError)) or TRANSIENT_ERROR_PATTERN.search(message):
+        return "transient"
+    return "permanent"
+
+def _key_value(value):
+    # 5.0 and 5 are the same key
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def _item_key(item, key_fields):
+    attributes = getattr(item, "as_dict", item).get("attributes", {})
+    return tuple(_key_value(attributes.get(field)) for field in key_fields)
+
+def _key_condition(key_fields, key):
+    conditions = []
+    for field, value in zip(key_fields, key):
+        if value is None:
+            conditions.append(f"{field} IS NULL")
+        elif isinstance(value, str):
+            escaped = value.replace("'", "''")
+            conditions.append(f"{field} = '{escaped}'")
+        else:
+            conditions.append(f"{field} = {value}")
+    return "(" + " AND ".join(conditions) + ")"
+
+def count_keys(target_layer, keys, key_fields, batch_size=100):
+    """
+    Counts the layer's features per key for the given keys.
+    Returns a Counter of {key: features in the layer}.
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    wanted = set(unique_keys)
+    counts = Counter()
+    for start in range(0, len(unique_keys), batch_size):
+        batch = unique_keys[start:start + batch_size]
+        with timed_request("agol_query"):
+            existing = target_layer.query(where=" OR ".join(_key_condition(key_fields, key) for key in batch),
+                                          out_fields=",".join(key_fields), return_geometry=False)
+        for feature in getattr(existing, "features", None) or []:
+            attributes = getattr(feature, "attributes", None) or {}
+            key = tuple(_key_value(attributes.get(field)) for field in key_fields)
+            if key in wanted:
+                counts[key] += 1
+    return counts
+
+def drop_added_features(items, keys, counts_before, counts_after):
+    """
+    Before adds are sent again after a failed request, which may still have
+    been applied (e.g. a gateway timeout after AGOL committed the edits):
+    leaves out as many features per key as the layer gained while the
+    request ran. Keys aren't unique (the same FIDN can be two structures),
+    so a feature is only left out for a copy the request added.
+    Returns the features still to add, their keys and the number already added.
+    """
+    applied = {key: counts_after[key] - counts_before[key] for key in set(keys)}
+    remaining, remaining_keys = [], []
+    for item, key in zip(items, keys):
+        if applied[key] > 0:
+            applied[key] -= 1
+        else:
+            remaining.append(item)
+            remaining_keys.append(key)
+    return remaining, remaining_keys, len(items) - len(remaining)
+
+def submit_chunk(target_layer, operation, items, max_retries=3, backoff_seconds=1.0, key_fields=None, max_split_depth=4, depth=0,
+                 retry_adds=True):
+    """
+    Submits one chunk, retrying transient errors (classify_error) with
+    exponential backoff (plus jitter). Adds are only retried with key_fields
+    and retry_adds: the layer's features per key are counted before the
+    first request and again before a retry, and the features the failed
+    request added anyway are left out (drop_added_features). If the service
+    rejects the chunk as too large, it is split in half (at most
+    max_split_depth times) and each half is submitted on its own. Permanent
+    errors fail the chunk at once.
+    Returns a chunk summary with per-feature failures.
+    """
+    summary = {"requests": 0, "retries": 0, "succeeded": 0, "failures": []}
+    result = None
+    last_error = None
+    error_kind = None
+    keys = [_item_key(item, key_fields) for item in items] if operation == "adds" and key_fields else None
+    counts_before = None
+    if keys is not None and retry_adds and max_retries:
+        try:
+            counts_before = count_keys(target_layer, keys, key_fields)
+        except Exception as e:
+            print(f"Could not count the layer's features by key before an adds batch ({e}). It won't be retried if it fails.")
+    for attempt in range(max_retries + 1):
+        if attempt and operation == "adds":
+            try:
+                counts_after = count_keys(target_layer, keys, key_fields)
+            except Exception as e:
+                print(f"Could not check which features of a failed adds batch were applied ({e}). Not retrying it.")
+                break
+            items, keys, already_added = drop_added_features(items, keys, counts_before, counts_after)
+            counts_before = counts_after
+            summary["succeeded"] += already_added
+            if not items:
+                return summary
+        summary["requests"] += 1
+        try:
+            result = _send(target_layer, operation, items)
+            last_error = None
+            break
+        except Exception as e:
+            last_error, error_kind = e, classify_error(e)
+            # Adds that may have been applied can only be retried if they were counted first
+            if error_kind != "transient" or attempt == max_retries or (operation == "adds" and counts_before is None):
+                break
+            summary["retries"] += 1
+            time.sleep(backoff_seconds * (2 ** attempt) * (1 + random.random()))
+
+    if last_error is not None:
+        if error_kind == "too_large" and len(items) > 1 and depth < max_split_depth:
+            print(f"{operation} batch of {len(items)} was too large ({last_error}). Splitting batch...")
+            middle = len(items) // 2
+            for half in (items[:middle], items[middle:]):
+                half_summary = submit_chunk(target_layer, operation, half, max_retries, backoff_seconds, key_fields, max_split_depth, depth + 1,
+                                            retry_adds)
+                for counter in ("requests", "retries", "succeeded"):
+                    summary[counter] += half_summary[counter]
+                summary["failures"].extend(half_summary["failures"])
+            return summary
+        if error_kind == "transient" and summary["retries"]:
+            print(f"{operation} batch of {len(items)} failed after {summary['retries'] + 1} attempts ({last_error}).")
+        else:
+            print(f"{operation} batch of {len(items)} failed ({last_error}).")
+        summary["failures"].extend(
+            {"operation": operation, "feature": feature_label(operation, item, key_fields), "error": str(last_error)}
+            for item in items
+        )
+        return summary
+
+    # Match each result to the feature it was sent for
+    results = result.get(RESULT_KEYS[operation], []) if isinstance(result, dict) else []
+    for index, item in enumerate(items):
+        item_result = results[index] if index < len(results) else {"success": False, "error": "No result returned"}
+        if item_result.get("success"):
+            summary["succeeded"] += 1
+        else:
+            summary["failures"].append({"operation": operation, "feature": feature_label(operation, item, key_fields), "error": item_result.get("error")})
+    return summary
+
+def submit_edits(target_layer, adds=None, updates=None, deletes=None, chunk_size=1000, max_workers=4,
+                 max_retries=3, backoff_seconds=1.0, max_payload_bytes=5_000_000, key_fields=None, max_split_depth=4):
+    """
+    Uploads adds/updates (lists of Esri JSON features) and deletes (a list of
+    object IDs) to a feature layer in chunks, max_workers requests at a time,
+    retrying transient errors and splitting oversized chunks (submit_chunk).
+    key_fields (e.g. ["FIDN"]) names features in the failure report and keeps
+    retried adds from being added twice. Returns one summary for all chunks.
+    """
+    jobs = []
+    for operation, items in (("adds", adds), ("updates", updates), ("deletes", deletes)):
+        if not items:
+            continue
+        items = list(items)
+        if operation == "deletes":
+            chunks = make_chunks(items, chunk_size)
+        else:
+            chunks = make_chunks(items, chunk_size, max_payload_bytes)
+        jobs.extend((operation, chunk, True) for chunk in chunks)
+
+    if adds and key_fields and max_workers > 1:
+        chunk_keys = [{_item_key(item, key_fields) for item in chunk} if operation == "adds" else set() for operation, chunk, _ in jobs]
+        chunks_per_key = Counter(key for keys in chunk_keys for key in keys)
+        jobs = [(operation, chunk, all(chunks_per_key[key] == 1 for key in keys)) for (operation, chunk, _), keys in zip(jobs, chunk_keys)]
+
+    summary = {
+        "adds": {"submitted": len(adds or []), "succeeded": 0, "failed": 0},
+        "updates": {"submitted": len(updates or []), "succeeded": 0, "failed": 0},
+        "deletes": {"submitted": len(deletes or []), "succeeded": 0, "failed": 0},
+        "requests": 0,
+        "retries": 0,
+        "failures": []
+    }
+    if not jobs:
+        return summary
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+        futures = [
+            (operation, submit(executor, submit_chunk, target_layer, operation, chunk, max_retries, backoff_seconds, key_fields, max_split_depth,
+                               0, retry_adds))
+            for operation, chunk, retry_adds in jobs
+        ]
+        for operation, future in futures:
+            chunk_summary = future.result()
+            summary[operation]["succeeded"] += chunk_summary["succeeded"]
+            summary[operation]["failed"] += len(chunk_summary["failures"])
+            summary["requests"] += chunk_summary["requests"]
+            summary["retries"] += chunk_summary["retries"]
+            summary["failures"].extend(chunk_summary["failures"])
+
+    return summary
+
+def merge_upload_summaries(total, summary):
+    """
+    Adds a submit_edits summary to a running total (None starts a new one),
+    e.g. for a layer uploaded chunk by chunk. Returns the total.
+    """
+    if total is None:
+        total = {operation: {"submitted": 0, "succeeded": 0, "failed": 0} for operation in ("adds", "updates", "deletes")}
+        total.update(requests=0, retries=0, failures=[])
+    for operation in ("adds", "updates", "deletes"):
+        for counter in ("submitted", "succeeded", "failed"):
+            total[operation][counter] += summary[operation][counter]
+    total["requests"] += summary["requests"]
+    total["retries"] += summary["retries"]
+    total["failures"].extend(summary["failures"])
+    return total
+
+def print_upload_summary(name, summary, max_failures=10):
+    """
+    Prints the upload summary, listing up to max_failures failed features.
+    """
+    for operation in ("adds", "updates", "deletes"):
+        counts = summary[operation]
+        if counts["submitted"]:
+            print(f"[{name}] {operation}: {counts['succeeded']}/{counts['submitted']} succeeded, {counts['failed']} failed.")
+    print(f"[{name}] {summary['requests']} edit requests sent ({summary['retries']} retries).")
+    failures = summary["failures"]
+    if failures:
+        print(f"[{name}] Warning: {len(failures)} features failed to upload:")
+        for failure in failures[:max_failures]:
+            print(f"     - {failure['operation']} {failure['feature']}: {failure['error']}")
+        if len(failures) > max_failures:
+            print(f"     ... and {len(failures) - max_failures} more.")
@@ -1,42 +1,239 @@
 #############################################
-##  FUNCTION TO CONVERT COLUMNS IN ENC     ##
-##  FROM LIST TO COMMA-SEPARATED STRING    ##
+##  FUNCTIONS TO READ ENC LAYERS AND       ##
+##  CONVERT COLUMNS IN ENC FROM LIST TO    ##
+##  COMMA-SEPARATED STRING                 ##
 #############################################
 
 import geopandas as gpd
+import zipfile
+import os
+import time
 import fiona
+from pathlib import Path
+from .code_mapper import file_sha256
+from .extraction_cache import layer_cache_key, load_cached_layer, store_cached_layer
 
-def read_enc_layer(data_dir, layer_name):
+def find_enc_member(zip_path):
+    """
+    Finds the .000 ENC base cell in a chart ZIP file by reading the ZIP's
+    central directory, without extracting anything. Returns None if the
+    ZIP file has no .000 member.
+    """
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        # There should only be one file with the .000 extention
+        for member in zip_ref.namelist():
+            if member.endswith(".000"):
+                return member
+    return None
+
+def enc_vsi_path(zip_path):
+    """
+    Builds a GDAL /vsizip/ path to the .000 ENC file inside a chart ZIP so
+    it can be opened in place. The .001+ update files sit next to it in the
+    ZIP, so GDAL still applies them. Returns None if there is no .000 file.
+    """
+    member = find_enc_member(zip_path)
+    if member is None:
+        return None
+    return f"/vsizip/{Path(zip_path).resolve().as_posix()}/{member}"
+
+def build_attribute_filter(filter_col, filter_val, field_type):
+    """
+    Builds an OGR SQL attribute filter for filter_col = filter_val, using the
+    field type from the layer schema to quote the value. Returns None when
+    the filter can't be pushed down to OGR: OGR SQL can't compare list-type
+    fields (e.g. CATLMK), so those are filtered while streaming features.
+    """
+    if field_type is None or field_type.startswith("List"):
+        return None
+    if field_type.startswith(("int", "float")):
+        return f"{filter_col} = {filter_val}"
+    escaped_val = str(filter_val).replace("'", "''")
+    return f"{filter_col} = '{escaped_val}'"
+
+def read_enc_layer(data_dir, layer_name, filter_col=None, filter_val=None, columns=None):
     """
     Reads an ENC layer while converting list-type fields to strings
     to prevent them from being skipped by GeoPandas. This ensures all
     attribute columns are retained.
+    data_dir can be a .000 file, a /vsizip/ path or a chart ZIP file.
+    Optionally keeps only the features where filter_col equals filter_val
+    (pushed down to OGR where possible) and reads only the listed columns.
     """
     processed_features = []
+    # List fields found so far, so each is only reported once
+    converted_fields = set()
     
     try:
-        with fiona.open(data_dir, layer=layer_name) as source:
+        # Open chart ZIP files in place through GDAL's virtual file system
+        if str(data_dir).endswith(".zip"):
+            data_dir = enc_vsi_path(data_dir)
+            if data_dir is None:
+                print(f"No .000 ENC file found for layer '{layer_name}'")
+                return gpd.GeoDataFrame([])
+
+        # Only read the requested columns, plus the filter column
+        include_fields = None
+        if columns is not None:
+            include_fields = list(dict.fromkeys(list(columns) + ([filter_col] if filter_col else [])))
+
+        with fiona.open(data_dir, layer=layer_name, include_fields=include_fields) as source:
             # Define the coordinate system from the source file
             source_crs = source.crs
+            features_read = len(source)
+
+            features = source
+            list_filter_val = None
+            if filter_col and filter_val:
+                field_type = source.schema["properties"].get(filter_col)
+                where = build_attribute_filter(filter_col, filter_val, field_type)
+                if where:
+                    features = source.filter(where=where)
+                elif field_type is not None:
+                    list_filter_val = str(filter_val)
 
-            for feature in source:
+            for feature in features:
                 properties = feature['properties']
+
+                # Skip features that don't match a list-type filter column before
+                # doing any other work on them
+                if list_filter_val is not None:
+                    value = properties.get(filter_col)
+                    if isinstance(value, list):
+                        value = ', '.join(map(str, value))
+                    if value != list_filter_val:
+                        continue
                 
                 for key, value in list(properties.items()):
                     # Convert any list-type cols to a comma-separated string col
                     if isinstance(value, list):
-                        print(f"Found and converted list in field: '{key}'")
+                        if key not in converted_fields:
+                            print(f"Found and converted list in field: '{key}'")
+                            converted_fields.add(key)
                         properties[key] = ', '.join(map(str, value))
                 
                 feature['properties'] = properties
                 processed_features.append(feature)
 
         if not processed_features:
-            return gpd.GeoDataFrame([], crs=source_crs)
-
-        gdf = gpd.GeoDataFrame.from_features(processed_features, crs=source_crs)
+            gdf = gpd.GeoDataFrame(geometry=[], crs=source_crs)
+        else:
+            gdf = gpd.GeoDataFrame.from_features(processed_features, crs=source_crs)
+        # Features in the layer before filtering, for the run report
+        gdf.attrs["features_read"] = features_read
         return gdf
         
     except Exception as e:
         print(f"Critical error in read_enc_layer for layer '{layer_name}': {e}")
-        return gpd.GeoDataFrame([])
\ No newline at end of file
+        return gpd.GeoDataFrame([])
+
+def read_enc_layers(enc_path, layer_requests, stats=None):
+    """
+    Reads all requested layers from one ENC file, listing its layers once.
+    layer_requests maps a feature name to its extraction_features entry
+    (config.py). Each layer's filter_col/filter_val is pushed down to OGR
+    and only its configured columns are read. Returns a dictionary of
+    {feature name: GeoDataFrame} for the layers present in the chart.
+    If a stats dictionary is passed, each layer's read time and feature
+    counts are added to it, see extract_chart.
+    """
+    layer_results = {}
+    layers = set(fiona.listlayers(enc_path))
+
+    for name, info in layer_requests.items():
+        layer_name = info["layer_name"]
+        if layer_name not in layers:
+            continue
+
+        print(f"Calling read_enc_layer function for layer: {layer_name}")
+        start = time.perf_counter()
+        layer_results[name] = read_enc_layer(
+            enc_path,
+            layer_name,
+            filter_col=info.get("filter_col"),
+            filter_val=info.get("filter_val"),
+            columns=info.get("columns")
+        )
+        if stats is not None:
+            stats[name] = {
+                "seconds": time.perf_counter() - start,
+                "features_read": layer_results[name].attrs.get("features_read", 0),
+                "features_after_filter": len(layer_results[name]),
+                "cached": False
+            }
+
+    return layer_results
+
+def extract_chart(zip_path, feature_config, cache_dir=None, stats=None):
+    """
+    Extracts the features set in extraction_features (config.py) from a single
+    ENC chart ZIP file. Returns a dictionary of {feature name: GeoDataFrame}
+    holding only the features found in the chart.
+    Runs inside a worker process when extraction is parallel.
+    With cache_dir set, layers are looked up in the extraction cache by the
+    ZIP's content hash first, and the ENC is only read for cache misses.
+    If a stats dictionary is passed, it is filled with {feature name:
+    {"seconds", "features_read", "features_after_filter", "cached"}} for the
+    run report (see instrumentation.py).
+    """
+    zip_file = os.path.basename(zip_path)
+    chart_results = {}
+    layer_results = {}
+    layer_requests = feature_config
+    cache_keys = {}
+
+    print(f"Processing source file: {zip_file}")
+    # Reuse the filtered layers from the last time this exact chart was processed
+    if cache_dir:
+        try:
+            zip_hash = file_sha256(zip_path)
+        except OSError as e:
+            print(f"Failed to read {zip_file}: {e}")
+            return chart_results
+        layer_requests = {}
+        for name, info in feature_config.items():
+            cache_keys[name] = layer_cache_key(zip_hash, info)
+            start = time.perf_counter()
+            hit, gdf = load_cached_layer(cache_dir, cache_keys[name])
+            if hit:
+                layer_results[name] = gdf
+                if stats is not None and gdf is not None:
+                    stats[name] = {"seconds": time.perf_counter() - start, "features_read": 0, "features_after_filter": len(gdf), "cached": True}
+            else:
+                layer_requests[name] = info
+        if not layer_requests:
+            print(f"Using cached results for all layers in {zip_file}")
+
+    if layer_requests:
+        # Find the .000 file in the ZIP and open it in place, without extracting
+        try:
+            enc_path = enc_vsi_path(zip_path)
+        except Exception as e:
+            print(f"Failed to read {zip_file}: {e}")
+            return chart_results
+        if enc_path is None:
+            print(f"No .000 ENC file found in {zip_file}")
+            return chart_results
+        try:
+            # Read every configured layer, filtered, from the single ENC file
+            read_results = read_enc_layers(enc_path, layer_requests, stats=stats)
+        except Exception as e:
+            print(f"Could not read layers in {zip_file}: {e}")
+            return chart_results
+
+        for name in layer_requests:
+            gdf = read_results.get(name)
+            # A layer with no CRS means the read failed, so don't cache it
+            if cache_dir and (gdf is None or gdf.crs is not None):
+                store_cached_layer(cache_dir, cache_keys[name], gdf)
+            if gdf is not None:
+                layer_results[name] = gdf
+
+    for name, gdf in layer_results.items():
+        if not gdf.empty:
+            # Add a column to the gdf stating the source file name
+            gdf["source_file"] = zip_file
+            chart_results[name] = gdf
+            print(f"Found {len(gdf)} features for '{name}' in layer '{feature_config[name]['layer_name']}'")
+
+    return chart_results
@@ -0,0 +1,159 @@
+#####################################################
+##   FUNCTIONS TO ENCODE GEODATAFRAMES DIRECTLY    ##
+##          AS ESRI JSON FEATURE DICTS             ##
+#####################################################
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry.polygon import orient
+
+# Esri geometry type for each shapely geometry type ID
+ESRI_GEOMETRY_TYPES = {
+    0: "esriGeometryPoint",
+    1: "esriGeometryPolyline",
+    2: "esriGeometryPolyline",
+    3: "esriGeometryPolygon",
+    4: "esriGeometryMultipoint",
+    5: "esriGeometryPolyline",
+    6: "esriGeometryPolygon"
+}
+
+def encode_column(series):
+    """
+    Converts a column into a list of JSON-ready Python values: NaN/NaT/NA
+    become None, timestamps become epoch milliseconds (as AGOL date fields
+    expect) and categorical columns are converted once per category.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        # Encode each category once and index into them with the category codes
+        categories = encode_column(pd.Series(series.cat.categories))
+        lookup = np.array(categories + [None], dtype=object)
+        return lookup[series.cat.codes.to_numpy()].tolist() # Code -1 (missing) picks None
+
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        is_missing = series.isna().to_numpy()
+        epoch = pd.Timestamp(0, tz=getattr(series.dtype, "tz", None))
+        milliseconds = ((series - epoch) // pd.Timedelta(milliseconds=1)).to_numpy(dtype="float64", na_value=np.nan)
+        values = np.empty(len(series), dtype=object)
+        values[~is_missing] = milliseconds[~is_missing].astype("int64").tolist()
+        values[is_missing] = None
+        return values.tolist()
+
+    values = series.to_numpy(dtype=object, copy=True)
+    values[pd.isna(values)] = None
+    return values.tolist()
+
+def _oriented_polygons(geometries):
+    """
+    Orients polygon rings the way Esri expects: clockwise exterior rings and
+    counter-clockwise holes.
+    """
+    if hasattr(shapely, "orient_polygons"): # shapely 2.1+
+        return shapely.orient_polygons(geometries, exterior_cw=True)
+    return np.array([orient(geometry, sign=-1.0) for geometry in geometries], dtype=object)
+
+def _split(values, offsets):
+    """
+    Splits a list into consecutive parts using an offsets array.
+    """
+    return [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+def encode_geometries(geometries, spatial_reference):
+    """
+    Converts an array of shapely geometries into Esri JSON geometry dicts
+    using shapely's vectorized coordinate functions. Points are encoded from
+    one get_coordinates call, other types from one to_ragged_array call per
+    type. Every geometry references the same spatial_reference dict. Null,
+    empty and unsupported (GeometryCollection) geometries become None.
+    """
+    geometries = np.asarray(geometries, dtype=object)
+    encoded = [None] * len(geometries)
+    type_ids = shapely.get_type_id(geometries)
+    type_ids[shapely.is_empty(geometries)] = -1
+
+    # Points
+    point_index = np.flatnonzero(type_ids == 0)
+    if len(point_index):
+        coords = shapely.get_coordinates(geometries[point_index]).tolist()
+        for index, (x, y) in zip(point_index.tolist(), coords):
+            encoded[index] = {"x": x, "y": y, "spatialReference": spatial_reference}
+
+    # Multipoints
+    multipoint_index = np.flatnonzero(type_ids == 4)
+    if len(multipoint_index):
+        _, coords, (geom_offsets,) = shapely.to_ragged_array(geometries[multipoint_index])
+        for index, points in zip(multipoint_index.tolist(), _split(coords.tolist(), geom_offsets)):
+            encoded[index] = {"points": points, "spatialReference": spatial_reference}
+
+    # Lines (LineString, LinearRing, MultiLineString)
+    line_index = np.flatnonzero(np.isin(type_ids, (1, 2, 5)))
+    if len(line_index):
+        line_geometries = geometries[line_index]
+        ring_mask = type_ids[line_index] == 2
+        if ring_mask.any():
+            # to_ragged_array has no LinearRing layout, encode rings as LineStrings
+            line_geometries = line_geometries.copy()
+            line_geometries[ring_mask] = shapely.linestrings(shapely.get_coordinates(line_geometries[ring_mask]), indices=np.repeat(np.arange(ring_mask.sum()), shapely.get_num_coordinates(line_geometries[ring_mask])))
+        _, coords, offsets = shapely.to_ragged_array(line_geometries)
+        coords = coords.tolist()
+        if len(offsets) == 1: # All LineStrings
+            paths_per_geometry = [[path] for path in _split(coords, offsets[0])]
+        else:
+            part_offsets, geom_offsets = offsets
+            paths = _split(coords, part_offsets)
+            paths_per_geometry = _split(paths, geom_offsets)
+        for index, paths in zip(line_index.tolist(), paths_per_geometry):
+            encoded[index] = {"paths": paths, "spatialReference": spatial_reference}
+
+    # Polygons (Polygon, MultiPolygon)
+    polygon_index = np.flatnonzero(np.isin(type_ids, (3, 6)))
+    if len(polygon_index):
+        _, coords, offsets = shapely.to_ragged_array(_oriented_polygons(geometries[polygon_index]))
+        rings = _split(coords.tolist(), offsets[0])
+        if len(offsets) == 2: # All Polygons
+            rings_per_geometry = _split(rings, offsets[1])
+        else:
+            polygon_offsets, geom_offsets = offsets[1], offsets[2]
+            # Flatten each MultiPolygon's polygons into one list of rings
+            rings_per_geometry = [rings[polygon_offsets[start]:polygon_offsets[end]] for start, end in zip(geom_offsets[:-1], geom_offsets[1:])]
+        for index, polygon_rings in zip(polygon_index.tolist(), rings_per_geometry):
+            encoded[index] = {"rings": polygon_rings, "spatialReference": spatial_reference}
+
+    return encoded
+
+def gdf_to_esri_features(gdf, wkid):
+    """
+    Encodes a GeoDataFrame (already in the target spatial reference) directly
+    as a list of Esri JSON feature dicts ({"attributes", "geometry"}), without
+    a GeoJSON round trip. Attribute columns are converted a whole column at a
+    time (see encode_column) and every geometry shares one spatialReference
+    dict, {"wkid": wkid}.
+    """
+    spatial_reference = {"wkid": int(wkid)}
+    geometry_name = gdf.geometry.name
+    columns = [col for col in gdf.columns if col != geometry_name]
+
+    column_values = [encode_column(gdf[col]) for col in columns]
+    geometries = encode_geometries(gdf.geometry.values, spatial_reference)
+
+    if not columns:
+        return [{"attributes": {}, "geometry": geometry} for geometry in geometries]
+    return [
+        {"attributes": dict(zip(columns, row)), "geometry": geometry}
+        for row, geometry in zip(zip(*column_values), geometries)
+    ]
+
+def gdf_to_feature_set_dict(gdf, wkid):
+    """
+    Encodes a GeoDataFrame as an Esri JSON FeatureSet dict, with the geometry
+    type and spatial reference set once at the top level.
+    """
+    type_ids = shapely.get_type_id(np.asarray(gdf.geometry.values, dtype=object))
+    valid_ids = type_ids[type_ids >= 0]
+    geometry_type = ESRI_GEOMETRY_TYPES.get(int(valid_ids[0])) if len(valid_ids) else None
+    return {
+        "geometryType": geometry_type,
+        "spatialReference": {"wkid": int(wkid)},
+        "features": gdf_to_esri_features(gdf, wkid)
+    }
@@ -0,0 +1,98 @@
+#####################################################
+##   INCREMENTAL EXTRACTION CACHE FOR ENC LAYERS   ##
+#####################################################
+
+import os
+import json
+import time
+import hashlib
+from pathlib import Path
+import geopandas as gpd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Bump this whenever the reader output changes so old entries are not reused
+CACHE_VERSION = 1
+
+def layer_cache_key(zip_hash, info):
+    """
+    Builds the cache key for one layer of one chart from the chart ZIP's
+    content hash, the ENC layer name and the filter/column settings.
+    """
+    key_parts = {
+        "version": CACHE_VERSION,
+        "zip_hash": zip_hash,
+        "layer_name": info["layer_name"],
+        "filter_col": info.get("filter_col"),
+        "filter_val": info.get("filter_val"),
+        "columns": info.get("columns")
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def load_cached_layer(cache_dir, key):
+    """
+    Looks up a cached layer result. Returns (True, GeoDataFrame) on a hit,
+    where an empty GeoDataFrame means the layer had no matching features,
+    and (False, None) on a miss or if the entry can't be read.
+    """
+    if pyarrow is None:
+        return False, None
+
+    cache_dir = Path(cache_dir)
+    empty_marker = cache_dir / f"{key}.empty"
+    parquet_path = cache_dir / f"{key}.parquet"
+    try:
+        if empty_marker.exists():
+            os.utime(empty_marker)
+            return True, gpd.GeoDataFrame([])
+        if parquet_path.exists():
+            gdf = gpd.read_parquet(parquet_path)
+            # Mark the entry as used so prune_extraction_cache keeps it
+            os.utime(parquet_path)
+            return True, gdf
+    except Exception as e:
+        print(f"Warning: Could not read cached layer {key[:12]}: {e}")
+    return False, None
+
+def store_cached_layer(cache_dir, key, gdf):
+    """
+    Stores a filtered layer result as GeoParquet, or as an empty marker file
+    if there were no matching features. Writes go through a temp file so a
+    failed write never leaves a broken entry.
+    """
+    if pyarrow is None:
+        return
+
+    cache_dir = Path(cache_dir)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        if gdf is None or gdf.empty:
+            (cache_dir / f"{key}.empty").touch()
+            return
+        tmp_path = cache_dir / f"{key}.parquet.tmp"
+        gdf.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_dir / f"{key}.parquet")
+    except Exception as e:
+        print(f"Warning: Could not cache layer {key[:12]}: {e}")
+
+def prune_extraction_cache(cache_dir, max_age_days=30):
+    """
+    Removes cache entries that haven't been used in max_age_days, e.g. the
+    results for chart editions that have since been replaced.
+    """
+    cache_dir = Path(cache_dir)
+    if not cache_dir.exists():
+        return 0
+
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    removed = 0
+    for entry in cache_dir.iterdir():
+        if entry.suffix in (".parquet", ".empty", ".tmp") and entry.stat().st_mtime < cutoff:
+            entry.unlink()
+            removed += 1
+    if removed:
+        print(f"Removed {removed} unused entries from the extraction cache.")
+    return removed
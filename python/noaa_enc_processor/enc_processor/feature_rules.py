@@ -0,0 +1,101 @@
+#####################################################
+##   DECLARATIVE POST-PROCESSING RULES FOR ENC     ##
+##     FEATURES (CONFIGURED PER FEATURE TYPE)      ##
+#####################################################
+
+# Each feature in config.extraction_features can list "post_processing"
+# rules. They run in order on the combined, code-mapped GeoDataFrame, and
+# every rule works on whole columns at once (no per-row Python):
+#   {"rule": "exclude", "column": ..., "values": [...]}
+#       Drops rows whose column value is in values.
+#   {"rule": "fill_by_key", "column": ..., "key": ..., "values": {key: value}}
+#       Fills blank (null or whitespace) values of column from a lookup on key,
+#       e.g. OBJNAM by FIDN.
+#   {"rule": "split", "column": ..., "pattern": regex, "into": [col, col, ...]}
+#       Splits column at the first matches of pattern into new columns.
+#   {"rule": "derive", "column": ..., "output": ..., "values": {value: result}, "default": ...}
+#       Sets output from the (trimmed, case-insensitive) value of column,
+#       using default for blanks and values not listed.
+
+def blank_mask(series):
+    """
+    Flags null, empty and whitespace-only values.
+    """
+    return series.isna() | series.astype("string").str.strip().eq("").fillna(True)
+
+def exclude_rows(gdf, rule):
+    """
+    Drops rows whose value in rule["column"] is one of rule["values"].
+    Rows with a null value are kept.
+    """
+    keep = ~gdf[rule["column"]].isin(rule["values"])
+    return gdf[keep]
+
+def fill_by_key(gdf, rule):
+    """
+    Fills blank values of rule["column"] with rule["values"][key], where key
+    is the row's value in rule["key"]. Blanks with no entry are left as they are.
+    """
+    column = rule["column"]
+    fills = gdf[rule["key"]].map(rule["values"])
+    to_fill = blank_mask(gdf[column]) & fills.notna()
+    if to_fill.any():
+        gdf[column] = gdf[column].astype(object).where(~to_fill, fills)
+    return gdf
+
+def split_column(gdf, rule):
+    """
+    Splits rule["column"] at the first len(rule["into"]) - 1 matches of the
+    regex rule["pattern"] and assigns the parts to the rule["into"] columns.
+    Values without a match only fill the first column.
+    """
+    into = rule["into"]
+    parts = gdf[rule["column"]].str.split(rule["pattern"], n=len(into) - 1, expand=True, regex=True)
+    parts = parts.reindex(columns=range(len(into)))
+    for position, output in enumerate(into):
+        gdf[output] = parts[position]
+    return gdf
+
+def derive_column(gdf, rule):
+    """
+    Sets rule["output"] by looking up the trimmed, lower case value of
+    rule["column"] in rule["values"]; anything else gets rule["default"].
+    """
+    lookup = {str(k).strip().lower(): v for k, v in rule["values"].items()}
+    cleaned = gdf[rule["column"]].astype("string").str.strip().str.lower()
+    derived = cleaned.map(lookup).astype(object)
+    gdf[rule["output"]] = derived.where(derived.notna(), rule.get("default"))
+    return gdf
+
+# Rule name -> function and the columns (rule keys) it needs to exist
+RULES = {
+    "exclude": (exclude_rows, ["column"]),
+    "fill_by_key": (fill_by_key, ["column", "key"]),
+    "split": (split_column, ["column"]),
+    "derive": (derive_column, ["column"])
+}
+
+def apply_post_processing(gdf, rules, name=""):
+    """
+    Runs a feature's post-processing rules in order and returns the
+    resulting GeoDataFrame. Rules whose input columns are missing, and
+    unknown rules, are skipped with a warning.
+    """
+    gdf = gdf.copy()
+    for rule in rules or []:
+        rule_name = rule.get("rule")
+        if rule_name not in RULES:
+            print(f"[{name}] Warning: Unknown post-processing rule '{rule_name}'. Skipping.")
+            continue
+
+        rule_function, column_keys = RULES[rule_name]
+        missing = [rule[key] for key in column_keys if rule[key] not in gdf.columns]
+        if missing:
+            print(f"[{name}] Warning: Column(s) {missing} missing for '{rule_name}' rule. Skipping.")
+            continue
+
+        before = len(gdf)
+        gdf = rule_function(gdf, rule)
+        if len(gdf) != before:
+            print(f"[{name}] '{rule_name}' rule on {rule['column']} removed {before - len(gdf)} features.")
+    return gdf
@@ -4,89 +4,183 @@
 
 import pandas as pd
 import json
+import os
+import hashlib
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from .instrumentation import submit
+from .agol_metadata import AgolMetadataCache
 
-def update_field_definitions(gis, mapper, layer_indices: list = [0]):
+def load_definition_hashes(state_path):
+    """
+    Loads the stored {"<item ID>/<layer index>": definition hash} state.
+    Returns an empty dictionary if there is none yet or it can't be read.
+    """
+    try:
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read field definition hashes from {state_path}: {e}")
+        return {}
+
+def save_definition_hashes(state, state_path):
+    """
+    Writes the definition hashes through a temp file.
+    """
+    state_path = Path(state_path)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+def load_field_lookup(csv_path):
+    """
+    Reads the field definition CSV into {field name: {"alias", "description"}},
+    with each description already formatted as the JSON string AGOL pop-ups
+    expect. Raises FileNotFoundError/KeyError for a missing file or 'name' column.
+    """
+    field_info_df = pd.read_csv(csv_path)
+    # Use fillna('') to handle empty cells for descriptions
+    field_lookup = field_info_df.fillna('').set_index('name').to_dict('index')
+
+    desired = {}
+    for field_name, row in field_lookup.items():
+        # Create the dictionary with the required structure and convert it to a JSON formatted string
+        structured_desc_dict = {
+            "value": row.get('description', ''),
+            "fieldValueType": ""
+        }
+        desired[field_name] = {"alias": row.get('alias'), "description": json.dumps(structured_desc_dict)}
+    return desired
+
+def definition_hash(desired):
+    """
+    Hashes a {field name: {"alias", "description"}} definition set.
+    """
+    return hashlib.sha256(json.dumps(desired, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def changed_fields(current_fields, desired):
+    """
+    Compares the layer's current fields with the desired aliases/descriptions
+    and returns copies of only the fields that differ, with the new values set.
+    """
+    changes = []
+    for field in current_fields:
+        target = desired.get(field['name'])
+        if target is None:
+            continue
+        alias = target['alias'] if target['alias'] is not None else field.get('alias')
+        if field.get('alias') != alias or field.get('description') != target['description']:
+            updated = dict(field)
+            updated['alias'] = alias
+            updated['description'] = target['description']
+            changes.append(updated)
+    return changes
+
+def update_layer_definition(gis, item_id, index, desired, metadata_cache=None):
+    """
+    Applies the desired field definitions to one layer of an item, sending
+    only the fields that changed. No admin call is made if nothing changed.
+    Items and layers are looked up through metadata_cache, which is
+    invalidated for the layer once its definition has changed.
+    Returns "updated", "unchanged" or "skipped".
+    """
+    metadata_cache = metadata_cache or AgolMetadataCache(gis)
+    # Get the feature layer from AGOL (straight from its URL if that is cached)
+    layer_to_update = metadata_cache.layer(item_id, index)
+    if layer_to_update is None:
+        if not metadata_cache.item(item_id):
+            print(f"Warning: Item ID {item_id} not found. Skipping.")
+        else:
+            print(f"Warning: Layer index {index} is out of bounds for item {item_id}. Skipping this layer.")
+        return "skipped"
+
+    # The current aliases/descriptions are compared, so read the live properties
+    layer_definition = metadata_cache.properties(item_id, index)
+    layer_name = layer_definition.name
+
+    changes = changed_fields(layer_definition['fields'], desired)
+    if not changes:
+        print(f"[{item_id}] Layer '{layer_name}' field definitions are up to date. No updates needed.")
+        return "unchanged"
+
+    for field in changes:
+        print(f"     - Staging update for field: {field['name']}")
+
+    update_dict = {"fields": changes}
+    result = layer_to_update.manager.update_definition(update_dict)
+    if 'success' not in result or not result['success']:
+        # Backup: If the manager blocks the action, update the Item's data property
+        # with every field, so the fields that did not change keep their definitions
+        item = metadata_cache.item(item_id)
+        changes_by_name = {field['name']: field for field in changes}
+        all_fields = [changes_by_name.get(field['name'], field) for field in layer_definition['fields']]
+        item.update(item_properties={'text': json.dumps({"layers": [{"fields": all_fields}]})})
+    metadata_cache.invalidate(item_id, index)
+    print(f"[{item_id}] Successfully applied {len(changes)} updates to layer '{layer_name}'.")
+    return "updated"
+
+def update_field_definitions(gis, mapper, layer_indices: list = [0], state_path=None, max_workers=4, force=False, metadata_cache=None):
     """
     Connects to AGOL and updates feature layer field aliases and descriptions using CSVs.
     Formats descriptions as a JSON string for proper AGOL pop-up configuration.
+    Only changed fields are sent, and layers whose CSV hasn't changed since the run recorded
+    in state_path are skipped (unless force is set). Returns {"<item ID>/<layer index>": status}.
     """
+    metadata_cache = metadata_cache or AgolMetadataCache(gis)
+    state = load_definition_hashes(state_path) if state_path else {}
+    state_lock = threading.Lock()
+    statuses = {}
+
+    def process_layer(item_id, index, desired, desired_hash):
+        key = f"{item_id}/{index}"
+        if not force and state.get(key) == desired_hash:
+            return key, "cached"
+        try:
+            status = update_layer_definition(gis, item_id, index, desired, metadata_cache)
+        except Exception as e:
+            print(f"An error occurred while processing item {item_id}, layer {index}: {e}")
+            return key, "failed"
+        if status in ("updated", "unchanged"):
+            with state_lock:
+                state[key] = desired_hash
+        return key, status
+
     try:
+        jobs = []
         for item_id, csv_path in mapper.items():
-            print(f"--- Processing Item ID: {item_id} ---")
-            
+            # Load and prepare the field definitions from the CSV
             try:
-                # Get the feature layer item from AGOL
-                item = gis.content.get(item_id)
-                if not item:
-                    print(f"Warning: Item ID {item_id} not found. Skipping.")
-                    continue
-                
-                print(f"Found item: {item.title}")
-
-                # Load and prepare the field definitions from the CSV
-                try:
-                    field_info_df = pd.read_csv(csv_path)
-                    # Use fillna('') to handle empty cells for descriptions
-                    field_lookup = field_info_df.fillna('').set_index('name').to_dict('index')
-                except FileNotFoundError:
-                    print(f"Error: CSV file not found at {csv_path}. Skipping item {item_id}.")
-                    continue
-                except KeyError:
-                    print(f"Error: CSV at {csv_path} must contain a 'name' column. Skipping item {item_id}.")
-                    continue
-
-                # Loop through the specified layers in the feature service
-                for index in layer_indices:
-                    if index >= len(item.layers):
-                        print(f"Warning: Layer index {index} is out of bounds for item {item_id}. Skipping this layer.")
-                        continue
-
-                    layer_to_update = item.layers[index]
-                    print(f"Processing layer {index}: {layer_to_update.properties.name}")
-                    
-                    # Get the layer definition and modify it
-                    layer_definition = layer_to_update.properties
-                    fields_updated_count = 0
-
-                    for field in layer_definition['fields']:
-                        field_name = field['name']
-                        if field_name in field_lookup:
-                            # Update alias from the lookup dictionary
-                            field['alias'] = field_lookup[field_name].get('alias', field['alias'])
-                            
-                            # Format description for AGOL pop-ups
-                            # Get the simple text description from the CSV
-                            simple_desc = field_lookup[field_name].get('description', '')
-
-                            # Create the dictionary with the required structure
-                            structured_desc_dict = {
-                                "value": simple_desc,
-                                "fieldValueType": ""
-                            }
-                            
-                            # Convert the dictionary to a JSON formatted string
-                            final_description_string = json.dumps(structured_desc_dict)
-                            
-                            # Assign the JSON string to the field's description
-                            field['description'] = final_description_string
-
-                            print(f"     - Staging update for field: {field_name}")
-                            fields_updated_count += 1
-                    
-                    # Apply the changes if any were staged
-                    if fields_updated_count > 0:
-                        update_dict = {"fields": layer_definition['fields']}
-                        result = layer_to_update.manager.update_definition(update_dict)
-
-                        if 'success' not in result or not result['success']:
-                        # Backup: If the manager blocks the action, update the Item's data property
-                            item.update(item_properties={'text': json.dumps({"layers": [update_dict]})})
-                        print(f"Successfully applied {fields_updated_count} updates to layer '{layer_to_update.properties.name}'.")
-                    else:
-                        print("No matching fields found in CSV. No updates needed for this layer.")
-
-            except Exception as e:
-                print(f"An error occurred while processing item {item_id}: {e}")
+                desired = load_field_lookup(csv_path)
+            except FileNotFoundError:
+                print(f"Error: CSV file not found at {csv_path}. Skipping item {item_id}.")
+                continue
+            except KeyError:
+                print(f"Error: CSV at {csv_path} must contain a 'name' column. Skipping item {item_id}.")
+                continue
+            desired_hash = definition_hash(desired)
+            jobs.extend((item_id, index, desired, desired_hash) for index in layer_indices)
+
+        if jobs:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+                futures = [submit(executor, process_layer, *job) for job in jobs]
+                for future in futures:
+                    key, status = future.result()
+                    statuses[key] = status
 
     except Exception as e:
-        print(f"A critical error occurred: {e}")
\ No newline at end of file
+        print(f"A critical error occurred: {e}")
+
+    if state_path:
+        try:
+            save_definition_hashes(state, state_path)
+        except OSError as e:
+            print(f"Warning: Could not save field definition hashes to {state_path}: {e}")
+
+    counts = {status: list(statuses.values()).count(status) for status in dict.fromkeys(statuses.values())}
+    print(f"--- Field definitions: {', '.join(f'{count} {status}' for status, count in counts.items()) or 'nothing to do'} ---")
+    return statuses
@@ -0,0 +1,264 @@
+#####################################################
+##   TIMING/THROUGHPUT SPANS AND JSON RUN REPORT   ##
+#####################################################
+
+# Records a timing span for each workflow stage, chart and layer, with
+# counts attached (bytes downloaded, features read, features uploaded,
+# AGOL requests and their latency, ...), and writes them to a JSON run
+# report. Spans nest: a span opened while another is active (in the same
+# thread, or in a thread started with submit()) becomes its child, and
+# add_count() adds to the innermost active span.
+# Set ENC_PROFILE=cprofile and/or tracemalloc (comma-separated) to also
+# profile the run, see profile_run. cProfile only sees the thread that
+# enabled it, so threads started with submit() (workflow stages, downloads,
+# uploads) are profiled on their own and merged into the run's profile.
+
+import os
+import io
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import contextvars
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+_lock = threading.Lock()
+_spans = []
+_current_span = contextvars.ContextVar("current_span", default=None)
+_run = {"id": uuid.uuid4().hex[:12], "started": datetime.now(timezone.utc).isoformat(), "start": time.perf_counter()}
+# Finished per-thread profilers of the active cProfile run, None when not profiling
+_thread_profilers = None
+
+def reset_run():
+    """
+    Starts a new run report, dropping any spans recorded so far.
+    """
+    with _lock:
+        _spans.clear()
+        _run.update({"id": uuid.uuid4().hex[:12], "started": datetime.now(timezone.utc).isoformat(), "start": time.perf_counter()})
+
+def _new_span(name, attributes, parent):
+    span = {
+        "id": uuid.uuid4().hex[:12],
+        "parent": parent["id"] if parent else None,
+        "name": name,
+        "attributes": dict(attributes),
+        "start_s": round(time.perf_counter() - _run["start"], 4),
+        "duration_s": None,
+        "status": "ok",
+        "counts": {}
+    }
+    with _lock:
+        _spans.append(span)
+    return span
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Times a block of work as a span, e.g.
+        with span("chart", chart="US4MA1CC.zip"):
+    Exceptions are recorded on the span (status "error") and re-raised.
+    """
+    current = _new_span(name, attributes, _current_span.get())
+    token = _current_span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current["status"] = "error"
+        current["error"] = str(e)
+        raise
+    finally:
+        current["duration_s"] = round(time.perf_counter() - start, 4)
+        _current_span.reset(token)
+
+def record_span(name, duration_s, counts=None, status="ok", parent_span=None, **attributes):
+    """
+    Records a span for work that was timed elsewhere, e.g. in a worker
+    process. It is a child of parent_span if given, else of the active span.
+    """
+    current = _new_span(name, attributes, parent_span or _current_span.get())
+    current["start_s"] = round(current["start_s"] - duration_s, 4)
+    current["duration_s"] = round(duration_s, 4)
+    current["status"] = status
+    current["counts"] = dict(counts or {})
+    return current
+
+def add_count(name, value=1):
+    """
+    Adds value to a count on the innermost active span. Does nothing
+    outside of a span.
+    """
+    current = _current_span.get()
+    if current is None:
+        return
+    with _lock:
+        current["counts"][name] = current["counts"].get(name, 0) + value
+
+def set_attribute(name, value):
+    """
+    Sets an attribute on the innermost active span.
+    """
+    current = _current_span.get()
+    if current is not None:
+        current["attributes"][name] = value
+
+def submit(executor, function, *args, **kwargs):
+    """
+    executor.submit that runs function inside the caller's active span, so
+    spans and counts from worker threads are attached to it. The worker is
+    profiled too while profile_run is profiling with cProfile.
+    """
+    return executor.submit(contextvars.copy_context().run, _run_profiled, function, *args, **kwargs)
+
+def _run_profiled(function, *args, **kwargs):
+    with profile_thread():
+        return function(*args, **kwargs)
+
+@contextmanager
+def profile_thread():
+    """
+    Profiles the enclosed block with its own cProfile profiler if profile_run
+    is profiling with cProfile, and hands the profiler to profile_run to
+    merge into the run's stats. Does nothing otherwise.
+    """
+    profilers = _thread_profilers
+    profiler = None
+    if profilers is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+: the run's profiler already sees every thread
+            profiler = None
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            with _lock:
+                profilers.append(profiler)
+
+@contextmanager
+def timed_request(kind):
+    """
+    Times one AGOL request and adds it to the active span's request count
+    and latency: "<kind>_requests", "<kind>_seconds" and, on failure,
+    "<kind>_errors".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        add_count(f"{kind}_errors")
+        raise
+    finally:
+        add_count(f"{kind}_requests")
+        add_count(f"{kind}_seconds", round(time.perf_counter() - start, 4))
+
+def build_run_report():
+    """
+    Builds the run report: every span, plus the counts summed per span name
+    and over the whole run.
+    """
+    with _lock:
+        spans = [dict(s, counts=dict(s["counts"]), attributes=dict(s["attributes"])) for s in _spans]
+
+    totals = {}
+    by_name = {}
+    for s in spans:
+        summary = by_name.setdefault(s["name"], {"spans": 0, "duration_s": 0.0, "errors": 0, "counts": {}})
+        summary["spans"] += 1
+        summary["duration_s"] = round(summary["duration_s"] + (s["duration_s"] or 0), 4)
+        summary["errors"] += s["status"] == "error"
+        for count, value in s["counts"].items():
+            summary["counts"][count] = round(summary["counts"].get(count, 0) + value, 4)
+            totals[count] = round(totals.get(count, 0) + value, 4)
+
+    return {
+        "run_id": _run["id"],
+        "started": _run["started"],
+        "duration_s": round(time.perf_counter() - _run["start"], 4),
+        "totals": totals,
+        "by_span_name": by_name,
+        "spans": spans
+    }
+
+def write_run_report(report_path, extra=None):
+    """
+    Writes the run report as JSON (through a temp file) and prints a short
+    summary of the slowest spans. extra is merged into the report (e.g. profiling results).
+    """
+    report = build_run_report()
+    report.update(extra or {})
+    report_path = Path(report_path)
+    try:
+        report_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = report_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+        os.replace(tmp_path, report_path)
+        print(f"Run report written to {report_path}")
+    except OSError as e:
+        print(f"Warning: Could not write run report to {report_path}: {e}")
+
+    print(f"--- Run {report['run_id']} took {report['duration_s']:.1f} s ---")
+    for name, summary in sorted(report["by_span_name"].items(), key=lambda item: -item[1]["duration_s"])[:10]:
+        print(f"     {name}: {summary['spans']} span(s), {summary['duration_s']:.2f} s, {summary['errors']} error(s)")
+    return report
+
+@contextmanager
+def profile_run(modes, output_dir, top=25):
+    """
+    Optionally profiles the enclosed block. modes is a comma-separated string
+    (e.g. the ENC_PROFILE environment variable) containing "cprofile"
+    (stats of this thread and the threads started with submit() merged and
+    saved to output_dir/profile.pstats, top functions by cumulative time
+    printed) and/or "tracemalloc" (peak traced memory and top allocation
+    sites). Yields a dictionary the results are added to, for the run report.
+    """
+    global _thread_profilers
+    modes = {mode.strip().lower() for mode in (modes or "").split(",") if mode.strip()}
+    results = {}
+    profiler = cProfile.Profile() if "cprofile" in modes else None
+    if "tracemalloc" in modes:
+        tracemalloc.start(10)
+    if profiler:
+        _thread_profilers = []
+        profiler.enable()
+    try:
+        yield results
+    finally:
+        if profiler:
+            profiler.disable()
+            with _lock:
+                thread_profilers, _thread_profilers = _thread_profilers, None
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            top_sites = [
+                {"site": str(stat.traceback[0]), "size_mib": round(stat.size / 2**20, 3), "blocks": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ]
+            print(f"Traced memory: peak {peak / 2**20:.1f} MiB, current {current / 2**20:.1f} MiB")
+            for site in top_sites[:10]:
+                print(f"     {site['site']}: {site['size_mib']} MiB")
+            results["tracemalloc"] = {"peak_mib": round(peak / 2**20, 2), "current_mib": round(current / 2**20, 2), "top_sites": top_sites}
+        if profiler:
+            output_dir = Path(output_dir)
+            output_dir.mkdir(parents=True, exist_ok=True)
+            stats_path = output_dir / "profile.pstats"
+            summary = io.StringIO()
+            stats = pstats.Stats(profiler, stream=summary)
+            for thread_profiler in thread_profilers:
+                stats.add(thread_profiler)
+            stats.dump_stats(stats_path)
+            stats.sort_stats("cumulative").print_stats(top)
+            print(summary.getvalue())
+            results["cprofile"] = {"stats_path": str(stats_path), "threads_merged": len(thread_profilers)}
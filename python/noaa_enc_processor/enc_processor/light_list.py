@@ -0,0 +1,268 @@
+#####################################################
+##   USCG LIGHT LIST INGESTION: OFFSHORE WIND      ##
+##     STRUCTURES (WTGs AND OSSs) TO A FILE GDB    ##
+#####################################################
+
+# Python version of R/scrape_uscg_msi.R. The light list GeoJSONs for the
+# configured districts are downloaded from the USCG Navigation Center and
+# read in parallel. Files whose raw bytes never mention WTG or PROD (most
+# of them) are skipped without being parsed, and in the rest only the wind
+# structure lights (NAME containing WTG or PROD, DESCRIPTION_TYPE LT or LB)
+# are pulled out by OGR while parsing. The result is written to
+# data/uscg_msi_struct.gdb with the same schema as the R script.
+
+import os
+import re
+import shutil
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import geopandas as gpd
+import requests
+from .downloader import create_session, conditional_download, load_validators, save_validators
+
+USCG_NAVCEN_URL = "https://www.navcen.uscg.gov"
+LIGHT_LIST_PAGE = "/msi"
+
+# Name of the file (in the light list folder) storing each file's ETag/Last-Modified
+LIGHT_LIST_VALIDATORS_FILENAME = "light_list_validators.json"
+
+# Columns read from the light lists, and the output schema (plus geometry)
+LIGHT_LIST_COLUMNS = ["NAME", "DESCRIPTION_TYPE", "REMARK", "STRUCTURE_REMARK", "CREATE_DATE", "MODIFIED_DATE", "DECIMAL_LONGITUDE", "DECIMAL_LATITUDE"]
+OUTPUT_COLUMNS = ["OWF", "STRUCTURE_ID"] + LIGHT_LIST_COLUMNS
+OUTPUT_LAYER = "uscg_msi_struct"
+
+STRUCTURE_NAME_PATTERN = "WTG|PROD"
+DESCRIPTION_TYPES = ("LT", "LB")
+
+# Wind farm names in the light list that differ from the names used elsewhere
+OWF_NAME_FIXES = {"Vineyard Wind": "Vineyard Wind 1"}
+
+class _LinkParser(HTMLParser):
+    """
+    Collects the href of every link on a page.
+    """
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            href = dict(attrs).get("href")
+            if href:
+                self.links.append(href)
+
+def light_list_district(filename):
+    """
+    Returns the district ID (e.g. "D01") in a light list file name.
+    """
+    match = re.search(r"D[^\s_]*", Path(filename).stem)
+    return match.group(0) if match else None
+
+def find_light_list_links(page_html, districts):
+    """
+    Returns the light list GeoJSON links on the MSI page for the given
+    districts, e.g. ["D01", "D05"].
+    """
+    parser = _LinkParser()
+    parser.feed(page_html)
+    links = []
+    for href in parser.links:
+        filename = Path(href.split("?")[0]).name
+        if filename.lower().startswith("lightlist") and filename.lower().endswith(".geojson") and light_list_district(filename) in districts:
+            links.append(href)
+    return list(dict.fromkeys(links))
+
+def download_light_lists(destination_folder, districts, max_workers=4, base_url=USCG_NAVCEN_URL):
+    """
+    Downloads the light list GeoJSONs for the given districts from the USCG
+    MSI page, skipping files that haven't changed since the last run (same
+    ETag/Last-Modified validators as the ENC downloads).
+    Returns {filename: "downloaded" | "unchanged" | "failed"}.
+    """
+    destination_folder = Path(destination_folder)
+    destination_folder.mkdir(parents=True, exist_ok=True)
+    validators_path = destination_folder / LIGHT_LIST_VALIDATORS_FILENAME
+    validators = load_validators(validators_path)
+
+    statuses = {}
+    session = create_session(pool_size=max_workers)
+    try:
+        print(f"Finding light list files for districts {list(districts)}...")
+        response = session.get(urljoin(base_url, LIGHT_LIST_PAGE), timeout=60)
+        response.raise_for_status()
+        links = find_light_list_links(response.text, districts)
+        if not links:
+            print("No light list links found on the MSI page.")
+            return statuses
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for link in links:
+                filename = Path(link.split("?")[0]).name
+                futures[filename] = executor.submit(conditional_download, session, urljoin(base_url, link), destination_folder / filename, validators.get(filename))
+            for filename, future in futures.items():
+                try:
+                    status, validator, _ = future.result()
+                except (requests.exceptions.RequestException, OSError) as e:
+                    print(f"Failed to download {filename}. Error: {e}.")
+                    statuses[filename] = "failed"
+                    continue
+                statuses[filename] = status
+                if status == "downloaded":
+                    validators[filename] = validator
+    except requests.exceptions.RequestException as e:
+        print(f"Could not read the light list page. Error: {e}.")
+    finally:
+        session.close()
+
+    try:
+        save_validators(validators, validators_path)
+    except OSError as e:
+        print(f"Warning: Could not save light list validators to {validators_path}: {e}")
+
+    downloaded = sum(1 for status in statuses.values() if status == "downloaded")
+    print(f"--- Light lists: {downloaded} downloaded, {len(statuses) - downloaded} unchanged or failed ---")
+    return statuses
+
+def may_contain_structures(path, block_size=1024 * 1024):
+    """
+    Scans a file's raw bytes, a block at a time, for WTG or PROD. A file
+    without either can't hold a wind structure, so it needn't be parsed.
+    """
+    pattern = re.compile(STRUCTURE_NAME_PATTERN.encode())
+    overlap = max(len(token) for token in STRUCTURE_NAME_PATTERN.split("|")) - 1
+    tail = b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return False
+            if pattern.search(tail + block):
+                return True
+            # Keep the end of the block in case a match spans two blocks
+            tail = block[-overlap:]
+
+def read_light_list_structures(path):
+    """
+    Reads the wind structure lights from one light list GeoJSON. The filter
+    is pushed down to OGR, so only matching features are turned into rows.
+    OGR's LIKE ignores case, so the case-sensitive WTG|PROD match is applied
+    again to the (few) rows returned. Returns None for a file with no
+    wind structures.
+    """
+    if not may_contain_structures(path):
+        return None
+    name_filter = " OR ".join(f"NAME LIKE '%{token}%'" for token in STRUCTURE_NAME_PATTERN.split("|"))
+    type_filter = ", ".join(f"'{description_type}'" for description_type in DESCRIPTION_TYPES)
+    gdf = gpd.read_file(path, columns=LIGHT_LIST_COLUMNS, where=f"({name_filter}) AND DESCRIPTION_TYPE IN ({type_filter})")
+    return gdf[gdf["NAME"].str.contains(STRUCTURE_NAME_PATTERN, na=False)]
+
+def format_structures(gdf):
+    """
+    Adds the wind farm (OWF: the name up to "WTG"/"PROD") and structure ID
+    (the last alphanumeric token of the name) columns and orders the columns
+    as in the output GDB.
+    """
+    names = gdf["NAME"]
+    gdf = gdf.assign(
+        OWF=names.str.replace(r"WTG.*|PROD.*", "", regex=True).str.strip().replace(OWF_NAME_FIXES),
+        STRUCTURE_ID=names.str.extract(r"([a-zA-Z0-9]+)[^a-zA-Z0-9]*$", expand=False),
+        # Epoch milliseconds, stored as doubles like the R output
+        CREATE_DATE=gdf["CREATE_DATE"].astype("float64"),
+        MODIFIED_DATE=gdf["MODIFIED_DATE"].astype("float64")
+    )
+    return gdf[OUTPUT_COLUMNS + ["geometry"]]
+
+def list_light_list_files(light_list_dir, districts=None):
+    """
+    Returns the light list GeoJSONs in light_list_dir (only the given
+    districts, if set), sorted by file name.
+    """
+    files = sorted(Path(light_list_dir).glob("lightList*.geojson"))
+    if districts is not None:
+        files = [path for path in files if light_list_district(path.name) in districts]
+    return files
+
+def build_structure_layer(paths, max_workers=4):
+    """
+    Reads every light list in parallel and returns the formatted wind
+    structures, in file order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        frames = list(executor.map(read_light_list_structures, paths))
+    frames = [frame for frame in frames if frame is not None and not frame.empty]
+    if not frames:
+        return None
+    gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
+    return format_structures(gdf)
+
+def write_structure_gdb(gdf, output_path):
+    """
+    Replaces output_path (a File Geodatabase) with the structures. The new
+    GDB is written next to it first, so a failed write keeps the old one.
+    """
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(f".{output_path.stem}.tmp.gdb")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    gdf.to_file(tmp_path, layer=OUTPUT_LAYER, driver="OpenFileGDB")
+
+    old_path = output_path.with_name(f".{output_path.stem}.old.gdb")
+    if output_path.exists():
+        os.replace(output_path, old_path)
+    os.replace(tmp_path, output_path)
+    if old_path.exists():
+        shutil.rmtree(old_path)
+
+def structures_unchanged(gdf, output_path):
+    """
+    Returns True if output_path already holds exactly these structures, so
+    it needn't be rewritten (and recommitted) by the workflow.
+    """
+    if not Path(output_path).exists():
+        return False
+    try:
+        existing = gpd.read_file(output_path, layer=OUTPUT_LAYER)
+    except Exception:
+        return False
+    if list(existing.columns) != list(gdf.columns) or len(existing) != len(gdf):
+        return False
+    attributes_equal = pd.DataFrame(existing.drop(columns="geometry")).equals(pd.DataFrame(gdf.drop(columns="geometry")).reset_index(drop=True))
+    return attributes_equal and bool(existing.geometry.geom_equals_exact(gdf.geometry.reset_index(drop=True), 1e-9).all())
+
+def update_light_list_structures(light_list_dir, output_path, districts=("D01", "D05"), max_workers=4, download=True):
+    """
+    Downloads the current light lists (unless download is False), extracts
+    the offshore wind structures and rewrites output_path.
+    Returns the structures written, or None if there were none.
+    """
+    if download:
+        download_light_lists(light_list_dir, districts, max_workers=max_workers)
+
+    paths = list_light_list_files(light_list_dir, districts)
+    if not paths:
+        print(f"No light list files found in {light_list_dir}.")
+        return None
+
+    print(f"Reading wind structures from {len(paths)} light list files...")
+    gdf = build_structure_layer(paths, max_workers=max_workers)
+    if gdf is None:
+        print("No wind structures found in the light lists. Keeping the existing GDB.")
+        return None
+
+    for owf, count in gdf["OWF"].value_counts().sort_index().items():
+        print(f"     {owf}: {count}")
+
+    if structures_unchanged(gdf, output_path):
+        print(f"{output_path} is already up to date. Skipping write.")
+        return gdf
+
+    try:
+        write_structure_gdb(gdf, output_path)
+        print(f"Wrote {len(gdf)} structures to {output_path}")
+    except Exception as e:
+        print(f"Failed to write {output_path}: {e}")
+    return gdf
@@ -3,286 +3,556 @@
 ##  UPDATE EXISTING AGOL HOSTED FEATURE SERVICES   ##
 #####################################################
 
-import pandas as pd
+import numpy as np
 import geopandas as gpd
-import zipfile
-import tempfile
 import os
-import fiona
-import json
-from arcgis.features import FeatureSet
-from arcgis.features import FeatureLayerCollection
-from .enc_preprocessor import read_enc_layer
+import time
+import threading
+import multiprocessing
+from datetime import date
+from collections import deque
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+from .enc_preprocessor import extract_chart
+from .extraction_cache import prune_extraction_cache
 from .code_mapper import map_column_codes
+from .agol_sync import start_delta_sync
+from .edit_uploader import submit_edits, merge_upload_summaries, print_upload_summary
+from .esri_encoder import gdf_to_esri_features
+from .feature_rules import apply_post_processing
+from .deduplicator import deduplicate_features
+from .staging_store import staging_available, clear_staging, stage_layer, staged_layer_info, iter_staged_layer
+from .instrumentation import span, record_span, add_count
+from .snapshot_store import snapshots_available, snapshot_chunks
+from .agol_metadata import AgolMetadataCache
+from .dtype_compactor import compact_dtypes, concat_frames, drop_null_columns
+from .shard_store import begin_shard, write_partial, finish_shard, complete_shards, read_partials
 
-def process_and_update_features(gis, data_dir, feature_config):
+# Run options of process_and_update_features, extract_shard and reduce_and_update_features
+# (config.processing_options sets them for a run)
+PROCESSING_DEFAULTS = {
+    "max_workers": 1, # Worker processes extracting the charts
+    "cache_dir": None, # Files reused between runs (extraction cache, compiled data dictionary)
+    "upload_mode": "delta", # "delta" sends only the changed features (keyed on sync_key), "truncate" reloads the layer
+    "upload_options": None, # Passed to edit_uploader.submit_edits
+    "streaming": False, # Spill extracted layers to the staging store and process them in chunks
+    "staging_dir": None, # Staging store folder (default cache_dir/staging)
+    "chunk_size": 50000, # Rows per chunk when streaming
+    "snapshot_dir": None, # Also append each layer's final features to the snapshot history
+    "run_date": None # Date of the snapshot (default today)
+}
+
+def extract_chart_timed(zip_path, feature_config, extraction_cache_dir=None):
+    """
+    Runs extract_chart (in a worker process when extraction is parallel) and
+    returns (chart result, per-layer stats, seconds taken) so the parent
+    process can record the chart's timing spans.
+    """
+    stats = {}
+    start = time.perf_counter()
+    chart_result = extract_chart(zip_path, feature_config, extraction_cache_dir, stats=stats)
+    return chart_result, stats, time.perf_counter() - start
+
+def record_chart_spans(zip_file, stats, seconds, status="ok"):
+    """
+    Records an "extract_chart" span for one chart with an "extract_layer"
+    child span per layer read (or loaded from the extraction cache).
+    """
+    # Feature counts go on the layer spans only, so run totals don't count them twice
+    chart_counts = {"cached_layers": sum(layer_stats["cached"] for layer_stats in stats.values())}
+    chart_span = record_span("extract_chart", seconds, counts=chart_counts, status=status, chart=zip_file)
+    for name, layer_stats in stats.items():
+        record_span(
+            "extract_layer",
+            layer_stats["seconds"],
+            counts={"features_read": layer_stats["features_read"], "features_after_filter": layer_stats["features_after_filter"]},
+            parent_span=chart_span,
+            chart=zip_file,
+            layer=name,
+            cached=layer_stats["cached"]
+        )
+
+def iter_chart_results(zip_paths, feature_config, max_workers=1, extraction_cache_dir=None):
+    """
+    Extracts the configured features chart by chart, yielding (ZIP file name,
+    {feature name: GeoDataFrame}) in the order of zip_paths. With
+    max_workers > 1 charts are extracted in worker processes, with at most
+    2 * max_workers charts in flight so finished results never pile up in memory.
+    zip_paths may also be an iterator that yields charts as they are
+    downloaded. Each chart's extraction is recorded as a span in the run report.
+    """
+    if max_workers and max_workers > 1 and (not hasattr(zip_paths, "__len__") or len(zip_paths) > 1):
+        print(f"Extracting charts using {max_workers} worker processes...")
+        # Forking while other workflow stages run threads can deadlock the
+        # workers, so start them from a clean server process off the main thread
+        mp_context = None
+        if threading.current_thread() is not threading.main_thread() and "forkserver" in multiprocessing.get_all_start_methods():
+            mp_context = multiprocessing.get_context("forkserver")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context) as executor:
+            pending = deque()
+            remaining = iter(zip_paths)
+            for zip_path in remaining:
+                pending.append((zip_path, executor.submit(extract_chart_timed, zip_path, feature_config, extraction_cache_dir)))
+                if len(pending) >= 2 * max_workers:
+                    break
+            # Collect results in submission order, not completion order
+            while pending:
+                zip_path, future = pending.popleft()
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    pending.append((next_path, executor.submit(extract_chart_timed, next_path, feature_config, extraction_cache_dir)))
+                try:
+                    chart_result, stats, seconds = future.result()
+                    record_chart_spans(os.path.basename(zip_path), stats, seconds)
+                except Exception as e:
+                    print(f"Worker failed to process {os.path.basename(zip_path)}: {e}")
+                    record_chart_spans(os.path.basename(zip_path), {}, 0.0, status="error")
+                    chart_result = {}
+                yield os.path.basename(zip_path), chart_result
+    else:
+        for zip_path in zip_paths:
+            chart_result, stats, seconds = extract_chart_timed(zip_path, feature_config, extraction_cache_dir)
+            record_chart_spans(os.path.basename(zip_path), stats, seconds)
+            yield os.path.basename(zip_path), chart_result
+
+def list_chart_paths(data_dir, chart_files=None):
+    """
+    Returns the chart ZIP paths in data_dir, sorted by file name so the
+    merge order does not depend on the file system. chart_files limits the
+    result to those ZIP file names.
     """
-    Processes ENC data from ZIP files, extracts specified features, and creates SEDF 
-    (spatially enabled dataframe). Then, utilizes SEDF to update corresponding hosted 
-    feature layers in AGOL.
+    zip_files = sorted(f for f in os.listdir(data_dir) if f.endswith(".zip"))
+    if chart_files is not None:
+        chart_files = set(chart_files)
+        zip_files = [f for f in zip_files if f in chart_files]
+    return [os.path.join(data_dir, zip_file) for zip_file in zip_files]
+
+def chart_sources(data_dir, chart_files=None, chart_feed=None):
+    """
+    Returns (chart ZIP paths to extract, {ZIP file name: merge position}).
+    Without chart_feed these are the charts in data_dir (list_chart_paths).
+    chart_feed is an iterable of chart file names yielded as each chart is
+    on disk (downloader.ChartFeed.charts), so extraction starts before every
+    download has finished. Charts are still merged in sorted file name
+    order, which needs chart_files up front.
+    """
+    if chart_feed is None:
+        zip_paths = list_chart_paths(data_dir, chart_files)
+        zip_files = [os.path.basename(zip_path) for zip_path in zip_paths]
+    else:
+        zip_paths = (os.path.join(data_dir, zip_file) for zip_file in chart_feed)
+        zip_files = sorted(set(chart_files))
+    return zip_paths, {zip_file: position for position, zip_file in enumerate(zip_files)}
+
+def extract_features(data_dir, feature_config, max_workers=1, cache_dir=None, chart_files=None, chart_feed=None):
     """
+    Extracts the configured features from every ENC ZIP file in data_dir.
+    With max_workers > 1 each chart is handed to a worker process. Charts are
+    always merged in sorted file name order so that the result (and the
+    FIDN deduplication that keeps the first match) matches the serial path.
+    With cache_dir set, unchanged charts are served from the extraction cache.
+    chart_files limits extraction to those ZIP file names (e.g. the charts
+    selected for this run), ignoring other charts left in data_dir.
+    chart_feed extracts the charts as they arrive (see chart_sources).
+    """
+    extraction_cache_dir = os.path.join(cache_dir, "extraction") if cache_dir else None
     feature_results = {key: [] for key in feature_config}
 
-    # Loop through ZIP files and extract data
-    print("Starting data extraction from ENC files...")
-    for zip_file in os.listdir(data_dir):
-        if not zip_file.endswith(".zip"):
-            continue
+    zip_paths, merge_order = chart_sources(data_dir, chart_files, chart_feed)
+    chart_results = dict(iter_chart_results(zip_paths, feature_config, max_workers, extraction_cache_dir))
+    # Merge in sorted file name order, whatever order the charts arrived in
+    for zip_file in sorted(chart_results, key=merge_order.get):
+        for name, gdf in chart_results.pop(zip_file).items():
+            feature_results[name].append(gdf)
+
+    if extraction_cache_dir:
+        prune_extraction_cache(extraction_cache_dir)
+
+    return feature_results
+
+def stage_features(data_dir, feature_config, staging_dir, max_workers=1, cache_dir=None, chart_files=None, chart_feed=None):
+    """
+    Streaming version of extract_features: each chart's layers are appended
+    to the on-disk staging store (staging_store.py) as soon as the chart is
+    extracted, so only the charts in flight are held in memory.
+    Returns {feature name: number of staged features}.
+    """
+    extraction_cache_dir = os.path.join(cache_dir, "extraction") if cache_dir else None
+    clear_staging(staging_dir)
+    staged_counts = {key: 0 for key in feature_config}
 
-        print(f"Processing source file: {zip_file}")
-        # Create temp folder and extract data from zip to temp folder
-        zip_path = os.path.join(data_dir, zip_file)
-        with tempfile.TemporaryDirectory() as temp_dir:
+    zip_paths, merge_order = chart_sources(data_dir, chart_files, chart_feed)
+    for zip_file, chart_result in iter_chart_results(zip_paths, feature_config, max_workers, extraction_cache_dir):
+        part_number = merge_order[zip_file]
+        for name, gdf in chart_result.items():
             try:
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
+                # Number the parts so they are read back in sorted chart order
+                stage_layer(staging_dir, name, f"{part_number:05d}_{os.path.splitext(zip_file)[0]}", gdf)
+                staged_counts[name] += len(gdf)
             except Exception as e:
-                print(f"Failed to unzip {zip_file}: {e}")
-                continue
-            # Walk through all folders in temp folder to find .000 file    
-            enc_files = [os.path.join(root, file) for root, _, files in os.walk(temp_dir) for file in files if file.endswith(".000")]
-            if not enc_files:
-                print(f"No .000 ENC file found in {zip_file}")
-                continue
-            # Read first file in folder that has .000 file extentions
-            # There should only be one file with this extention
-            enc_path = enc_files[0]
+                print(f"[{name}] Failed to stage features from {zip_file}: {e}")
+
+    if extraction_cache_dir:
+        prune_extraction_cache(extraction_cache_dir)
+
+    return staged_counts
+
+def prepare_features(full_gdf, name, info, cache_dir=None, deduplicate=True, map_codes=True):
+    """
+    Runs the processing stages on a layer's combined features: duplicate
+    merging (unless deduplicate is False, e.g. already done), code-to-value
+    mapping (unless map_codes is False, e.g. done by the shards) and the
+    configured post-processing rules. Dtypes are compacted
+    (dtype_compactor.py) before mapping, so codes are decoded once per
+    distinct value, and again for the columns the rules made.
+    """
+    full_gdf = compact_dtypes(full_gdf)
+
+    # Merge duplicates from overlapping cells (same key or within the configured distance),
+    # keeping the record from the most detailed cell
+    dedup_config = info.get("dedup")
+    if deduplicate and dedup_config:
+        print(f"[{name}] Removing duplicate features from overlapping cells...")
+        full_gdf, _ = deduplicate_features(
+            full_gdf,
+            key_field=dedup_config.get("key"),
+            distance_m=dedup_config.get("distance_m"),
+            name=name
+        )
+    elif deduplicate:
+        print(f"[{name}] No deduplication configured. Skipping deduplication.")
+
+    mapping_csv_path = info.get("mapping_csv")
+
+    # Call mapping function to convert any coded data into a non-coded, readable value    
+    if not map_codes:
+        print(f"[{name}] Codes were already mapped. Skipping mapping.")
+    elif mapping_csv_path:
+        # If a mapping file is defined in the config, call the function
+        # and overwrite full_gdf with the processed result.
+        full_gdf = map_column_codes(full_gdf, mapping_csv_path, cache_dir=cache_dir)
+    else:
+        print(f"[{name}] No mapping CSV configured. Proceeding with original data.")
+
+    # Run the configured post-processing rules (OBJNAM fills, splits, status, exclusions)
+    post_processing_rules = info.get("post_processing")
+    if post_processing_rules:
+        print(f"[{name}] Applying {len(post_processing_rules)} post-processing rules...")
+        full_gdf = apply_post_processing(full_gdf, post_processing_rules, name=name)
+
+    return compact_dtypes(full_gdf)
+
+def iter_prepared_staged_layer(staging_dir, name, info, cache_dir=None, chunk_size=50000):
+    """
+    Reads a staged layer back in chunks of at most chunk_size rows and yields
+    each chunk after the processing stages. Duplicate merging needs every
+    feature at once, so it runs first on just the key, source_file and
+    geometry columns (compacted, so source_file is one small code per row);
+    the chunks then keep only the surviving rows. That narrow frame and one
+    flag per row are all that is held for the whole layer.
+    """
+    dedup_config = info.get("dedup")
+    keep = None
+    if dedup_config:
+        _, staged_columns, _, _ = staged_layer_info(staging_dir, name)
+        narrow_columns = [col for col in (dedup_config.get("key"), "source_file") if col in staged_columns]
+        narrow_chunks = [compact_dtypes(chunk) for chunk in iter_staged_layer(staging_dir, name, chunk_size=chunk_size, columns=narrow_columns)]
+        crs = narrow_chunks[0].crs
+        narrow_gdf = gpd.GeoDataFrame(concat_frames(narrow_chunks), crs=crs)
+        del narrow_chunks
+        narrow_gdf["_staged_row"] = np.arange(len(narrow_gdf), dtype=np.int64)
+
+        print(f"[{name}] Removing duplicate features from overlapping cells...")
+        kept_gdf, _ = deduplicate_features(
+            narrow_gdf,
+            key_field=dedup_config.get("key"),
+            distance_m=dedup_config.get("distance_m"),
+            name=name
+        )
+        keep = np.zeros(len(narrow_gdf), dtype=bool)
+        keep[kept_gdf["_staged_row"].to_numpy()] = True
+        del narrow_gdf, kept_gdf
+
+    row_offset = 0
+    for chunk in iter_staged_layer(staging_dir, name, chunk_size=chunk_size):
+        chunk_keep = keep[row_offset:row_offset + len(chunk)] if keep is not None else None
+        row_offset += len(chunk)
+        if chunk_keep is not None:
+            chunk = chunk[chunk_keep]
+        if not chunk.empty:
+            yield prepare_features(chunk, name, info, cache_dir=cache_dir, deduplicate=False)
+
+def upload_features(gis, name, info, gdf_chunks, upload_mode="delta", upload_options=None, metadata_cache=None):
+    """
+    Encodes the processed features (an iterable of GeoDataFrames, e.g. one
+    combined layer or the chunks of a staged layer) in the AGOL layer's
+    spatial reference and syncs them to the layer chunk by chunk, so only
+    one chunk's Esri JSON features are held at a time. The item, layer and its
+    spatial reference/schema are looked up through metadata_cache
+    (agol_metadata.AgolMetadataCache), if given.
+    """
+    metadata_cache = metadata_cache or AgolMetadataCache(gis)
+    # Define AGOL item ID
+    agol_id = info.get("agol_item_id")
+    if not agol_id:
+        print(f"[{name}] No AGOL item ID configured. Skipping upload.")
+        return
+        
+    try:
+        print(f"[{name}] Connecting to AGOL item {agol_id}...")
+        agol_layer_index = info.get("agol_layer_index", 0)
+        target_layer = metadata_cache.layer(agol_id, agol_layer_index)
+        if target_layer is None:
+            print(f"[{name}] AGOL item {agol_id} or its layer {agol_layer_index} was not found. Skipping upload.")
+            return
+        
+        # Identify Target WKID
+        target_crs_wkid = metadata_cache.spatial_reference(agol_id, agol_layer_index)
+        
+        print(f"[{name}] Target WKID detected: {target_crs_wkid}")
+
+        # Fields the layer accepts, to drop empty columns it doesn't have
+        schema = metadata_cache.schema(agol_id, agol_layer_index)
+        layer_fields = [field["name"] for field in schema["fields"]] if schema and schema.get("fields") else None
+
+        def encoded_chunks():
+            for full_gdf in gdf_chunks:
+                # Reproject and clean GeoDataFrame
+                full_gdf = full_gdf.to_crs(epsg=target_crs_wkid)
+                full_gdf = full_gdf[full_gdf.geometry.notnull()] # Remove any empty geometries
+                if layer_fields:
+                    full_gdf = drop_null_columns(full_gdf, layer_fields)
+
+                # Encode straight to Esri JSON features from the geometry and attribute
+                # arrays (no GeoJSON round trip), every geometry sharing one spatial reference
+                print(f"[{name}] Encoding {len(full_gdf)} features as Esri JSON...")
+                features = gdf_to_esri_features(full_gdf, target_crs_wkid)
+                add_count("features_encoded", len(features))
+                yield features
+
+        # Each chunk is encoded and sent as it arrives, so only one chunk of
+        # Esri JSON features is held at a time. The first chunk is read up front
+        # to set up the delta sync, then put back in front of the rest.
+        chunks = encoded_chunks()
+        first_chunk = next(chunks, [])
+        chunks = chain([first_chunk], chunks)
+
+        # Delta sync on the configured key, sending only what changed
+        sync_key = info.get("sync_key")
+        if upload_mode == "delta" and sync_key:
+            delta_sync = None
             try:
-                layers = fiona.listlayers(enc_path)
+                print(f"[{name}] Delta syncing features using key '{sync_key}'...")
+                delta_sync = start_delta_sync(target_layer, first_chunk, key_fields=[sync_key], upload_options=upload_options,
+                                              layer_properties=schema)
             except Exception as e:
-                print(f"Could not read layers in {zip_file}: {e}")
-                continue
-            # Get layer from extraction_features, set in config.py  
-            for name, info in feature_config.items():
-                layer_name = info["layer_name"]
-                if layer_name not in layers:
-                    continue
+                print(f"[{name}] Delta sync failed: {e}")
 
+            if delta_sync is not None:
                 try:
-                    print(f"Calling read_enc_layer function for layer: {layer_name}")
-                    # Call the function to convert any list columns to comma-separated strings
-                    gdf = read_enc_layer(enc_path, layer_name)
-                    
-                    if gdf.empty:
-                        continue
-                    # Filter using the columns and values from extraction_features, set in config.py
-                    filter_col = info.get("filter_col")
-                    filter_val = info.get("filter_val")
-                    if filter_col and filter_val and filter_col in gdf.columns:
-                        gdf = gdf[gdf[filter_col] == filter_val]
-
-                    if not gdf.empty:
-                        # Add a column to the gdf stating the source file name
-                        gdf["source_file"] = os.path.basename(zip_file)
-                        feature_results[name].append(gdf)
-                        print(f"Found {len(gdf)} features for '{name}' in layer '{layer_name}'")
-
+                    for features in chunks:
+                        delta_sync.sync_chunk(features)
+                    sync_summary = delta_sync.finish()
                 except Exception as e:
-                    print(f"Error processing layer '{layer_name}' from {zip_file}: {e}")
+                    # Edits have already been sent and the chunks can't be read
+                    # again, so no truncate here and no deletes; the next run
+                    # diffs against what was applied and finishes the sync
+                    print(f"[{name}] Delta sync stopped part way: {e}. Deletes were not sent.")
+                    return
+                upload_summary = sync_summary.get("upload")
+                if upload_summary:
+                    add_count("features_uploaded", upload_summary["adds"]["succeeded"] + upload_summary["updates"]["succeeded"])
+                    add_count("features_deleted", upload_summary["deletes"]["succeeded"])
+                add_count("features_unchanged", sync_summary["unchanged"])
+                return
+            print(f"[{name}] Falling back to truncate and reload.")
+
+        # Truncate and Upload
+        print(f"[{name}] Truncating all existing features in AGOL layer...")
+        target_layer.manager.truncate()
+
+        key_fields = [sync_key] if sync_key else None
+        summary = None
+        for features in chunks:
+            if not features:
+                continue
+            print(f"[{name}] Appending {len(features)} new features to AGOL layer...")
+            summary = merge_upload_summaries(summary, submit_edits(target_layer, adds=features, key_fields=key_fields, **(upload_options or {})))
+        if summary is None:
+            print(f"[{name}] No features to append.")
+            return
+        print_upload_summary(name, summary)
+        add_count("features_uploaded", summary["adds"]["succeeded"])
+
+        if not summary["failures"]:
+            print(f"[{name}] AGOL update successful. {summary['adds']['succeeded']} features added.")
+
+    except Exception as e:
+        print(f"[{name}] An unexpected error occurred: {e}")
+
+def snapshot_and_upload(gis, name, info, gdf_chunks, streaming=False, upload_mode="delta", upload_options=None, snapshot_dir=None, run_date=None,
+                        metadata_cache=None):
+    """
+    Records a layer's processed features in the snapshot history (if
+    snapshot_dir is set) and uploads them (upload_features). streaming
+    marks gdf_chunks as a lazy iterator of chunks (iter_prepared_staged_layer).
+    """
+    if snapshot_dir:
+        sync_key = info.get("sync_key")
+        gdf_chunks = snapshot_chunks(gdf_chunks, snapshot_dir, name, run_date, key_fields=[sync_key] if sync_key else None)
+        # In-memory layers are snapshotted now, whether or not the upload goes ahead
+        if not streaming:
+            gdf_chunks = list(gdf_chunks)
+
+    # Streamed chunks are prepared lazily, so their processing time lands in the upload span
+    with span("upload_layer", layer=name):
+        upload_features(gis, name, info, gdf_chunks, upload_mode=upload_mode, upload_options=upload_options,
+                        metadata_cache=metadata_cache)
+
+    # Finish a streamed snapshot if the upload stopped early (or was skipped)
+    if snapshot_dir and streaming:
+        for _ in gdf_chunks:
+            pass
+
+def processing_settings(options=None):
+    """
+    Returns PROCESSING_DEFAULTS updated with options, without snapshots if
+    pyarrow is missing. Raises ValueError for an unknown option.
+    """
+    unknown = sorted(set(options or {}) - set(PROCESSING_DEFAULTS))
+    if unknown:
+        raise ValueError(f"Unknown processing option(s) {unknown}. Options are: {', '.join(PROCESSING_DEFAULTS)}")
+    settings = {**PROCESSING_DEFAULTS, **(options or {})}
+    if settings["snapshot_dir"] and not snapshots_available():
+        print("Snapshot history needs pyarrow. Skipping snapshots.")
+        settings["snapshot_dir"] = None
+    settings["run_date"] = settings["run_date"] or date.today()
+    return settings
+
+def process_and_update_features(gis, data_dir, feature_config, chart_files=None, options=None, chart_feed=None, metadata_cache=None):
+    """
+    Processes ENC data from ZIP files, extracts specified features, and updates the corresponding
+    hosted feature layers in AGOL. options are the run options (PROCESSING_DEFAULTS), and
+    chart_feed extracts each chart in chart_files as soon as it has downloaded.
+    """
+    settings = processing_settings(options)
+    cache_dir, streaming, chunk_size = settings["cache_dir"], settings["streaming"], settings["chunk_size"]
+
+    if streaming and not staging_available():
+        print("Streaming extraction needs pyarrow. Processing in memory instead.")
+        streaming = False
+
+    # Loop through ZIP files and extract data
+    print("Starting data extraction from ENC files...")
+    with span("extract"):
+        if streaming:
+            staging_dir = settings["staging_dir"] or os.path.join(cache_dir or data_dir, "staging")
+            print(f"Streaming extracted features to {staging_dir}...")
+            staged_counts = stage_features(data_dir, feature_config, staging_dir, max_workers=settings["max_workers"], cache_dir=cache_dir,
+                                           chart_files=chart_files, chart_feed=chart_feed)
+        else:
+            feature_results = extract_features(data_dir, feature_config, max_workers=settings["max_workers"], cache_dir=cache_dir,
+                                               chart_files=chart_files, chart_feed=chart_feed)
 
     # Consolidate data and update AGOL directly
     print("Finished extraction. Starting ArcGIS Online updates...")
-    for name, gdf_list in feature_results.items():
+    for name, info in feature_config.items():
+        with span("process_layer", layer=name):
+            if streaming:
+                if not staged_counts.get(name):
+                    print(f"[{name}] No data was extracted. Skipping AGOL update.")
+                    continue
+                print(f"[{name}] Staged {staged_counts[name]} total features. Processing in chunks of {chunk_size}...")
+                add_count("features_extracted", staged_counts[name])
+                gdf_chunks = iter_prepared_staged_layer(staging_dir, name, info, cache_dir=cache_dir, chunk_size=chunk_size)
+            else:
+                gdf_list = feature_results.get(name)
+                if not gdf_list:
+                    print(f"[{name}] No data was extracted. Skipping AGOL update.")
+                    continue
+
+                try:
+                    # Combine all alike features into one gdf
+                    full_gdf = gpd.GeoDataFrame(concat_frames(gdf_list), crs=gdf_list[0].crs)
+                    print(f"[{name}] Successfully combined {len(full_gdf)} total features.")
+                    print(full_gdf.head())
+                except Exception as e:
+                    print(f"[{name}] failed to combine GeoDataFrames: {e}")
+                    continue
+                del feature_results[name]
+                add_count("features_extracted", len(full_gdf))
+                gdf_chunks = [prepare_features(full_gdf, name, info, cache_dir=cache_dir)]
+
+            snapshot_and_upload(gis, name, info, gdf_chunks, streaming=streaming, upload_mode=settings["upload_mode"],
+                                upload_options=settings["upload_options"], snapshot_dir=settings["snapshot_dir"],
+                                run_date=settings["run_date"], metadata_cache=metadata_cache)
+
+def extract_shard(data_dir, feature_config, shard_dir, shard, run_id, chart_files, selected_charts, options=None, chart_feed=None):
+    """
+    Map side of a sharded run (shard_store.py): extracts the shard's charts
+    (chart_files, its share of selected_charts), maps each layer's codes
+    and writes the layer to a partial file in shard_dir. shard is (i, N)
+    and run_id names the sharded run, recorded in the shard's manifest.
+    Duplicate merging and post-processing need every shard's features, so
+    they are left to reduce_and_update_features.
+    Returns {feature name: number of features written}.
+    """
+    index, count = shard
+    settings = processing_settings(options)
+    cache_dir = settings["cache_dir"]
+    if not staging_available():
+        raise RuntimeError("Sharded runs need pyarrow to write their partial files.")
+    begin_shard(shard_dir, index, count)
+
+    print(f"Extracting shard {index}/{count}: {len(chart_files)} of {len(set(selected_charts))} charts...")
+    with span("extract"):
+        feature_results = extract_features(data_dir, feature_config, max_workers=settings["max_workers"], cache_dir=cache_dir,
+                                           chart_files=chart_files, chart_feed=chart_feed)
+
+    layer_counts = {}
+    for name, info in feature_config.items():
+        gdf_list = feature_results.pop(name)
+        layer_counts[name] = 0
         if not gdf_list:
-            print(f"[{name}] No data was extracted. Skipping AGOL update.")
+            print(f"[{name}] No data was extracted in this shard.")
             continue
+        with span("map_layer", layer=name):
+            gdf = compact_dtypes(gpd.GeoDataFrame(concat_frames(gdf_list), crs=gdf_list[0].crs))
+            del gdf_list
+            if info.get("mapping_csv"):
+                gdf = map_column_codes(gdf, info["mapping_csv"], cache_dir=cache_dir)
+            write_partial(shard_dir, index, count, name, gdf)
+        layer_counts[name] = len(gdf)
+        add_count("features_extracted", len(gdf))
+        print(f"[{name}] Wrote {len(gdf)} features to the shard's partial file.")
 
-        try:
-            # Combine all alike features into one gdf
-            full_gdf = gpd.GeoDataFrame(pd.concat(gdf_list, ignore_index=True), crs=gdf_list[0].crs)
-            print(f"[{name}] Successfully combined {len(full_gdf)} total features.")
-            print(gdf.head())
-        except Exception as e:
-            print(f"[{name}] failed to combine GeoDataFrames: {e}")
-            continue
-        
-        # Remove duplicate features in the wind_turbines layer using the FIDN column
-        # Check if the current feature set is the one containing Wind Turbines
-        if name == "Wind_Turbines" and 'FIDN' in full_gdf.columns:
-            print(f"[{name}] Detected Wind Turbines. Applying FIDN-based deduplication...")
-            
-            # Identify the indexes of the rows to keep
-            non_duplicate_index = full_gdf.drop_duplicates(subset=['FIDN'], keep='first').index
-            
-            # Filter to get only the duplicate rows for inspection
-            duplicate_rows_gdf = full_gdf.loc[~full_gdf.index.isin(non_duplicate_index)]
-            
-            # Update duplicates_removed count
-            duplicates_removed = len(duplicate_rows_gdf)
-            
-            if duplicates_removed > 0:
-                print(f"[{name}] Found {duplicates_removed} duplicate features.")
-                print(f"[{name}] Inspecting 'source_file' column for duplicates:")
-                print(duplicate_rows_gdf[['FIDN', 'source_file']])
-            
-            # Remove duplicates: Apply the filtering to keep only one record per FIDN
-            full_gdf = full_gdf.drop_duplicates(subset=['FIDN'], keep='first')
-            
-            # Update deduplicated_count
-            deduplicated_count = len(full_gdf)
-            
-            # Summary Log for the deduplicated layer
-            print(f"[{name}] Deduplication complete. {duplicates_removed} features removed. {deduplicated_count} features retained.")
-            
-        elif name == "Wind_Turbines" and 'FIDN' not in full_gdf.columns:
-            print(f"[{name}] Warning: Wind_Turbines layer found, but 'FIDN' column is missing. Skipping deduplication.")
-            
-        else:
-            # For all other layers, there are no duplicates. 
-            print(f"[{name}] Not the target layer. Skipping deduplication.")
-          
-        mapping_csv_path = feature_config[name].get("mapping_csv")
-
-        # Call mapping function to convert any coded data into a non-coded, readable value    
-        if mapping_csv_path:
-            # If a mapping file is defined in the config, call the function
-            # and overwrite full_gdf with the processed result.
-            full_gdf = map_column_codes(full_gdf, mapping_csv_path)
-        else:
-            print(f"[{name}] No mapping CSV configured. Proceeding with original data.")
-
-        # Map the Function column to the Construction Status column for Wind Turbines
-        # Light support = Under construction/operational, NA = proposed
-        if name == "Wind_Turbines":
-            print(f"[{name}] Filling blank OBJNAMs and splitting project info...")
-
-            # Define the manual mapping for blank OBJNAM rows based on FIDN
-            # Format: {FIDN_Value: "Project Name WTG ID"}
-            fidn_fix_map = {
-                69282477: "Sunrise Wind WTG AR16",
-                36834519: "Block Island Wind Farm WTG WTG-5",
-                36834553: "Block Island Wind Farm WTG WTG-3",
-                36834504: "Block Island Wind Farm WTG WTG-4",
-                36834554: "Block Island Wind Farm WTG WTG-1",
-                36834514: "Block Island Wind Farm WTG WTG-2"
-            }
-
-            # Fill blanks only where OBJNAM is null or empty
-            def fill_missing_objnam(row):
-                # Check if OBJNAM is null or just whitespace
-                if pd.isna(row['OBJNAM']) or str(row['OBJNAM']).strip() == "":
-                    # Return the mapped value if FIDN exists in the dictionary
-                    return fidn_fix_map.get(row['FIDN'], row['OBJNAM'])
-                return row['OBJNAM']
-
-            if 'FIDN' in full_gdf.columns:
-                full_gdf['OBJNAM'] = full_gdf.apply(fill_missing_objnam, axis=1)
-
-            # Run splitting logic to split OBJNAM column into project name and wind turbine ID
-            if 'OBJNAM' in full_gdf.columns:
-                # Split the string at ' WTG ' (including spaces to keep it clean)
-                # n=1 ensures we only split at the first occurrence
-                split_cols = full_gdf['OBJNAM'].str.split(' WTG ', n=1, expand=True)
-                
-                # Assign to new columns
-                full_gdf['PROJECT'] = split_cols[0]
-                # We add 'WTG ' back to the second part so it reads 'WTG AE10'
-                full_gdf['WIND_TURBINE_ID'] = split_cols[1]
-            
-            def determine_status(val):
-                # Handle Nulls/Blanks immediately
-                if pd.isna(val) or str(val).strip() == "":
-                    return "Proposed"
-                # Clean and lowercase for comparison
-                val_clean = str(val).strip().lower()
-                # Compare against lowercase "light support"
-                if val_clean == "light support":
-                    return "Under Construction/Operational"
-                 # Catch-all for other non-blank values
-                return "Proposed" 
-            full_gdf['CONSTRUCTION_STATUS'] = full_gdf['FUNCTN'].apply(determine_status)
-
-        # Map the Function column to the Construction Status column for Wind Turbines
-        # Light support = Under construction/operational, NA = proposed
-        if name == "Offshore_Substations":
-            print(f"[{name}] Filtering out observation platforms")
-            if 'CATOFP' in full_gdf.columns:
-                # Keep only rows that are NOT 'observation/research platform'
-                full_gdf = full_gdf[full_gdf['CATOFP'] != 'observation/research platform']
-            
-            print(f"[{name}] Filling blank OBJNAMs and splitting project info...")
-            # Define the manual mapping for blank OBJNAM rows based on FIDN
-            # Format: {FIDN_Value: "Project Name OSS ID"}
-            fidn_fix_map = {
-                102474376: "Coastal Virginia Offshore Substation OSS T3G15"
-            }
-
-            # Fill blanks only where OBJNAM is null or empty
-            def fill_missing_objnam(row):
-                # Check if OBJNAM is null or just whitespace
-                if pd.isna(row['OBJNAM']) or str(row['OBJNAM']).strip() == "":
-                    # Return the mapped value if FIDN exists in the dictionary
-                    return fidn_fix_map.get(row['FIDN'], row['OBJNAM'])
-                return row['OBJNAM']
-
-            if 'FIDN' in full_gdf.columns:
-                full_gdf['OBJNAM'] = full_gdf.apply(fill_missing_objnam, axis=1)
-
-            # Run splitting logic to split OBJNAM column into project name and wind turbine ID
-            if 'OBJNAM' in full_gdf.columns:
-                # Split the string at ' PROD ' or ' Offshore Substation OSS ' (including spaces to keep it clean)
-                pattern = r' PROD | Offshore Substation OSS '
-                split_cols = full_gdf['OBJNAM'].str.split(pattern, n=1, expand=True, regex=True)
-                
-                # Assign to new columns
-                full_gdf['PROJECT'] = split_cols[0]
-                # We add 'WTG ' back to the second part so it reads 'WTG AE10'
-                full_gdf['OSS_ID'] = split_cols[1]
-
-        # Define AGOL item ID
-        agol_id = feature_config[name].get("agol_item_id")
-        if not agol_id:
-            print(f"[{name}] No AGOL item ID configured. Skipping upload.")
-            continue
-            
-        try:
-            print(f"[{name}] Connecting to AGOL item {agol_id}...")
-            item = gis.content.get(agol_id)
-            flc = FeatureLayerCollection.fromitem(item)
-            agol_layer_index = feature_config[name].get("agol_layer_index", 0)
-            target_layer = flc.layers[agol_layer_index]
-            
-            # Identify Target WKID
-            props = target_layer.properties
-            target_crs_wkid = props.get('spatialReference', {}).get('wkid') or \
-                              props.get('extent', {}).get('spatialReference', {}).get('wkid') or 3857
-            
-            print(f"[{name}] Target WKID detected: {target_crs_wkid}")
-
-            # Reproject and clean GeoDataFrame
-            full_gdf = full_gdf.to_crs(epsg=target_crs_wkid)
-            full_gdf = full_gdf[full_gdf.geometry.notnull()] # Remove any empty geometries
-
-            # Convert to FeatureSet via GeoJSON
-            # This is more stable than SEDF in GitHub Actions/Linux
-            print(f"[{name}] Converting to FeatureSet...")
-            geojson_payload = json.loads(full_gdf.to_json())
-            fset = FeatureSet.from_geojson(geojson_payload)
-
-            # Manual Spatial Reference Injection
-            target_sr = {'wkid': int(target_crs_wkid)}
-            for feat in fset.features:
-                if feat.geometry:
-                    feat.geometry['spatialReference'] = target_sr
-            
-            # Truncate and Upload
-            print(f"[{name}] Truncating all existing features in AGOL layer...")
-            target_layer.manager.truncate()
-            
-            print(f"[{name}] Appending {len(fset.features)} new features to AGOL layer...")
-            result = target_layer.edit_features(adds=fset.features)
-            
-            # Check results
-            add_results = result.get('addResults', [])
-            success_count = sum(1 for r in add_results if r.get('success'))
-            
-            if success_count == len(fset.features):
-                print(f"[{name}] AGOL update successful. {success_count} features added.")
-            else:
-                errors = [r.get('error') for r in add_results if not r.get('success')]
-                print(f"[{name}] Warning: Only {success_count}/{len(fset.features)} succeeded.")
-                if errors:
-                    print(f"First error: {errors[0]}")
+    finish_shard(shard_dir, index, count, chart_files, selected_charts, layer_counts, run_id)
+    print(f"Shard {index}/{count} finished. Run the reduce step once every shard has finished.")
+    return layer_counts
+
+def reduce_and_update_features(gis, shard_dir, run_id, feature_config, options=None, metadata_cache=None):
+    """
+    Reduce side of a sharded run: merges the partial files of every shard of
+    run run_id per layer, then merges duplicates, runs the post-processing
+    rules and updates AGOL as process_and_update_features does.
+    Raises ValueError if a shard of the run hasn't finished (shard_store.complete_shards).
+    """
+    settings = processing_settings(options)
+
+    manifests = complete_shards(shard_dir, run_id)
+    charts = sum(len(manifest["charts"]) for manifest in manifests)
+    print(f"Reducing {len(manifests)} shards ({charts} charts) from {shard_dir}...")
+
+    for name, info in feature_config.items():
+        with span("process_layer", layer=name):
+            full_gdf = read_partials(shard_dir, manifests, name)
+            if full_gdf is None:
+                print(f"[{name}] No shard extracted any data. Skipping AGOL update.")
+                continue
+            print(f"[{name}] Merged {len(full_gdf)} total features from the shards.")
+            add_count("features_extracted", len(full_gdf))
+            gdf_chunks = [prepare_features(full_gdf, name, info, cache_dir=settings["cache_dir"], map_codes=False)]
+            del full_gdf
 
-        except Exception as e:
-            print(f"[{name}] An unexpected error occurred: {e}")
\ No newline at end of file
+            snapshot_and_upload(gis, name, info, gdf_chunks, upload_mode=settings["upload_mode"], upload_options=settings["upload_options"],
+                                snapshot_dir=settings["snapshot_dir"], run_date=settings["run_date"], metadata_cache=metadata_cache)
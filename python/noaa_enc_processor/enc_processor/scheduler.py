@@ -0,0 +1,107 @@
+#############################################
+##     WORKFLOW STAGE SCHEDULER (DAG)      ##
+#############################################
+
+# Runs the workflow stages on a thread pool as soon as the stages they depend
+# on have finished, so independent stages (e.g. the boulder update and the
+# light list ingestion) overlap with the ENC download and processing.
+# Each stage is {"function": f(results), "requires": [...], "after": [...]}:
+#   requires - stages whose results the stage needs. They are always run
+#              with it, and if one fails the stage is skipped.
+#   after    - stages it only has to wait for if they are part of the run
+#              (their failure doesn't stop it).
+# A stage's return value is stored in results[stage name]. A failed stage
+# is reported and never stops the stages that don't depend on it.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .instrumentation import span, submit
+
+def resolve_stages(stages, selected=None):
+    """
+    Returns the stages to run, in declaration order: the selected stage names
+    (default every stage) plus the stages they require.
+    Raises ValueError for an unknown stage name.
+    """
+    if selected is None:
+        return list(stages)
+    unknown = [name for name in selected if name not in stages]
+    if unknown:
+        raise ValueError(f"Unknown stage(s) {unknown}. Stages are: {', '.join(stages)}")
+
+    to_run = set()
+    todo = list(selected)
+    while todo:
+        name = todo.pop()
+        if name not in to_run:
+            to_run.add(name)
+            todo.extend(stages[name].get("requires", []))
+    return [name for name in stages if name in to_run]
+
+def _run_stage(name, function, results):
+    """
+    Runs one stage in a span. Returns (name, status, seconds).
+    """
+    start = time.perf_counter()
+    try:
+        with span(name):
+            results[name] = function(results)
+        status = "ok"
+    except Exception as e:
+        print(f"--- Stage '{name}' failed: {e} ---")
+        status = "failed"
+    return name, status, time.perf_counter() - start
+
+def run_stages(stages, selected=None, max_workers=4):
+    """
+    Runs the stages (see the module notes), each one as soon as the stages it
+    waits for have finished, max_workers at a time. selected limits the run
+    to those stage names plus the stages they require.
+    Returns {stage name: "ok" | "failed" | "skipped"}.
+    """
+    names = resolve_stages(stages, selected)
+    print(f"--- Running stages: {', '.join(names)} ---")
+
+    def waits_for(name):
+        spec = stages[name]
+        return list(spec.get("requires", [])) + [dep for dep in spec.get("after", []) if dep in names]
+
+    results, statuses, seconds = {}, {}, {}
+    pending = list(names)
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        while pending or running:
+            # Repeat until nothing changes, as a skipped stage can let (or stop) others
+            changed = True
+            while changed:
+                changed = False
+                for name in list(pending):
+                    # Skip a stage if a stage it needs failed or was skipped
+                    failed_deps = [dep for dep in stages[name].get("requires", []) if statuses.get(dep) in ("failed", "skipped")]
+                    if failed_deps:
+                        print(f"--- Skipping stage '{name}': {', '.join(failed_deps)} did not complete ---")
+                        statuses[name] = "skipped"
+                        pending.remove(name)
+                        changed = True
+                    elif all(dep in statuses for dep in waits_for(name)):
+                        running[submit(executor, _run_stage, name, stages[name]["function"], results)] = name
+                        pending.remove(name)
+
+            if not running:
+                # Only left with stages waiting on each other
+                for name in pending:
+                    print(f"--- Skipping stage '{name}': circular dependency ---")
+                    statuses[name] = "skipped"
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                del running[future]
+                name, status, stage_seconds = future.result()
+                statuses[name] = status
+                seconds[name] = stage_seconds
+
+    for name in names:
+        timing = f" ({seconds[name]:.1f}s)" if name in seconds else ""
+        print(f"     {name}: {statuses[name]}{timing}")
+    return statuses
@@ -0,0 +1,170 @@
+#####################################################
+##   PARTIAL RESULTS FOR SHARDED EXTRACTION RUNS   ##
+#####################################################
+
+# A sharded run splits the charts between N independent invocations
+# (main.py --shard i/N), on one machine or several. Each shard extracts and
+# code-maps its own charts and writes one partial GeoParquet file per layer,
+# plus a manifest written last that marks the shard as complete:
+#   <shard_dir>/shard-0002-of-0004/Wind_Turbines.parquet
+#   <shard_dir>/shard-0002-of-0004/manifest.json
+# Every invocation of a run is given the same run ID (main.py --run-id), which
+# the manifest records. The reduce run (main.py --reduce) checks every shard
+# of its run ID is complete and agrees on the charts selected, then merges the
+# partials in chart order.
+# Shards run elsewhere only need their shard-* folders copied into shard_dir.
+
+import os
+import json
+import zlib
+import shutil
+import hashlib
+from pathlib import Path
+from datetime import datetime, timezone
+import numpy as np
+import geopandas as gpd
+from .dtype_compactor import concat_frames
+
+MANIFEST_FILENAME = "manifest.json"
+
+def parse_shard(text):
+    """
+    Parses "i/N" (shard i of N, counting from 1) into (i, N).
+    Raises ValueError if it isn't a valid shard.
+    """
+    try:
+        index, count = (int(part) for part in str(text).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard '{text}'. Use i/N, e.g. 2/4.") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{text}'. i must be between 1 and N.")
+    return index, count
+
+def chart_shard(chart_file, count):
+    """
+    Returns the shard (1 to count) a chart belongs to. The shard only depends
+    on the chart's file name, so every invocation (and machine) agrees on it
+    and a chart keeps its shard when other charts are added or removed.
+    """
+    return zlib.crc32(chart_file.encode("utf-8")) % count + 1
+
+def shard_charts(chart_files, index, count):
+    """
+    Returns the charts of chart_files assigned to shard index of count, sorted.
+    """
+    return sorted(chart for chart in set(chart_files) if chart_shard(chart, count) == index)
+
+def selection_hash(chart_files):
+    """
+    Fingerprint of a chart selection, so the reduce run can tell whether
+    every shard split the same charts.
+    """
+    return hashlib.sha256("\n".join(sorted(set(chart_files))).encode("utf-8")).hexdigest()
+
+def shard_path(shard_dir, index, count):
+    """
+    Returns the folder holding shard index of count's partial files.
+    """
+    return Path(shard_dir) / f"shard-{index:04d}-of-{count:04d}"
+
+def clear_shards(shard_dir):
+    """
+    Removes every shard's partial files from shard_dir.
+    """
+    for path in Path(shard_dir).glob("shard-*"):
+        shutil.rmtree(path, ignore_errors=True)
+
+def begin_shard(shard_dir, index, count):
+    """
+    Removes anything an earlier run of the same shard left behind.
+    """
+    path = shard_path(shard_dir, index, count)
+    if path.exists():
+        shutil.rmtree(path)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+def write_partial(shard_dir, index, count, name, gdf):
+    """
+    Writes a shard's features for one layer as a GeoParquet partial file,
+    through a temp file so a failed write never leaves a broken partial.
+    """
+    path = shard_path(shard_dir, index, count) / f"{name}.parquet"
+    tmp_path = path.with_suffix(".parquet.tmp")
+    gdf.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return path
+
+def finish_shard(shard_dir, index, count, charts, selected_charts, layer_counts, run_id):
+    """
+    Writes the shard's manifest (its run ID, its charts, the fingerprint of
+    the whole selection and the features written per layer), marking it complete.
+    """
+    manifest = {
+        "run_id": run_id,
+        "shard": index,
+        "shard_count": count,
+        "charts": sorted(charts),
+        "selection_hash": selection_hash(selected_charts),
+        "layers": layer_counts,
+        "finished": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+    path = shard_path(shard_dir, index, count) / MANIFEST_FILENAME
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+def complete_shards(shard_dir, run_id):
+    """
+    Returns the manifests of run run_id's shards in shard_dir, in shard order.
+    Shards of other runs are ignored.
+    Raises ValueError if a shard of the run is missing or unfinished, or if
+    the shards didn't split the same chart selection.
+    """
+    manifests = []
+    for path in sorted(Path(shard_dir).glob(f"shard-*/{MANIFEST_FILENAME}")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                manifests.append(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read shard manifest {path}: {e}")
+    ignored = [manifest for manifest in manifests if manifest.get("run_id") != run_id]
+    if ignored:
+        print(f"Ignoring {len(ignored)} shard(s) from other runs than '{run_id}'.")
+    manifests = [manifest for manifest in manifests if manifest.get("run_id") == run_id]
+    if not manifests:
+        raise ValueError(f"No finished shards of run '{run_id}' found in {shard_dir}.")
+
+    counts = {manifest["shard_count"] for manifest in manifests}
+    if len(counts) > 1:
+        raise ValueError(f"The shards of run '{run_id}' were split {' and '.join(map(str, sorted(counts)))} ways. Rerun every shard with one shard count.")
+    count = counts.pop()
+    manifests = {manifest["shard"]: manifest for manifest in manifests}
+
+    missing = [f"{index}/{count}" for index in range(1, count + 1) if index not in manifests]
+    if missing:
+        raise ValueError(f"Shard(s) {', '.join(missing)} have not finished. Run them before the reduce step.")
+    if len({manifest["selection_hash"] for manifest in manifests.values()}) > 1:
+        raise ValueError("The shards split different chart selections (was the ENC catalog updated between them?). Rerun every shard.")
+    return [manifests[index] for index in range(1, count + 1)]
+
+def read_partials(shard_dir, manifests, name):
+    """
+    Reads and merges a layer's partial files from every shard, with the
+    features in chart file name order (the order a single run merges them
+    in, which duplicate merging relies on). Returns None if no shard found
+    any features for the layer.
+    """
+    frames = []
+    for manifest in manifests:
+        if manifest["layers"].get(name):
+            frames.append(gpd.read_parquet(shard_path(shard_dir, manifest["shard"], manifest["shard_count"]) / f"{name}.parquet"))
+    if not frames:
+        return None
+    gdf = gpd.GeoDataFrame(concat_frames(frames), crs=frames[0].crs)
+    if "source_file" in gdf.columns:
+        # Stable sort: each chart's features keep their order
+        gdf = gdf.iloc[np.argsort(gdf["source_file"].astype(str).to_numpy(), kind="stable")].reset_index(drop=True)
+    return gdf
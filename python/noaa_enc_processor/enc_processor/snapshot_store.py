@@ -0,0 +1,238 @@
+#####################################################
+##   PARTITIONED GEOPARQUET SNAPSHOT HISTORY AND   ##
+##        "AS OF"/"CHANGES BETWEEN" QUERIES        ##
+#####################################################
+
+# Each run appends the final frames it sent to AGOL (turbines, substations,
+# boulders) to a snapshot store laid out as
+#     <snapshot_dir>/<layer>/run_date=YYYY-MM-DD/part-00000.parquet
+# Rows are sorted by the layer's key and written in row groups with min/max
+# statistics (plus a bbox covering column), so a query for one feature or
+# area only reads the matching row groups, and a query for a date only reads
+# that date's partition. Geometries are stored in EPSG:4326.
+
+import os
+import shutil
+from datetime import date, datetime
+from pathlib import Path
+import pandas as pd
+import geopandas as gpd
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+SNAPSHOT_CRS = "EPSG:4326"
+PARTITION_PREFIX = "run_date="
+
+def snapshots_available():
+    """
+    Returns True if the snapshot store can be used (pyarrow is installed).
+    """
+    return pq is not None
+
+def _as_date(value):
+    """
+    Accepts a date, datetime or "YYYY-MM-DD" string.
+    """
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+def _partition_dir(snapshot_dir, name, run_date):
+    return Path(snapshot_dir) / name / f"{PARTITION_PREFIX}{_as_date(run_date).isoformat()}"
+
+def snapshot_dates(snapshot_dir, name):
+    """
+    Returns the run dates with a snapshot of the layer, oldest first.
+    """
+    layer_dir = Path(snapshot_dir) / name
+    if not layer_dir.exists():
+        return []
+    dates = []
+    for partition in layer_dir.iterdir():
+        if partition.is_dir() and partition.name.startswith(PARTITION_PREFIX) and any(partition.glob("*.parquet")):
+            try:
+                dates.append(date.fromisoformat(partition.name[len(PARTITION_PREFIX):]))
+            except ValueError:
+                print(f"Warning: Ignoring snapshot partition with an invalid date: {partition}")
+    return sorted(dates)
+
+def begin_snapshot(snapshot_dir, name, run_date):
+    """
+    Clears the layer's partition for run_date, so a rerun on the same day
+    replaces that day's snapshot instead of adding to it.
+    """
+    partition = _partition_dir(snapshot_dir, name, run_date)
+    if partition.exists():
+        shutil.rmtree(partition)
+    partition.mkdir(parents=True, exist_ok=True)
+
+def write_snapshot_part(snapshot_dir, name, run_date, gdf, key_fields=None, row_group_size=10000):
+    """
+    Appends a frame (the whole layer, or one chunk of a streamed layer) to
+    the layer's partition for run_date as a new GeoParquet part. Rows are
+    sorted by key_fields so each row group covers a narrow key range.
+    Writes go through a temp file so a failed write never leaves a broken part.
+    """
+    partition = _partition_dir(snapshot_dir, name, run_date)
+    partition.mkdir(parents=True, exist_ok=True)
+    part_path = partition / f"part-{len(list(partition.glob('*.parquet'))):05d}.parquet"
+
+    if gdf.crs is not None:
+        gdf = gdf.to_crs(SNAPSHOT_CRS)
+    key_fields = [field for field in (key_fields or []) if field in gdf.columns]
+    if key_fields:
+        gdf = gdf.sort_values(key_fields, kind="stable")
+
+    tmp_path = part_path.with_suffix(".parquet.tmp")
+    gdf.to_parquet(tmp_path, index=False, write_covering_bbox=True, row_group_size=row_group_size)
+    os.replace(tmp_path, part_path)
+    return part_path
+
+def write_snapshot(snapshot_dir, name, run_date, gdf, key_fields=None, row_group_size=10000):
+    """
+    Stores a layer's complete frame as its snapshot for run_date, replacing
+    any earlier snapshot from the same date.
+    """
+    begin_snapshot(snapshot_dir, name, run_date)
+    return write_snapshot_part(snapshot_dir, name, run_date, gdf, key_fields, row_group_size)
+
+def snapshot_chunks(gdf_chunks, snapshot_dir, name, run_date, key_fields=None):
+    """
+    Passes processed chunks through unchanged, writing each one to the
+    layer's snapshot for run_date on the way (streaming mode). A failed
+    snapshot write is reported and never stops the upload.
+    """
+    try:
+        begin_snapshot(snapshot_dir, name, run_date)
+    except OSError as e:
+        print(f"[{name}] Could not start snapshot for {run_date}: {e}")
+        yield from gdf_chunks
+        return
+    for gdf in gdf_chunks:
+        try:
+            write_snapshot_part(snapshot_dir, name, run_date, gdf, key_fields)
+        except Exception as e:
+            print(f"[{name}] Failed to write snapshot part: {e}")
+        yield gdf
+
+def read_snapshot(snapshot_dir, name, run_date, columns=None, filters=None, bbox=None):
+    """
+    Reads the layer's snapshot from exactly run_date. filters (pyarrow
+    filters, e.g. [("FIDN", "in", [...])]) and bbox (minx, miny, maxx, maxy
+    in lon/lat) skip row groups whose statistics can't match.
+    Returns None if there is no snapshot for that date.
+    """
+    partition = _partition_dir(snapshot_dir, name, run_date)
+    parts = sorted(partition.glob("*.parquet")) if partition.exists() else []
+    if not parts:
+        return None
+
+    frames = []
+    for part in parts:
+        names = pq.read_schema(part).names
+        part_columns = [col for col in names if col != "bbox"]
+        if columns is not None:
+            part_columns = [col for col in part_columns if col in columns or col == "geometry"]
+        # A part without the filter column can't hold a match
+        if filters and any(field not in names for field, _, _ in filters):
+            continue
+        frames.append(gpd.read_parquet(part, columns=part_columns, filters=filters, bbox=bbox))
+    if not frames:
+        return gpd.GeoDataFrame(geometry=[], crs=SNAPSHOT_CRS).assign(run_date=[])
+    gdf = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
+    gdf["run_date"] = _as_date(run_date)
+    return gdf
+
+def state_as_of(snapshot_dir, name, as_of, columns=None, filters=None, bbox=None):
+    """
+    Returns the layer as it was on as_of: the latest snapshot taken on or
+    before that date (with a run_date column saying which), or None if the
+    history starts after as_of. Only that date's partition is read.
+    """
+    as_of = _as_date(as_of)
+    dates = [run_date for run_date in snapshot_dates(snapshot_dir, name) if run_date <= as_of]
+    if not dates:
+        print(f"[{name}] No snapshot on or before {as_of}.")
+        return None
+    return read_snapshot(snapshot_dir, name, dates[-1], columns=columns, filters=filters, bbox=bbox)
+
+def _unique_by_key(gdf, key_fields, name, run_date):
+    duplicated = gdf.duplicated(subset=key_fields, keep="first")
+    if duplicated.any():
+        print(f"[{name}] Warning: {int(duplicated.sum())} features in the {run_date} snapshot share a key {key_fields}. Comparing the first of each.")
+    return gdf[~duplicated].set_index(key_fields)
+
+def _same_value(a, b):
+    if pd.isna(a) and pd.isna(b):
+        return True
+    if pd.isna(a) or pd.isna(b):
+        return False
+    return a == b
+
+def changes_between(snapshot_dir, name, start, end, key_fields, compare_fields=None, tolerance=1e-7):
+    """
+    Compares the layer's state as of start with its state as of end, matching
+    features on key_fields (e.g. ["FIDN"]). Returns a GeoDataFrame of the
+    differences with a "change" column ("added", "removed" or "changed") and,
+    for changed features, a "changed_fields" column ("geometry" when the
+    feature moved by more than tolerance degrees). Added and changed rows
+    hold the end state, removed rows the start state. compare_fields defaults
+    to every attribute column the two states share.
+    """
+    key_fields = list(key_fields)
+    before = state_as_of(snapshot_dir, name, start)
+    after = state_as_of(snapshot_dir, name, end)
+    if after is None:
+        return None
+    if before is None:
+        before = gpd.GeoDataFrame(columns=list(after.columns), geometry="geometry", crs=after.crs)
+
+    before = _unique_by_key(before, key_fields, name, start)
+    after = _unique_by_key(after, key_fields, name, end)
+    if compare_fields is None:
+        compare_fields = [col for col in after.columns if col in before.columns and col not in ("geometry", "run_date")]
+
+    added = after.loc[after.index.difference(before.index)].assign(change="added", changed_fields=None)
+    removed = before.loc[before.index.difference(after.index)].assign(change="removed", changed_fields=None)
+
+    common = after.index.intersection(before.index)
+    changed_rows = []
+    changed_fields = []
+    for key in common:
+        old, new = before.loc[key], after.loc[key]
+        fields = [col for col in compare_fields if not _same_value(old.get(col), new.get(col))]
+        if old.geometry is None or new.geometry is None:
+            moved = (old.geometry is None) != (new.geometry is None)
+        else:
+            moved = not old.geometry.equals_exact(new.geometry, tolerance)
+        if moved:
+            fields.append("geometry")
+        if fields:
+            changed_rows.append(key)
+            changed_fields.append(", ".join(fields))
+    changed = after.loc[changed_rows].assign(change="changed", changed_fields=changed_fields)
+
+    changes = pd.concat([added, removed, changed])
+    print(f"[{name}] {start} -> {end}: {len(added)} added, {len(removed)} removed, {len(changed)} changed.")
+    return gpd.GeoDataFrame(changes.reset_index(), geometry="geometry", crs=after.crs)
+
+def feature_history(snapshot_dir, name, key_field, key_value, columns=None):
+    """
+    Returns every snapshot of one feature (e.g. FIDN 123), oldest first,
+    e.g. to find when a turbine first appeared or changed status. Each
+    partition's row-group statistics are checked against the key, so only
+    the row groups that can hold it are read.
+    """
+    frames = []
+    for run_date in snapshot_dates(snapshot_dir, name):
+        gdf = read_snapshot(snapshot_dir, name, run_date, columns=columns, filters=[(key_field, "=", key_value)])
+        if gdf is not None and not gdf.empty:
+            frames.append(gdf)
+    if not frames:
+        return None
+    return gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs=frames[0].crs)
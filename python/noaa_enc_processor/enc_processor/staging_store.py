@@ -0,0 +1,114 @@
+#####################################################
+##   ON-DISK GEOPARQUET STAGING STORE FOR THE      ##
+##        STREAMING EXTRACTION PIPELINE            ##
+#####################################################
+
+# In streaming mode each chart's extracted layers are appended to the
+# staging store as they arrive (one GeoParquet part per chart and layer)
+# instead of being kept in memory, and the later stages read each layer
+# back in chunks of a bounded number of rows.
+
+import os
+import json
+import shutil
+from pathlib import Path
+import geopandas as gpd
+import shapely
+from .dtype_compactor import concat_frames
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+def staging_available():
+    """
+    Returns True if the staging store can be used (pyarrow is installed).
+    """
+    return pq is not None
+
+def clear_staging(staging_dir):
+    """
+    Removes everything staged by a previous run.
+    """
+    staging_dir = Path(staging_dir)
+    if staging_dir.exists():
+        shutil.rmtree(staging_dir)
+    staging_dir.mkdir(parents=True, exist_ok=True)
+
+def stage_layer(staging_dir, name, part_name, gdf):
+    """
+    Appends one chart's features for a layer to the store as a new
+    GeoParquet part. Writes go through a temp file so a failed write never
+    leaves a broken part behind.
+    """
+    layer_dir = Path(staging_dir) / name
+    layer_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = layer_dir / f"{part_name}.parquet.tmp"
+    gdf.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, layer_dir / f"{part_name}.parquet")
+
+def staged_parts(staging_dir, name):
+    """
+    Returns the layer's parts in the order they were staged (file name order).
+    """
+    layer_dir = Path(staging_dir) / name
+    if not layer_dir.exists():
+        return []
+    return sorted(layer_dir.glob("*.parquet"))
+
+def staged_layer_info(staging_dir, name):
+    """
+    Reads the parts' metadata (not their data) and returns (row count,
+    columns in order of first appearance, geometry column name, CRS).
+    Charts don't all have the same columns, so the columns are the union
+    over all parts.
+    """
+    row_count = 0
+    columns = {}
+    geometry_column, crs = "geometry", None
+    for part in staged_parts(staging_dir, name):
+        parquet_file = pq.ParquetFile(part)
+        row_count += parquet_file.metadata.num_rows
+        schema = parquet_file.schema_arrow
+        columns.update(dict.fromkeys(schema.names))
+        if crs is None and schema.metadata and b"geo" in schema.metadata:
+            geo = json.loads(schema.metadata[b"geo"])
+            geometry_column = geo.get("primary_column", geometry_column)
+            # GeoParquet without a crs entry means OGC:CRS84 (lon/lat)
+            crs = geo["columns"][geometry_column].get("crs", "OGC:CRS84")
+    return row_count, list(columns), geometry_column, crs
+
+def iter_staged_layer(staging_dir, name, chunk_size=50000, columns=None):
+    """
+    Reads a staged layer back as GeoDataFrames of at most chunk_size rows,
+    in staging order. Every chunk has the same columns (all staged columns,
+    or the requested columns), missing values filled with None, so only one
+    chunk is held in memory at a time.
+    """
+    _, all_columns, geometry_column, crs = staged_layer_info(staging_dir, name)
+    columns = [col for col in (columns or all_columns) if col != geometry_column] + [geometry_column]
+
+    pending, pending_rows = [], 0
+    for part in staged_parts(staging_dir, name):
+        parquet_file = pq.ParquetFile(part)
+        part_columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+        for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=part_columns):
+            frame = batch.to_pandas()
+            pending.append(frame.reindex(columns=columns).astype({col: object for col in columns if col not in frame.columns}))
+            pending_rows += len(frame)
+            while pending_rows >= chunk_size:
+                combined = concat_frames(pending)
+                yield _to_geodataframe(combined.iloc[:chunk_size], geometry_column, crs)
+                rest = combined.iloc[chunk_size:]
+                pending, pending_rows = ([rest] if len(rest) else []), len(rest)
+    if pending_rows:
+        yield _to_geodataframe(concat_frames(pending), geometry_column, crs)
+
+def _to_geodataframe(frame, geometry_column, crs):
+    """
+    Decodes the WKB geometry column of a chunk read from GeoParquet.
+    """
+    frame = frame.reset_index(drop=True)
+    geometries = shapely.from_wkb(frame[geometry_column].to_numpy())
+    return gpd.GeoDataFrame(frame.drop(columns=geometry_column), geometry=gpd.GeoSeries(geometries, crs=crs), crs=crs)
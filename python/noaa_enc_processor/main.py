@@ -3,59 +3,292 @@
 #############################################
 
 import os
+import sys
+import uuid
+import argparse
+import subprocess
 from arcgis.gis import GIS
-from enc_processor import config, downloader, processor, field_updater
+from enc_processor import config, downloader, processor, field_updater, chart_selector, instrumentation, light_list, scheduler, shard_store
+from enc_processor.agol_metadata import AgolMetadataCache
+from enc_processor.instrumentation import span
 from boulder_relocation_processor import boulder_config, boulder_relocation_updater
 
-def run_workflow():
+# The workflow stages and what each one needs (see enc_processor/scheduler.py).
+# Extraction in process_and_update doesn't wait for the download stage: each
+# chart is extracted as soon as it is on disk (download is listed first, so it
+# always gets a worker before process_and_update starts waiting on it). Field
+# definitions are applied once the ENC layers have been updated.
+WORKFLOW_STAGES = {
+    "connect": {},
+    "select_charts": {},
+    "download": {"requires": ["select_charts"]},
+    "process_and_update": {"requires": ["connect", "select_charts"]},
+    "update_field_definitions": {"requires": ["connect"], "after": ["process_and_update"]},
+    "update_boulder_layer": {"requires": ["connect"]},
+    "update_light_list_structures": {}
+}
+
+# The stages of one shard of a sharded run (--shard i/N): download the shard's
+# share of the selected charts and write their extracted, mapped features to
+# partial files (see enc_processor/shard_store.py). No AGOL connection is needed.
+SHARD_STAGES = {
+    "select_charts": {},
+    "download": {"requires": ["select_charts"]},
+    "extract_shard": {"requires": ["select_charts"]}
+}
+
+# The stages of the reduce run (--reduce): the shards' partial files are merged
+# and uploaded in place of extraction, and the other AGOL updates run as usual
+REDUCE_STAGES = {
+    "connect": {},
+    "reduce_and_update": {"requires": ["connect"]},
+    "update_field_definitions": {"requires": ["connect"], "after": ["reduce_and_update"]},
+    "update_boulder_layer": {"requires": ["connect"]},
+    "update_light_list_structures": {}
+}
+
+def run_workflow(stages=None, shard=None, reduce=False, run_id=None):
     """
     Executes the full workflow: download ENCs, process files, update AGOL features services,
-    and update feature service field defintions.
-
+    and update feature service field defintions. Independent stages run at the same time
+    (scheduler.py) and stages limits the run to those stage names. shard (i, N) and reduce run
+    one side of a sharded run. Returns {stage name: "ok" | "failed" | "skipped"}.
     """
+    snapshot_dir = config.snapshot_dir if config.snapshots_enabled else None
+    workflow = SHARD_STAGES if shard else REDUCE_STAGES if reduce else WORKFLOW_STAGES
+    run_stages = scheduler.resolve_stages(workflow, stages)
+    # Charts are handed from the download stage to extraction as they arrive
+    chart_feed = downloader.ChartFeed() if "download" in run_stages else None
+
+    # The selected charts this run downloads and extracts (a shard's share of them)
+    def charts_to_process(results):
+        if shard:
+            return shard_store.shard_charts(results["select_charts"], *shard)
+        return results["select_charts"]
+
     # 1. Define .env variables to log into AGOL
-    # Get credentials securely using os.getenv()
-    portal_url = os.getenv("ARCGIS_URL")
-    username = os.getenv("ARCGIS_USERNAME")
-    password = os.getenv("ARCGIS_PASSWORD")
+    def connect(results):
+        # Get credentials securely using os.getenv()
+        portal_url = os.getenv("ARCGIS_URL")
+        username = os.getenv("ARCGIS_USERNAME")
+        password = os.getenv("ARCGIS_PASSWORD")
 
-    # 2. Connect to ArcGIS Online
-    try:
-        print("---  Connecting to ArcGIS Online...  ---")
-        gis = GIS(url=portal_url, username=username, password=password)
-        print("---  Successfully connected  ---")
-    except Exception as e:
-        print(f"Could not connect to ArcGIS Online. Error: {e}")
-        return
-
-    # 3. Download the chart data using the downloader
-    downloader.download_charts_to_disk(
-        config.charts_to_download, 
-        config.target_folder_path
-    )
+        # 2. Connect to ArcGIS Online
+        try:
+            print("---  Connecting to ArcGIS Online...  ---")
+            gis = GIS(url=portal_url, username=username, password=password)
+            print("---  Successfully connected  ---")
+        except Exception as e:
+            print(f"Could not connect to ArcGIS Online. Error: {e}")
+            raise
+        # Item, layer and schema lookups shared by every AGOL stage
+        return gis, AgolMetadataCache(gis, path=config.agol_metadata_cache_path, ttl_hours=config.agol_metadata_ttl_hours)
+
+    # 3. Choose the charts covering the lease areas of interest from the ENC catalog
+    def select_charts(results):
+        if config.chart_selection == "catalog":
+            return chart_selector.charts_for_lease_areas(
+                catalog_path=config.enc_catalog_path,
+                lease_areas_path=config.lease_areas_path,
+                fallback_charts=config.charts_to_download,
+                usage_bands=config.chart_usage_bands,
+                catalog_url=config.enc_catalog_url,
+                fallback_catalog_path=config.enc_catalog_excerpt_path
+            )
+        return config.charts_to_download
+
+    # Download the chart data using the downloader, skipping unchanged charts
+    def download(results):
+        try:
+            return downloader.sync_charts_to_disk(
+                charts_to_process(results),
+                config.target_folder_path,
+                max_workers=config.download_workers,
+                on_chart_ready=chart_feed.put
+            )
+        finally:
+            chart_feed.close()
 
     # 4. Process the downloaded files and update AGOL
-    processor.process_and_update_features(
-        gis=gis,
-        data_dir=config.target_folder_path,
-        feature_config=config.extraction_features
-    )
+    def process_and_update(results):
+        charts_to_download = results["select_charts"]
+        gis, metadata_cache = results["connect"]
+        processor.process_and_update_features(
+            gis=gis,
+            data_dir=config.target_folder_path,
+            chart_files=charts_to_download,
+            feature_config=config.extraction_features,
+            options=config.processing_options,
+            chart_feed=chart_feed.charts(charts_to_download, config.target_folder_path) if chart_feed else None,
+            metadata_cache=metadata_cache
+        )
+
+    # 4a. Sharded runs: extract and map this shard's charts to partial files...
+    def extract_shard(results):
+        chart_files = charts_to_process(results)
+        return processor.extract_shard(
+            data_dir=config.target_folder_path,
+            feature_config=config.extraction_features,
+            shard_dir=config.shard_dir,
+            shard=shard,
+            run_id=run_id,
+            chart_files=chart_files,
+            selected_charts=results["select_charts"],
+            options=config.processing_options,
+            chart_feed=chart_feed.charts(chart_files, config.target_folder_path) if chart_feed else None
+        )
+
+    # 4b. ...and merge every shard's partial files and update AGOL
+    def reduce_and_update(results):
+        gis, metadata_cache = results["connect"]
+        processor.reduce_and_update_features(
+            gis=gis,
+            shard_dir=config.shard_dir,
+            run_id=run_id,
+            feature_config=config.extraction_features,
+            options=config.processing_options,
+            metadata_cache=metadata_cache
+        )
 
     # 5. Update the AGOL field names (aliases) and descriptions for increased user interoperability
-    field_updater.update_field_definitions(
-        gis=gis,
-        mapper = config.item_id_csv_map
-    )
+    def update_field_definitions(results):
+        gis, metadata_cache = results["connect"]
+        return field_updater.update_field_definitions(
+            gis=gis,
+            mapper = config.item_id_csv_map,
+            state_path=config.field_definition_state_path,
+            max_workers=config.field_updater_workers,
+            force=config.field_updater_force,
+            metadata_cache=metadata_cache
+        )
 
     # 6. Update the AGOL boulder relocation feature service
-    boulder_relocation_updater.update_boulder_layer(
-        gis=gis,
-        item_id = boulder_config.boulder_agol_id,
-        project_map=boulder_config.boulder_projects,
-        csv_path=boulder_config.csv_file_path
-    )
+    def update_boulder_layer(results):
+        gis, metadata_cache = results["connect"]
+        status = boulder_relocation_updater.update_boulder_layer(
+            gis=gis,
+            item_id = boulder_config.boulder_agol_id,
+            project_map=boulder_config.boulder_projects,
+            csv_path=boulder_config.csv_file_path,
+            snapshot_dir=snapshot_dir,
+            cache_dir=boulder_config.boulder_cache_dir,
+            max_workers=boulder_config.boulder_download_workers,
+            force=boulder_config.boulder_force_upload,
+            upload_mode=boulder_config.boulder_upload_mode,
+            upload_options=config.upload_options,
+            metadata_cache=metadata_cache
+        )
+        if status == "failed":
+            raise RuntimeError("Some boulders failed to upload.")
+        return status
+
+    # 7. Update the wind structures from the USCG light lists (replaces R/scrape_uscg_msi.R)
+    def update_light_list_structures(results):
+        return light_list.update_light_list_structures(
+            light_list_dir=config.light_list_dir,
+            output_path=config.light_list_output_path,
+            districts=config.light_list_districts,
+            max_workers=config.light_list_workers
+        )
+
+    functions = {
+        "connect": connect,
+        "select_charts": select_charts,
+        "download": download,
+        "process_and_update": process_and_update,
+        "extract_shard": extract_shard,
+        "reduce_and_update": reduce_and_update,
+        "update_field_definitions": update_field_definitions,
+        "update_boulder_layer": update_boulder_layer,
+        "update_light_list_structures": update_light_list_structures
+    }
+    stage_graph = {name: dict(spec, function=functions[name]) for name, spec in workflow.items()}
+    return scheduler.run_stages(stage_graph, stages, max_workers=config.workflow_workers)
+
+def run_local_shards(count, stages=None):
+    """
+    Runs a sharded run on this machine: shards 1 to count as separate
+    processes (each with its own run report), then the reduce step here
+    once every shard has succeeded. The run gets a new run ID and shard_dir
+    is cleared first, so only this run's shards can be reduced.
+    Returns the reduce run's stage statuses, or each shard's status if a
+    shard failed.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    shard_store.clear_shards(config.shard_dir)
+
+    # Refresh the ENC catalog once, so every shard selects from the same copy
+    env = dict(os.environ)
+    if config.chart_selection == "catalog" and config.enc_catalog_url:
+        chart_selector.refresh_enc_catalog(config.enc_catalog_path, config.enc_catalog_url)
+        env["ENC_CATALOG_URL"] = ""
+    # Share the extraction worker processes between the shards
+    env.setdefault("ENC_EXTRACTION_WORKERS", str(max(1, config.extraction_workers // count)))
+
+    print(f"--- Starting {count} shard processes (run {run_id}) ---")
+    processes = []
+    for index in range(1, count + 1):
+        report_path = config.run_report_path.with_name(f"{config.run_report_path.stem}_shard-{index}-of-{count}.json")
+        # Every shard runs all of SHARD_STAGES; the selected stages (and WORKFLOW_STAGES) are for the reduce step
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), "--shard", f"{index}/{count}", "--run-id", run_id, "--stages", ""],
+                                          env=dict(env, ENC_RUN_REPORT_PATH=str(report_path))))
+    shard_statuses = {}
+    for index, process in enumerate(processes, start=1):
+        if process.wait() != 0:
+            print(f"--- Shard {index}/{count} exited with status {process.returncode} ---")
+        shard_statuses[f"shard {index}/{count}"] = "ok" if process.returncode == 0 else "failed"
+
+    # A failed shard's partial files are missing or incomplete, so nothing is reduced
+    if "failed" in shard_statuses.values():
+        print("--- Not every shard succeeded. Skipping the reduce step. ---")
+        return shard_statuses
+    return run_workflow(stages, reduce=True, run_id=run_id)
 
 # Run the workflow
 if __name__ == "__main__":
-    run_workflow()
-    print("Workflow complete.")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Update the offshore wind infrastructure layers.")
+    parser.add_argument("--stages", default=config.workflow_stages,
+                        help=f"Comma separated stages to run (default all): {', '.join(WORKFLOW_STAGES)}. "
+                             f"Sharded runs have the stages {', '.join(SHARD_STAGES)} (--shard) and {', '.join(REDUCE_STAGES)} (--reduce)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--shard", help="Run shard i/N of a sharded run (e.g. 2/4): extract and map its charts to partial files")
+    mode.add_argument("--reduce", action="store_true", help="Merge the partial files of every shard and update AGOL")
+    mode.add_argument("--local-shards", type=int, metavar="N", help="Run N shards as local processes, then the reduce step")
+    parser.add_argument("--run-id", default=config.shard_run_id,
+                        help="Names the sharded run (default ENC_SHARD_RUN_ID). Give every --shard and the --reduce of one run the same ID")
+    args = parser.parse_args()
+    selected_stages = [name.strip() for name in args.stages.split(",") if name.strip()] if args.stages else None
+    try:
+        shard = shard_store.parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        parser.error(str(e))
+    if args.local_shards is not None and args.local_shards < 1:
+        parser.error("--local-shards needs at least 1 shard.")
+    if (shard or args.reduce) and not args.run_id:
+        parser.error("--shard and --reduce need the run ID of the sharded run (--run-id or ENC_SHARD_RUN_ID).")
+    # Check the stage names before anything runs (--local-shards passes them to its reduce step)
+    try:
+        scheduler.resolve_stages(SHARD_STAGES if shard else REDUCE_STAGES if args.reduce or args.local_shards else WORKFLOW_STAGES, selected_stages)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Always write the run report, even if the workflow fails part way through
+    profile_results = {}
+    statuses = {}
+    try:
+        with instrumentation.profile_run(config.profile_modes, config.run_report_path.parent) as profile_results:
+            with span("workflow"):
+                if args.local_shards:
+                    statuses = run_local_shards(args.local_shards, selected_stages)
+                else:
+                    statuses = run_workflow(selected_stages, shard=shard, reduce=args.reduce, run_id=args.run_id)
+    finally:
+        instrumentation.write_run_report(config.run_report_path, extra={"profile": profile_results} if profile_results else None)
+
+    # Exit with an error if any stage didn't complete, so schedulers (and
+    # --local-shards, for its shard processes) can tell the run failed
+    incomplete = [name for name, status in statuses.items() if status != "ok"]
+    if incomplete:
+        print(f"Workflow finished with incomplete stages: {', '.join(incomplete)}.")
+        sys.exit(1)
+    print("Workflow complete.")
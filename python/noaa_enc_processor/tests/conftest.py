@@ -0,0 +1,14 @@
+#############################################
+##   SHARED SETUP FOR THE PYTEST SUITE     ##
+#############################################
+
+# Makes enc_processor, boulder_relocation_processor and the fake AGOL objects
+# in benchmarks/fake_agol.py importable. Run from the repository root:
+#   python -m pytest python/noaa_enc_processor/tests
+
+import sys
+from pathlib import Path
+
+PACKAGE_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PACKAGE_DIR))
+sys.path.insert(0, str(PACKAGE_DIR / "benchmarks"))
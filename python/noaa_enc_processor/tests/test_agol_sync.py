@@ -0,0 +1,66 @@
+#############################################
+##   TESTS: DELTA SYNC BY A STABLE KEY     ##
+#############################################
+
+# Delta syncs features to the in-memory fake AGOL layer (fake_agol.py) and
+# counts the edit_features requests it receives.
+
+import copy
+
+from enc_processor.agol_sync import delta_sync_features
+from fake_agol import FakeFeatureLayer
+
+FIELDS = [{"name": "FIDN", "type": "esriFieldTypeInteger"}, {"name": "OBJNAM", "type": "esriFieldTypeString"}]
+
+class CountingLayer(FakeFeatureLayer):
+    """
+    Fake layer that records each edit_features request it receives.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.edit_requests = []
+
+    def edit_features(self, adds=None, updates=None, deletes=None, **kwargs):
+        self.edit_requests.append({"adds": adds, "updates": updates, "deletes": deletes})
+        return super().edit_features(adds=adds, updates=updates, deletes=deletes, **kwargs)
+
+def turbine(fidn, name, x):
+    return {"attributes": {"FIDN": fidn, "OBJNAM": name},
+            "geometry": {"x": x, "y": 5000000.0, "spatialReference": {"wkid": 3857}}}
+
+def layer_rows(layer):
+    return sorted((row["attributes"]["FIDN"], row["attributes"]["OBJNAM"], row["geometry"]["x"]) for row in layer.rows.values())
+
+def test_second_run_sends_no_edits():
+    layer = CountingLayer(fields=FIELDS, wkid=3857)
+    features = [turbine(fidn, f"WTG {fidn}", -7900000.0 + fidn) for fidn in range(1, 51)]
+
+    first = delta_sync_features(layer, copy.deepcopy(features), key_fields=["FIDN"])
+    assert first["adds"] == 50
+    requests_after_first = len(layer.edit_requests)
+
+    second = delta_sync_features(layer, copy.deepcopy(features), key_fields=["FIDN"])
+    assert (second["adds"], second["updates"], second["deletes"], second["unchanged"]) == (0, 0, 0, 50)
+    assert len(layer.edit_requests) == requests_after_first
+    assert len(layer.rows) == 50
+
+def test_only_changed_features_are_sent():
+    layer = CountingLayer(fields=FIELDS, wkid=3857)
+    features = [turbine(fidn, f"WTG {fidn}", -7900000.0 + fidn) for fidn in range(1, 11)]
+    delta_sync_features(layer, copy.deepcopy(features), key_fields=["FIDN"])
+    layer.edit_requests.clear()
+
+    # One renamed, one moved, one gone and one new turbine
+    features[0]["attributes"]["OBJNAM"] = "Renamed"
+    features[1]["geometry"]["x"] += 50.0
+    removed = features.pop(2)
+    features.append(turbine(99, "WTG 99", -7899000.0))
+    summary = delta_sync_features(layer, copy.deepcopy(features), key_fields=["FIDN"])
+
+    assert (summary["adds"], summary["updates"], summary["deletes"], summary["unchanged"]) == (1, 2, 1, 7)
+    sent_adds = [feature for request in layer.edit_requests for feature in request["adds"] or []]
+    sent_updates = [feature for request in layer.edit_requests for feature in request["updates"] or []]
+    assert [feature["attributes"]["FIDN"] for feature in sent_adds] == [99]
+    assert sorted(feature["attributes"]["FIDN"] for feature in sent_updates) == [1, 2]
+    assert layer_rows(layer) == sorted((f["attributes"]["FIDN"], f["attributes"]["OBJNAM"], f["geometry"]["x"]) for f in features)
+    assert removed["attributes"]["FIDN"] not in {row[0] for row in layer_rows(layer)}
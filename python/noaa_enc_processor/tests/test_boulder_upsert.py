@@ -0,0 +1,127 @@
+#############################################
+##   TESTS: KEYED BOULDER LAYER UPSERT     ##
+#############################################
+
+# Runs update_boulder_layer against a local http.server serving each
+# project's GeoJSON.zip and the in-memory fake AGOL layer (fake_agol.py),
+# counting the adds, updates and deletes it is sent.
+
+import io
+import os
+import json
+import time
+import zipfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from boulder_relocation_processor.boulder_relocation_updater import update_boulder_layer
+from fake_agol import FakeFeatureLayer, FakeItem, FakeGIS
+
+FIELDS = [
+    {"name": "Boulder_ID", "type": "esriFieldTypeString"},
+    {"name": "Information", "type": "esriFieldTypeString"},
+    {"name": "Project", "type": "esriFieldTypeString"}
+]
+
+PROJECTS = {"sfw/GeoJson.zip": "South Fork Wind", "rw/GeoJson.zip": "Revolution Wind"}
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+class CountingLayer(FakeFeatureLayer):
+    """
+    Fake layer that records each edit_features request it receives.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.edit_requests = []
+
+    def edit_features(self, adds=None, updates=None, deletes=None, **kwargs):
+        # Deletes are sent as a comma-separated string of OBJECTIDs
+        deleted = deletes.split(",") if isinstance(deletes, str) else deletes
+        self.edit_requests.append({"adds": adds or [], "updates": updates or [], "deletes": deleted or []})
+        return super().edit_features(adds=adds, updates=updates, deletes=deletes, **kwargs)
+
+    def sent(self):
+        """
+        Returns the number of adds, updates and deletes sent so far.
+        """
+        return tuple(sum(len(request[part]) for request in self.edit_requests) for part in ("adds", "updates", "deletes"))
+
+@pytest.fixture
+def projects(tmp_path):
+    """
+    A local server for tmp_path/server. Yields the {URL: project name} map
+    and the served folder.
+    """
+    served = tmp_path / "server"
+    for path in PROJECTS:
+        (served / path).parent.mkdir(parents=True, exist_ok=True)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(served)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}/"
+    yield {base_url + path: name for path, name in PROJECTS.items()}, served
+    server.shutdown()
+    server.server_close()
+
+def publish(served, boulders, age_seconds):
+    """
+    Zips {project path: {boulder ID: (lon, lat)}} into the served folder,
+    last modified age_seconds ago.
+    """
+    for path, project_boulders in boulders.items():
+        features = [{"type": "Feature",
+                     "properties": {"name": boulder_id, "description": f"Relocated boulder {boulder_id}"},
+                     "geometry": {"type": "Point", "coordinates": list(position)}}
+                    for boulder_id, position in project_boulders.items()]
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("boulders.geojson", json.dumps({"type": "FeatureCollection", "features": features}))
+        (served / path).write_bytes(buffer.getvalue())
+        modified = time.time() - age_seconds
+        os.utime(served / path, (modified, modified))
+
+def layer_boulders(layer):
+    return {(row["attributes"]["Boulder_ID"], row["attributes"]["Project"]): (row["geometry"]["x"], row["geometry"]["y"])
+            for row in layer.rows.values()}
+
+def expected_boulders(boulders):
+    return {(boulder_id, PROJECTS[path]): position for path, project_boulders in boulders.items()
+            for boulder_id, position in project_boulders.items()}
+
+def test_upsert_sends_only_changed_boulders(projects, tmp_path):
+    project_map, served = projects
+    layer = CountingLayer(fields=FIELDS, wkid=4326, name="Boulders")
+    gis = FakeGIS({"boulders": FakeItem("boulders", [layer], title="Boulder Relocations")})
+    boulders = {path: {f"B{index:03d}": (-71.0 + index / 1000, 41.0) for index in range(30)} for path in PROJECTS}
+
+    def run():
+        update_boulder_layer(gis, "boulders", project_map, cache_dir=tmp_path / "cache", force=True,
+                             upload_mode="upsert", upload_options={"backoff_seconds": 0})
+
+    publish(served, boulders, age_seconds=3600)
+    run()
+    assert layer.sent() == (60, 0, 0)
+    assert layer_boulders(layer) == expected_boulders(boulders)
+
+    # Nothing changed: the forced rerun checks the layer but sends nothing
+    run()
+    assert layer.sent() == (60, 0, 0)
+
+    # New survey: 3 new boulders in one project, 2 moved and 1 removed in the other
+    sfw, rw = PROJECTS
+    for index in range(30, 33):
+        boulders[sfw][f"B{index:03d}"] = (-71.0 + index / 1000, 41.0)
+    for boulder_id in ("B000", "B001"):
+        lon, lat = boulders[rw][boulder_id]
+        boulders[rw][boulder_id] = (lon, lat + 0.001)
+    del boulders[rw]["B029"]
+    publish(served, boulders, age_seconds=0)
+    run()
+    assert layer.sent() == (63, 2, 1)
+    assert layer_boulders(layer) == expected_boulders(boulders)
@@ -0,0 +1,63 @@
+#############################################
+##   TESTS: CATALOG CHART SELECTION        ##
+#############################################
+
+# Selects the cells for the committed lease areas from the committed catalog
+# excerpt (data/ENCProdCat_excerpt.xml) and compares them with the
+# hand-maintained config.charts_to_download list and the committed charts.
+
+import io
+import contextlib
+
+import geopandas as gpd
+import pytest
+
+from enc_processor import config, processor
+from enc_processor.chart_selector import charts_for_lease_areas
+from enc_processor.dtype_compactor import concat_frames
+
+# Cells in charts_to_download that the selection leaves out, and why
+EXPECTED_DROPPED = {
+    "US4NY1BM.zip": "no charted turbines or substations",
+    "US4NY1BX.zip": "no charted turbines or substations",
+    "US4VA1BG.zip": "no charted turbines or substations",
+    "US4VA1AG.zip": "only observation platforms, which the substation rules exclude",
+    "US5RI1BE.zip": "its Block Island turbines are also in US4NY1CY (Approach band, preferred over Harbor)"
+}
+
+def select():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return charts_for_lease_areas(config.enc_catalog_excerpt_path, config.base_dir / "data" / "lease_areas_of_interest.geojson",
+                                      config.charts_to_download, usage_bands=config.chart_usage_bands)
+
+def processed_layers(chart_files):
+    """
+    Extracts and processes the committed charts in chart_files.
+    Returns {feature name: GeoDataFrame indexed by FIDN}.
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        feature_results = processor.extract_features(str(config.target_folder_path), config.extraction_features, chart_files=chart_files)
+        layers = {}
+        for name, gdf_list in feature_results.items():
+            gdf = gpd.GeoDataFrame(concat_frames(gdf_list), crs=gdf_list[0].crs)
+            layers[name] = processor.prepare_features(gdf, name, config.extraction_features[name]).set_index("FIDN").sort_index()
+    return layers
+
+def test_selection_covers_the_configured_charts():
+    selected = select()
+    assert set(selected) <= set(config.charts_to_download)
+    assert set(config.charts_to_download) - set(selected) == set(EXPECTED_DROPPED)
+
+@pytest.mark.skipif(not config.target_folder_path.exists(), reason="The committed charts are not in data-raw/ENC.")
+def test_selected_charts_hold_every_structure():
+    every_chart = processed_layers(config.charts_to_download)
+    selected = processed_layers(select())
+
+    assert set(every_chart) == set(selected)
+    for name, full_gdf in every_chart.items():
+        selected_gdf = selected[name]
+        assert list(full_gdf.index) == list(selected_gdf.index), name
+        assert full_gdf.geometry.geom_equals_exact(selected_gdf.geometry, 1e-6).all(), name
+        # Only features of dropped cells now come from another cell
+        moved = full_gdf["source_file"].astype(str) != selected_gdf["source_file"].astype(str)
+        assert set(full_gdf.loc[moved, "source_file"]) <= set(EXPECTED_DROPPED), name
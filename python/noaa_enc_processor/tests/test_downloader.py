@@ -0,0 +1,105 @@
+#############################################
+##   TESTS: CONDITIONAL CHART DOWNLOADS    ##
+#############################################
+
+# Runs sync_charts_to_disk against a local http.server standing in for NOAA.
+# SimpleHTTPRequestHandler sends Last-Modified and answers If-Modified-Since
+# with 304, like the NOAA server.
+
+import os
+import time
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from enc_processor.downloader import sync_charts_to_disk
+
+class ChartHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the charts folder. Requests for a file in broken get a response
+    that stops part way through the body, like a dropped connection.
+    """
+    broken = set()
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-Modified-Since")))
+        if self.path.lstrip("/") in self.broken:
+            self.send_response(200)
+            self.send_header("Content-Length", "1000")
+            self.end_headers()
+            self.wfile.write(b"partial")
+            self.close_connection = True
+            return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def noaa(tmp_path):
+    """
+    A local server for tmp_path/server. Yields (base URL, served folder).
+    """
+    served = tmp_path / "server"
+    served.mkdir()
+    ChartHandler.broken = set()
+    ChartHandler.requests_seen = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(ChartHandler, directory=str(served)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/", served
+    server.shutdown()
+    server.server_close()
+
+def publish(served, filename, content, age_seconds):
+    """
+    Writes a chart to the served folder, last modified age_seconds ago.
+    """
+    path = served / filename
+    path.write_bytes(content)
+    modified = time.time() - age_seconds
+    os.utime(path, (modified, modified))
+
+def test_unchanged_chart_is_skipped_with_304(noaa, tmp_path):
+    base_url, served = noaa
+    publish(served, "US4MA1CC.zip", b"first edition", age_seconds=3600)
+    charts = tmp_path / "charts"
+
+    assert sync_charts_to_disk(["US4MA1CC.zip"], charts, base_url=base_url) == {"US4MA1CC.zip": "downloaded"}
+    assert sync_charts_to_disk(["US4MA1CC.zip"], charts, base_url=base_url) == {"US4MA1CC.zip": "unchanged"}
+    # The second request was conditional and the chart was left as it was
+    assert ChartHandler.requests_seen[0][1] is None
+    assert ChartHandler.requests_seen[1][1] is not None
+    assert (charts / "US4MA1CC.zip").read_bytes() == b"first edition"
+
+def test_changed_chart_is_downloaded_again(noaa, tmp_path):
+    base_url, served = noaa
+    publish(served, "US4MA1CC.zip", b"first edition", age_seconds=3600)
+    charts = tmp_path / "charts"
+    sync_charts_to_disk(["US4MA1CC.zip"], charts, base_url=base_url)
+
+    publish(served, "US4MA1CC.zip", b"second edition", age_seconds=0)
+    assert sync_charts_to_disk(["US4MA1CC.zip"], charts, base_url=base_url) == {"US4MA1CC.zip": "downloaded"}
+    assert (charts / "US4MA1CC.zip").read_bytes() == b"second edition"
+
+def test_failed_download_keeps_the_old_chart(noaa, tmp_path):
+    base_url, served = noaa
+    publish(served, "US4MA1CC.zip", b"first edition", age_seconds=3600)
+    publish(served, "US4RI1CB.zip", b"other chart", age_seconds=3600)
+    charts = tmp_path / "charts"
+    sync_charts_to_disk(["US4MA1CC.zip", "US4RI1CB.zip"], charts, base_url=base_url)
+
+    # A new edition whose download breaks off, and a chart the server no longer has
+    publish(served, "US4MA1CC.zip", b"second edition", age_seconds=0)
+    ChartHandler.broken = {"US4MA1CC.zip"}
+    os.remove(served / "US4RI1CB.zip")
+    statuses = sync_charts_to_disk(["US4MA1CC.zip", "US4RI1CB.zip"], charts, base_url=base_url)
+
+    assert statuses == {"US4MA1CC.zip": "failed", "US4RI1CB.zip": "failed"}
+    assert (charts / "US4MA1CC.zip").read_bytes() == b"first edition"
+    assert (charts / "US4RI1CB.zip").read_bytes() == b"other chart"
+    # No temp files are left next to the charts
+    assert sorted(path.name for path in charts.iterdir() if not path.name.endswith(".json")) == ["US4MA1CC.zip", "US4RI1CB.zip"]
@@ -0,0 +1,109 @@
+#############################################
+##   TESTS: CHUNKED, RETRYING EDIT UPLOADS ##
+#############################################
+
+# Sends adds through submit_edits to fake AGOL layers (fake_agol.py) that
+# reject large requests or fail requests before or after applying them.
+
+from enc_processor.edit_uploader import submit_edits
+from fake_agol import FakeFeatureLayer
+
+FIELDS = [{"name": "FIDN", "type": "esriFieldTypeInteger"}, {"name": "OBJNAM", "type": "esriFieldTypeString"}]
+UPLOAD_OPTIONS = {"backoff_seconds": 0, "key_fields": ["FIDN"]}
+
+class FlakyLayer(FakeFeatureLayer):
+    """
+    Fake layer whose edit_features requests fail with a gateway timeout:
+    fail(adds) is called with each request's adds and returns "before"
+    (nothing applied), "after" (applied, then the response is lost) or None.
+    """
+    def __init__(self, fail, **kwargs):
+        super().__init__(fields=FIELDS, **kwargs)
+        self.fail = fail
+        self.edit_calls = 0
+
+    def edit_features(self, adds=None, updates=None, deletes=None, **kwargs):
+        self.edit_calls += 1
+        failure = self.fail(adds or [])
+        if failure == "before":
+            raise Exception("Fake transient error: 504 Gateway Timeout")
+        result = super().edit_features(adds=adds, updates=updates, deletes=deletes, **kwargs)
+        if failure == "after":
+            raise Exception("Fake transient error: 504 Gateway Timeout")
+        return result
+
+def feature(fidn, name):
+    return {"attributes": {"FIDN": fidn, "OBJNAM": name}, "geometry": {"x": float(fidn), "y": 0.0}}
+
+def layer_contents(layer):
+    return sorted((row["attributes"]["FIDN"], row["attributes"]["OBJNAM"]) for row in layer.rows.values())
+
+def fail_requests(plan):
+    """
+    fail callback failing the nth request (counting from 1) as plan[n] says.
+    """
+    calls = []
+    def fail(adds):
+        calls.append(adds)
+        return plan.get(len(calls))
+    return fail
+
+def test_oversized_batch_is_split():
+    layer = FakeFeatureLayer(fields=FIELDS, max_request_features=100)
+    adds = [feature(fidn, f"WTG {fidn}") for fidn in range(450)]
+
+    summary = submit_edits(layer, adds=adds, chunk_size=1000, **UPLOAD_OPTIONS)
+
+    assert summary["adds"] == {"submitted": 450, "succeeded": 450, "failed": 0}
+    assert summary["failures"] == []
+    assert layer_contents(layer) == sorted((fidn, f"WTG {fidn}") for fidn in range(450))
+
+def test_retries_neither_duplicate_nor_drop_adds():
+    # A response lost after AGOL applied the edits, and a request that failed
+    # outright whose retry then lost its response
+    layer = FlakyLayer(fail_requests({1: "after", 3: "before", 4: "after"}))
+    FakeFeatureLayer.edit_features(layer, adds=[feature(7, "existing copy")])
+    adds = [feature(fidn, f"WTG {fidn}") for fidn in range(30)]
+    # FIDNs aren't unique: a second copy of one already in the layer, and two copies in one chunk
+    adds += [feature(7, "second copy"), feature(12, "second copy")]
+
+    summary = submit_edits(layer, adds=adds, chunk_size=8, max_workers=1, **UPLOAD_OPTIONS)
+
+    assert summary["adds"] == {"submitted": 32, "succeeded": 32, "failed": 0}
+    assert summary["retries"] >= 3
+    assert layer_contents(layer) == sorted([(7, "existing copy")] + [(f["attributes"]["FIDN"], f["attributes"]["OBJNAM"]) for f in adds])
+
+def test_second_copy_of_a_key_is_resent_after_a_failed_request():
+    # The key is already in the layer, but this request added nothing
+    layer = FlakyLayer(fail_requests({1: "before"}))
+    FakeFeatureLayer.edit_features(layer, adds=[feature(309892264, "first copy")])
+
+    summary = submit_edits(layer, adds=[feature(309892264, "second copy")], **UPLOAD_OPTIONS)
+
+    assert summary["adds"]["succeeded"] == 1
+    assert layer_contents(layer) == [(309892264, "first copy"), (309892264, "second copy")]
+
+def test_concurrent_chunks_sharing_a_key_are_not_retried():
+    # A copy of FIDN 3 in the first and last chunk, the last one's request fails
+    adds = [feature(fidn, f"WTG {fidn}") for fidn in range(10)] + [feature(3, "second copy")]
+    layer = FlakyLayer(lambda request_adds: "after" if any(f["attributes"]["OBJNAM"] == "second copy" for f in request_adds) else None)
+
+    summary = submit_edits(layer, adds=adds, chunk_size=5, max_workers=4, **UPLOAD_OPTIONS)
+
+    # Reported as failed (the next run's delta sync sees it was added), never sent twice
+    assert summary["adds"]["failed"] == 1
+    assert summary["failures"][0]["feature"] == {"FIDN": 3}
+    assert layer_contents(layer).count((3, "second copy")) == 1
+
+def test_permanent_error_is_not_retried():
+    layer = FakeFeatureLayer(fields=FIELDS)
+    def reject(**kwargs):
+        layer.request_count += 1
+        raise Exception("Invalid token.")
+    layer.edit_features = reject
+
+    summary = submit_edits(layer, adds=[feature(fidn, "WTG") for fidn in range(10)], chunk_size=5, **UPLOAD_OPTIONS)
+
+    assert summary["requests"] == 2
+    assert summary["retries"] == 0
+    assert summary["adds"]["failed"] == 10
@@ -0,0 +1,69 @@
+#############################################
+##   TESTS: DIFF-AWARE FIELD DEFINITIONS   ##
+#############################################
+
+# Runs update_field_definitions against a fake AGOL item (fake_agol.py)
+# whose layer manager counts the update_definition (admin) calls.
+
+import pandas as pd
+
+from enc_processor.field_updater import update_field_definitions
+from fake_agol import FakeFeatureLayer, FakeItem, FakeGIS
+
+class CountingLayerManager:
+    """
+    Wraps a fake layer manager to record the fields of each update_definition call.
+    """
+    def __init__(self, manager):
+        self.manager = manager
+        self.admin_calls = []
+
+    def update_definition(self, update_dict):
+        self.admin_calls.append([field["name"] for field in update_dict.get("fields", [])])
+        return self.manager.update_definition(update_dict)
+
+    def __getattr__(self, name):
+        return getattr(self.manager, name)
+
+def make_item(tmp_path):
+    """
+    Returns (fake GIS, mapper, layer manager) for one item whose layer has
+    default aliases and no descriptions, and a CSV with the wanted ones.
+    """
+    csv_path = tmp_path / "turbine_fields.csv"
+    pd.DataFrame({
+        "name": ["FIDN", "OBJNAM", "HEIGHT"],
+        "alias": ["Feature ID", "Object name", "Height"],
+        "description": ["Feature identification number", "Name of the structure", "Height above MHW (m)"]
+    }).to_csv(csv_path, index=False)
+    fields = [{"name": name, "type": "esriFieldTypeString", "alias": name} for name in ("FIDN", "OBJNAM", "HEIGHT")]
+    layer = FakeFeatureLayer(fields=fields)
+    layer.manager = CountingLayerManager(layer.manager)
+    return FakeGIS({"turbines": FakeItem("turbines", [layer])}), {"turbines": csv_path}, layer.manager
+
+def test_unchanged_definitions_make_no_admin_calls(tmp_path):
+    gis, mapper, manager = make_item(tmp_path)
+    state_path = tmp_path / "field_definitions.json"
+
+    update_field_definitions(gis, mapper, state_path=state_path)
+    assert manager.admin_calls == [["FIDN", "OBJNAM", "HEIGHT"]]
+
+    # Same CSV as last run: the layer isn't even fetched
+    gets = gis.content.get_count
+    update_field_definitions(gis, mapper, state_path=state_path)
+    assert gis.content.get_count == gets
+    # Forced: the layer is checked, but already matches
+    update_field_definitions(gis, mapper, state_path=state_path, force=True)
+    assert len(manager.admin_calls) == 1
+
+def test_only_changed_fields_are_sent(tmp_path):
+    gis, mapper, manager = make_item(tmp_path)
+    state_path = tmp_path / "field_definitions.json"
+    update_field_definitions(gis, mapper, state_path=state_path)
+
+    edited = pd.read_csv(mapper["turbines"])
+    edited.loc[edited["name"] == "HEIGHT", "description"] = "Height above MHW (metres)"
+    edited.to_csv(mapper["turbines"], index=False)
+    update_field_definitions(gis, mapper, state_path=state_path)
+
+    assert manager.admin_calls[1:] == [["HEIGHT"]]
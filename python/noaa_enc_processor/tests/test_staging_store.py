@@ -0,0 +1,50 @@
+#############################################
+##   TESTS: STREAMED STAGING STORE CHUNKS  ##
+#############################################
+
+# Stages a layer in parts and reads it back in chunks, checking each chunk
+# keeps the dtypes the whole layer has in memory (concat_frames of the parts).
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import Point
+
+from enc_processor.staging_store import staging_available, stage_layer, iter_staged_layer
+from enc_processor.dtype_compactor import concat_frames
+
+pytestmark = pytest.mark.skipif(not staging_available(), reason="The staging store needs pyarrow.")
+
+PART_ROWS = 40
+
+def chart_part(part_number):
+    """
+    One chart's turbines: int32 record fields, text and a sometimes null float.
+    """
+    start = part_number * PART_ROWS
+    return gpd.GeoDataFrame({
+        "FIDN": np.arange(start, start + PART_ROWS, dtype="int32"),
+        "RCID": np.arange(start, start + PART_ROWS, dtype="int32") * 2,
+        "OBJNAM": [f"WTG {index}" for index in range(start, start + PART_ROWS)],
+        "HEIGHT": [None if index % 7 == 0 else float(index) for index in range(start, start + PART_ROWS)]
+    }, geometry=[Point(-71.0 + index / 1000, 41.0) for index in range(start, start + PART_ROWS)], crs="EPSG:4326")
+
+@pytest.mark.parametrize("chunk_size", [PART_ROWS // 2, PART_ROWS, 30, 1000])
+def test_streamed_chunks_keep_in_memory_dtypes(tmp_path, chunk_size):
+    parts = [chart_part(part_number) for part_number in range(3)]
+    for part_number, part in enumerate(parts):
+        stage_layer(tmp_path, "turbines", f"{part_number:05d}", part)
+    in_memory = concat_frames(parts)
+
+    chunks = list(iter_staged_layer(tmp_path, "turbines", chunk_size=chunk_size))
+    for chunk in chunks:
+        for col in ("FIDN", "RCID", "OBJNAM"):
+            assert chunk[col].dtype == in_memory[col].dtype, (chunk_size, col)
+        # A chunk without nulls may hold whole numbers the layer holds as float
+        if chunk["HEIGHT"].isna().any():
+            assert chunk["HEIGHT"].dtype == in_memory["HEIGHT"].dtype
+
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert streamed["FIDN"].tolist() == in_memory["FIDN"].tolist()
+    assert streamed.geometry.equals(in_memory.geometry)